@@ -1,149 +1,115 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, Response
 import asyncio
-from hyperliquid import get_funding_rates as get_hl_rates
-from funding_rate_monitor import FundingRateMonitor
+from hyperliquid import HyperliquidAPI, HyperliquidStream
+from funding_rate_monitor import FundingRateMonitor, FundingRateInfo
 from datetime import datetime, timedelta
-import pytz
 from binance_trader import BinanceTrader
 from hyperliquid_trader import HyperliquidTrader
+from funding_snapshot import FundingSnapshotEngine
+from arbitrage_scanner import RateUniverse
+from funding_payload import build_all_contracts, count_contracts, format_binance_next_funding
+from symbol_registry import SymbolRegistry
+from arbitrage_executor import DualLegExecutor
+from funding_store import FundingStore, VENUES
+from logging_setup import get_logger
+import metrics
 import json
+import os
+import atexit
+import threading
+import time
 from math import isnan
 import aiohttp
 
+logger = get_logger(__name__)
+
 app = Flask(__name__)
-binance_monitor = FundingRateMonitor()
+metrics.instrument_flask(app)
 binance_trader = BinanceTrader()
-hyperliquid_trader = HyperliquidTrader()
-
-def calculate_binance_next_funding_time(timestamp_ms: int, symbol: str = None) -> str:
-    """将币安的时间戳转换为北京时间，如果时间已过期则重新获取
-    Args:
-        timestamp_ms: 毫秒级时间戳，代表下次结算时间
-        symbol: 交易对名称，用于重新获取结算时间
-    Returns:
-        str: 格式化的北京时间
-    """
+# 交易对元数据缓存由行情监控和交易共享；测试网的交易对与主网不同，需各自缓存
+binance_monitor = FundingRateMonitor(instruments=None if binance_trader.testnet else binance_trader.instruments)
+binance_monitor.instruments.start_background_refresh()
+binance_trader.instruments.start_background_refresh()
+# 交易对元数据每次刷新后重建跨交易所的统一交易对注册表
+symbol_registry = SymbolRegistry()
+binance_monitor.instruments.add_listener(symbol_registry.update_binance)
+# 通过WebSocket推送实时更新币安资金费率，断线时自动回退到REST
+binance_monitor.start_stream()
+# 通过用户数据流维护币安余额、持仓、杠杆和挂单，未同步时查询回退到REST；
+# 未实现盈亏按标记价格推送实时计算（测试网价格与主网不同，改为定期通过REST刷新标记价格）
+def binance_mark_price(symbol):
+    info = binance_monitor.funding_rates.get(symbol)
+    return info.mark_price if info else 0.0
+
+binance_trader.start_user_stream(mark_price=None if binance_trader.testnet else binance_mark_price)
+# 通过WebSocket维护Hyperliquid资金费率表，推送过期时回退到REST
+hl_stream = HyperliquidStream()
+hl_stream.start()
+hl_api = HyperliquidAPI(stream=hl_stream)
+hl_api.start_venue_poll()
+hyperliquid_trader = HyperliquidTrader(symbols=symbol_registry, price_stream=hl_stream)
+hyperliquid_trader.markets.start_background_refresh()
+# 订阅账户推送维护Hyperliquid余额和持仓，推送过期时查询回退到REST
+hyperliquid_trader.start_account_stream()
+# 启动时从账户数据加载各交易对当前的杠杆；设置了 LEVERAGE_PREWARM 时再并发把跟踪的交易对
+# 预设为该杠杆（LEVERAGE_PREWARM_SYMBOLS 指定交易对，逗号分隔，默认两个交易所共同上线的全部交易对）
+LEVERAGE_PREWARM = int(os.getenv('LEVERAGE_PREWARM', '0') or 0)
+LEVERAGE_PREWARM_SYMBOLS = [s.strip() for s in os.getenv('LEVERAGE_PREWARM_SYMBOLS', '').split(',') if s.strip()]
+
+def warm_leverage(trader, name, to_symbol):
     try:
-        # 获取当前北京时间
-        current_time = datetime.now(pytz.timezone('Asia/Shanghai'))
-        
-        # 将毫秒转换为秒
-        timestamp_s = timestamp_ms / 1000
-        # 创建UTC时间
-        utc_time = datetime.fromtimestamp(timestamp_s, pytz.UTC)
-        # 转换为北京时间
-        beijing_time = utc_time.astimezone(pytz.timezone('Asia/Shanghai'))
-        
-        # 如果结算时间已过且提供了交易对名称，重新获取最新的结算时间
-        if beijing_time < current_time and symbol:
-            try:
-                # 获取最新的资金费率信息
-                latest_info = binance_trader.client.futures_mark_price(symbol=symbol)
-                if latest_info and 'nextFundingTime' in latest_info:
-                    new_timestamp_ms = latest_info['nextFundingTime']
-                    # 递归调用，但这次不传symbol参数以避免无限循环
-                    return calculate_binance_next_funding_time(new_timestamp_ms)
-            except Exception as e:
-                print(f"获取{symbol}最新结算时间失败: {e}")
-                
-        return beijing_time.strftime('%Y-%m-%d %H:%M:%S')
+        trader.load_leverage()
+        if not LEVERAGE_PREWARM:
+            return
+        deadline = time.time() + 120
+        while not symbol_registry.is_ready() and time.time() < deadline:
+            time.sleep(1)
+        symbols = LEVERAGE_PREWARM_SYMBOLS or [i.canonical for i in symbol_registry.shared()]
+        stats = trader.prewarm_leverage([to_symbol(s) for s in symbols], LEVERAGE_PREWARM)
+        logger.info("%s 杠杆预设完成: %s", name, stats)
     except Exception as e:
-        print(f"时间转换错误: {e}")
-        return "-"
+        logger.warning("%s 加载杠杆设置失败: %s", name, e)
+
+threading.Thread(target=warm_leverage, args=(binance_trader, "币安", symbol_registry.binance_symbol),
+                 name="binance-leverage", daemon=True).start()
+threading.Thread(target=warm_leverage, args=(hyperliquid_trader, "Hyperliquid", symbol_registry.hl_coin),
+                 name="hyperliquid-leverage", daemon=True).start()
+
+# 套利开仓时两边并发准备、同时下单
+arbitrage_executor = DualLegExecutor(binance_trader, hyperliquid_trader,
+                                     binance_symbol=symbol_registry.binance_symbol, hl_coin=symbol_registry.hl_coin)
+# 每轮快照的资金费率写入本地时间序列存储，FUNDING_STORE_DIR 设为空时不记录
+FUNDING_STORE_DIR = os.getenv('FUNDING_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'funding'))
+funding_store = FundingStore(FUNDING_STORE_DIR) if FUNDING_STORE_DIR else None
+
+def shutdown():
+    """进程退出时关闭推送连接和HTTP连接池"""
+    funding_snapshots.stop()
+    binance_monitor.stop_stream()
+    binance_trader.stop_user_stream()
+    binance_monitor.market_data.close()
+    binance_monitor.instruments.stop()
+    binance_trader.instruments.stop()
+    hyperliquid_trader.markets.stop()
+    hl_stream.stop()
+    hyperliquid_trader.stop_account_stream()
+    hl_api.close()
+    arbitrage_executor.close()
+
+atexit.register(shutdown)
+
+def calculate_binance_next_funding_time(timestamp_ms: int, symbol: str = None) -> str:
+    """将币安的时间戳转换为北京时间，过期时从结算时间表获取最新时间"""
+    return format_binance_next_funding(timestamp_ms, symbol, binance_monitor.calendar.resolve)
 
 def find_arbitrage_opportunities(hl_rates, binance_rates, min_diff=0.25):
-    """查找套利机会"""
-    opportunities = []
-    
-    for symbol, hl_info in hl_rates.items():
-        # 移除USDT后缀以匹配币安的交易对格式
-        base_symbol = symbol[:-4]
-        binance_symbol = f"{base_symbol}USDT"
-        
-        if binance_symbol in binance_rates:
-            # Hyperliquid的费率需要乘以100转换为百分比形式，但不四舍五入
-            hl_rate = float(hl_info['funding_rate']) * 100
-            # 将币安的资金费率保留4位小数
-            binance_rate = round(binance_rates[binance_symbol].rate, 4)
-            
-            # 计算费率差，并保留4位小数
-            rate_diff = round(hl_rate - binance_rate, 4)
-            
-            # 获取币安的下次结算时间
-            try:
-                binance_next_funding = calculate_binance_next_funding_time(binance_rates[binance_symbol].next_funding_time, binance_symbol)
-                binance_funding_time = datetime.strptime(binance_next_funding, '%Y-%m-%d %H:%M:%S')
-                # 将币安时间转换为带时区的时间
-                binance_funding_time = pytz.timezone('Asia/Shanghai').localize(binance_funding_time)
-            except:
-                binance_next_funding = "-"  # 如果计算失败，显示占位符
-                continue  # 如果无法获取结算时间，跳过这个交易对
-            
-            # 获取Hyperliquid的下次结算时间
-            try:
-                hl_funding_time = hl_info['next_funding_time']
-                if not isinstance(hl_funding_time, datetime):
-                    continue  # 如果不是有效的时间格式，跳过这个交易对
-                # 确保Hyperliquid时间也是带时区的
-                if hl_funding_time.tzinfo is None:
-                    hl_funding_time = pytz.timezone('Asia/Shanghai').localize(hl_funding_time)
-            except:
-                continue
-            
-            # 检查费率差是否满足最小要求
-            if abs(rate_diff) >= min_diff:
-                # 确定哪个交易所的结算时间先到
-                hl_settles_first = hl_funding_time < binance_funding_time
-                
-                # 确定哪个交易所的费率绝对值更大
-                hl_abs_rate = abs(hl_rate)
-                binance_abs_rate = abs(binance_rate)
-                hl_has_bigger_rate = hl_abs_rate > binance_abs_rate
-                
-                strategy = ""
-                if hl_rate <= 0 and binance_rate <= 0:
-                    # 两个都是负费率
-                    if hl_has_bigger_rate and hl_settles_first:
-                        strategy = f"在Hyperliquid做多收取{hl_abs_rate}%资金费，在Binance做空支付{binance_abs_rate:.4f}%资金费"
-                    elif not hl_has_bigger_rate and not hl_settles_first:
-                        strategy = f"在Binance做多收取{binance_abs_rate:.4f}%资金费，在Hyperliquid做空支付{hl_abs_rate}%资金费"
-                elif hl_rate >= 0 and binance_rate >= 0:
-                    # 两个都是正费率
-                    if hl_has_bigger_rate and hl_settles_first:
-                        strategy = f"在Hyperliquid做空收取{hl_rate}%资金费，在Binance做多支付{binance_rate:.4f}%资金费"
-                    elif not hl_has_bigger_rate and not hl_settles_first:
-                        strategy = f"在Binance做空收取{binance_rate:.4f}%资金费，在Hyperliquid做多支付{hl_rate}%资金费"
-                else:
-                    # 一正一负
-                    if hl_has_bigger_rate and hl_settles_first:
-                        if hl_rate > 0:
-                            strategy = f"在Hyperliquid做空收取{hl_rate}%资金费，在Binance做多收取{abs(binance_rate):.4f}%资金费"
-                        else:
-                            strategy = f"在Hyperliquid做多收取{abs(hl_rate)}%资金费，在Binance做空支付{binance_rate:.4f}%资金费"
-                    elif not hl_has_bigger_rate and not hl_settles_first:
-                        if binance_rate > 0:
-                            strategy = f"在Binance做空收取{binance_rate:.4f}%资金费，在Hyperliquid做多收取{abs(hl_rate)}%资金费"
-                        else:
-                            strategy = f"在Binance做多收取{abs(binance_rate):.4f}%资金费，在Hyperliquid做空支付{hl_rate}%资金费"
-                
-                # 如果没有套利策略，显示"暂无套利机会"
-                if not strategy:
-                    strategy = "暂无套利机会"
-                
-                # 添加到套利机会列表
-                opportunities.append({
-                    'symbol': base_symbol,
-                    'hl_rate': hl_rate,
-                    'binance_rate': binance_rate,
-                    'difference': rate_diff,
-                    'next_funding_hl': hl_info['next_funding_time'].strftime('%Y-%m-%d %H:%M:%S') if isinstance(hl_info['next_funding_time'], datetime) else hl_info['next_funding_time'],
-                    'binance_next_funding': binance_next_funding,
-                    'strategy': strategy
-                })
-    
-    # 按费率差的绝对值排序
-    opportunities.sort(key=lambda x: abs(x['difference']), reverse=True)
-    return opportunities
+    """查找套利机会
+
+    把两个交易所共同上线的交易对整理为对齐的数组，费率差、先结算判断和策略分类
+    都按列批量计算，只为满足阈值的交易对生成结果
+    """
+    universe = RateUniverse.from_rates(hl_rates, binance_rates, binance_monitor.calendar.resolve, symbol_registry)
+    return universe.opportunities(min_diff)
 
 def get_contract_counts(hl_rates, binance_rates):
     """获取两个交易所的合约数量"""
@@ -156,138 +122,273 @@ def get_contract_counts(hl_rates, binance_rates):
 def index():
     return render_template('index.html')
 
-@app.route('/api/funding_rates')
-async def get_funding_rates():
+# 单个交易所获取资金费率的超时时间（秒），超时的交易所本轮数据为空
+FUNDING_FETCH_TIMEOUT = 5
+# 币安资金费率来源：binance 直接请求币安（失败时回退到Hyperliquid提供的BinPerp数据），
+# hyperliquid 只请求一次Hyperliquid的 predictedFundings 同时获取两个交易所的费率
+BINANCE_FUNDING_SOURCE = os.getenv('BINANCE_FUNDING_SOURCE', 'binance')
+# Hyperliquid的BinPerp数据与币安数据相差超过该值（百分比）时输出提示
+CROSS_CHECK_TOLERANCE = 0.005
+# BinPerp数据的最长使用时间（秒），推送可用时由后台轮询刷新，留出一次轮询失败的余量
+PREDICTED_RATES_MAX_AGE = 2 * HyperliquidAPI.VENUE_POLL_INTERVAL
+
+def binance_rates_from_predicted(predicted):
+    """把 predictedFundings 中的BinPerp数据转换为 FundingRateMonitor 的格式
+
+    Args:
+        predicted: 按Hyperliquid币种索引的 {funding_rate, next_funding_time(毫秒)}
+
+    Returns:
+        Dict[str, FundingRateInfo]: 按币安交易对索引的资金费率（百分比）
+    """
+    rates = {}
+    for coin, info in predicted.items():
+        rates[symbol_registry.binance_symbol(coin)] = FundingRateInfo(
+            info['funding_rate'] * 100,
+            info['next_funding_time']
+        )
+    return rates
+
+def cross_check_binance_rates(binance_rates, predicted_rates):
+    """对比币安接口与Hyperliquid提供的币安预测费率，返回差异超过阈值的交易对"""
+    mismatches = []
+    for symbol, info in predicted_rates.items():
+        bn_info = binance_rates.get(symbol)
+        if bn_info is None:
+            continue
+        if abs(float(bn_info.rate) - info.rate) > CROSS_CHECK_TOLERANCE:
+            mismatches.append(symbol)
+    if mismatches:
+        logger.warning("币安资金费率与Hyperliquid提供的BinPerp数据不一致的交易对 %s 个: %s", len(mismatches), mismatches[:10])
+    return mismatches
+
+async def fetch_dual_venue_funding_rates(timeout: float = FUNDING_FETCH_TIMEOUT):
+    """只请求Hyperliquid，从同一份 predictedFundings 中获取两个交易所的资金费率"""
     try:
-        print("开始获取资金费率数据...")
-        
-        # 获取 Hyperliquid 资金费率
-        print("正在获取 Hyperliquid 资金费率...")
-        hl_rates = await get_hl_rates()
-        
-        if hl_rates is None:
-            print("无法获取 Hyperliquid 资金费率")
-            hl_rates = {}
-        elif isinstance(hl_rates, dict) and "error" in hl_rates:
-            print(f"获取 Hyperliquid 资金费率出错: {hl_rates['error']}")
-            hl_rates = {}
-        else:
-            print(f"成功获取 Hyperliquid 资金费率，合约数量: {len(hl_rates)}")
-            
-        # 获取 Binance 资金费率
-        print("正在获取 Binance 资金费率...")
-        binance_rates = await binance_monitor.get_all_funding_rates()
-        
-        if not binance_rates:
-            print("无法获取 Binance 资金费率")
-            binance_rates = {}
-        else:
-            print(f"成功获取 Binance 资金费率，合约数量: {len(binance_rates)}")
-            
-        # 处理所有合约
-        all_contracts = {}
-        
-        # 处理 Hyperliquid 合约
-        for symbol, hl_data in hl_rates.items():
-            try:
-                if not hl_data or not isinstance(hl_data, dict) or "funding_rate" not in hl_data:
-                    print(f"跳过无效的 Hyperliquid 合约数据: {symbol}")
-                    continue
-                
-                # 提取基础代币名称（去除USDT后缀）
-                base_symbol = symbol[:-4] if symbol.endswith('USDT') else symbol
-                
-                # 确保funding_rate是数字
-                try:
-                    # Hyperliquid的费率保持原始格式
-                    hl_rate = float(hl_data["funding_rate"])
-                except (TypeError, ValueError):
-                    print(f"无效的 Hyperliquid 费率数据: {hl_data['funding_rate']}")
-                    continue
-                
-                # 处理next_funding_time
-                if isinstance(hl_data["next_funding_time"], datetime):
-                    hl_next_funding = hl_data["next_funding_time"].strftime("%Y-%m-%d %H:%M:%S")
-                else:
-                    try:
-                        hl_next_funding = str(hl_data["next_funding_time"])
-                    except:
-                        hl_next_funding = None
-                
-                contract_info = {
-                    "symbol": base_symbol,
-                    "hl_rate": hl_rate,
-                    "hl_next_funding": hl_next_funding,
-                    "binance_rate": None,
-                    "binance_next_funding": None
-                }
-                
-                # 尝试匹配 Binance 合约
-                binance_symbol = base_symbol + 'USDT'
-                if binance_symbol in binance_rates:
-                    bn_data = binance_rates[binance_symbol]
-                    if hasattr(bn_data, 'rate') and bn_data.rate is not None:
-                        try:
-                            # Binance的费率已经是百分比形式，不需要再乘以100
-                            contract_info["binance_rate"] = round(float(bn_data.rate), 4)
-                            if hasattr(bn_data, 'next_funding_time'):
-                                contract_info["binance_next_funding"] = calculate_binance_next_funding_time(bn_data.next_funding_time, binance_symbol)
-                        except (TypeError, ValueError):
-                            print(f"无效的 Binance 费率数据: {bn_data.rate}")
-                
-                all_contracts[base_symbol] = contract_info
-                print(f"处理合约 {base_symbol} 完成: {contract_info}")
-            except Exception as e:
-                print(f"处理 Hyperliquid 合约 {symbol} 时出错: {e}")
-                continue
+        hl_result, predicted = await asyncio.wait_for(hl_api.get_dual_venue_funding_rates(), timeout)
+    except asyncio.TimeoutError:
+        logger.warning("获取 Hyperliquid 资金费率超时（%s秒）", timeout)
+        return None, None
+    except Exception as e:
+        logger.error("获取 Hyperliquid 资金费率出错: %s", e)
+        return None, None
+    return hl_result, binance_rates_from_predicted(predicted) or None
+
+async def fetch_funding_rates(timeout: float = FUNDING_FETCH_TIMEOUT):
+    """并发获取两个交易所的资金费率，任一交易所超时或出错不影响另一个
+
+    币安获取失败时使用Hyperliquid predictedFundings 中的BinPerp数据作为备用；
+    两边都成功且已有BinPerp数据时顺便做一次交叉校验。
+
+    Returns:
+        tuple: (Hyperliquid资金费率, Binance资金费率)，失败的一方为None
+    """
+    if BINANCE_FUNDING_SOURCE == 'hyperliquid':
+        return await fetch_dual_venue_funding_rates(timeout)
+
+    hl_result, binance_result = await asyncio.gather(
+        asyncio.wait_for(hl_api.get_all_funding_rates(), timeout),
+        asyncio.wait_for(binance_monitor.get_all_funding_rates(), timeout),
+        return_exceptions=True
+    )
+
+    if isinstance(hl_result, asyncio.TimeoutError):
+        logger.warning("获取 Hyperliquid 资金费率超时（%s秒）", timeout)
+        hl_result = None
+    elif isinstance(hl_result, Exception):
+        logger.error("获取 Hyperliquid 资金费率出错: %s", hl_result)
+        hl_result = None
+
+    if isinstance(binance_result, asyncio.TimeoutError):
+        logger.warning("获取 Binance 资金费率超时（%s秒）", timeout)
+        binance_result = None
+    elif isinstance(binance_result, Exception):
+        logger.error("获取 Binance 资金费率出错: %s", binance_result)
+        binance_result = None
+
+    if not binance_result:
+        try:
+            predicted = await asyncio.wait_for(hl_api.get_venue_funding_rates(max_age=PREDICTED_RATES_MAX_AGE), timeout)
+            binance_result = binance_rates_from_predicted(predicted) or None
+            if binance_result:
+                logger.warning("使用 Hyperliquid 提供的币安预测资金费率，合约数量: %s", len(binance_result))
+        except Exception as e:
+            logger.error("获取 Hyperliquid 提供的币安预测资金费率失败: %s", e)
+    else:
+        # 只使用REST请求或后台轮询已有的数据，不额外请求
+        predicted = hl_api.get_cached_venue_rates(max_age=PREDICTED_RATES_MAX_AGE)
+        if predicted:
+            cross_check_binance_rates(binance_result, binance_rates_from_predicted(predicted))
+
+    return hl_result, binance_result
+
+def record_funding_tick(hl_rates, binance_rates):
+    """把本轮获取到的两个交易所资金费率写入时间序列存储，统一使用百分比和毫秒"""
+    # 注册表加载前统一名称不完整，不记录以免同一币种使用不同编号
+    if funding_store is None or not symbol_registry.is_ready():
+        return
+    nan = float('nan')
+    try:
+        # Hyperliquid提供的币安预测费率只使用已有数据，不额外请求
+        predicted = binance_rates_from_predicted(hl_api.get_cached_venue_rates(max_age=PREDICTED_RATES_MAX_AGE) or {})
+        funding_store.append('binance', [
+            (
+                symbol_registry.canonical(symbol),
+                float(info.rate),
+                predicted[symbol].rate if symbol in predicted else nan,
+                float(info.mark_price) or nan,
+                # 费率变化很小时行情缓存沿用旧记录，结算后的时间可能已过期，与页面数据一样经结算时间表校正
+                int(binance_monitor.calendar.resolve(symbol, int(info.next_funding_time)) or 0)
+            )
+            for symbol, info in binance_rates.items()
+        ])
+        funding_store.append('hyperliquid', [
+            (
+                symbol_registry.canonical(symbol),
+                float(data['funding_rate']) * 100,
+                nan,
+                float(data.get('mark_price') or 0) or nan,
+                int(data['next_funding_time'].timestamp() * 1000) if isinstance(data.get('next_funding_time'), datetime) else 0
+            )
+            for symbol, data in hl_rates.items()
+            if isinstance(data, dict) and 'funding_rate' in data
+        ])
+    except Exception as e:
+        logger.error("记录资金费率失败: %s", e)
+
+async def build_funding_payload():
+    """获取两个交易所的资金费率，构建所有合约和套利机会数据"""
+    logger.debug("开始获取资金费率数据...")
+    
+    # 并发获取两个交易所的资金费率
+    hl_rates, binance_rates = await fetch_funding_rates()
+    
+    if hl_rates is None:
+        logger.warning("无法获取 Hyperliquid 资金费率")
+        hl_rates = {}
+    elif isinstance(hl_rates, dict) and "error" in hl_rates:
+        logger.error("获取 Hyperliquid 资金费率出错: %s", hl_rates['error'])
+        hl_rates = {}
+    else:
+        logger.debug("成功获取 Hyperliquid 资金费率，合约数量: %s", len(hl_rates))
         
-        # 处理 Binance 合约
-        for symbol, bn_data in binance_rates.items():
-            try:
-                # 提取基础代币名称（去除USDT后缀）
-                base_symbol = symbol[:-4] if symbol.endswith('USDT') else symbol
-                
-                if base_symbol not in all_contracts:
-                    try:
-                        # Binance的费率已经是百分比形式，不需要再乘以100
-                        binance_rate = round(float(bn_data.rate), 4) if hasattr(bn_data, 'rate') and bn_data.rate is not None else None
-                        binance_next_funding = calculate_binance_next_funding_time(bn_data.next_funding_time, symbol) if hasattr(bn_data, 'next_funding_time') else None
-                    except (TypeError, ValueError):
-                        print(f"无效的 Binance 费率数据: {getattr(bn_data, 'rate', None)}")
-                        continue
-                        
-                    contract_info = {
-                        "symbol": base_symbol,
-                        "binance_rate": binance_rate,
-                        "binance_next_funding": binance_next_funding,
-                        "hl_rate": None,
-                        "hl_next_funding": None
-                    }
-                    all_contracts[base_symbol] = contract_info
-            except Exception as e:
-                print(f"处理 Binance 合约 {symbol} 时出错: {e}")
-                continue
+    if not binance_rates:
+        logger.warning("无法获取 Binance 资金费率")
+        binance_rates = {}
+    else:
+        logger.debug("成功获取 Binance 资金费率，合约数量: %s", len(binance_rates))
         
-        # 计算有效合约数量
-        contract_counts = {
-            'hyperliquid': len([c for c in all_contracts.values() if c['hl_rate'] is not None]),
-            'binance': len([c for c in all_contracts.values() if c['binance_rate'] is not None])
+    # 合并两个交易所的合约
+    all_contracts = build_all_contracts(hl_rates, binance_rates, symbol_registry, binance_monitor.calendar.resolve)
+    contract_counts = count_contracts(all_contracts)
+    
+    # 寻找套利机会
+    opportunities = find_arbitrage_opportunities(hl_rates, binance_rates)
+    record_funding_tick(hl_rates, binance_rates)
+    
+    return {
+        'all_contracts': all_contracts,
+        'contract_counts': contract_counts,
+        'opportunities': opportunities
+    }
+
+# 后台定时构建资金费率快照，接口直接返回预先序列化好的数据
+funding_snapshots = FundingSnapshotEngine(build_funding_payload, interval=3.0)
+funding_snapshots.start()
+
+# 各数据源距离最后一次更新的秒数，在 /metrics 抓取时计算
+metrics.register_age_gauge('data_source_age_seconds', "数据源距离最后一次更新的秒数", {
+    'funding_snapshot': lambda: funding_snapshots.last_checked,
+    'funding_snapshot_changed': lambda: funding_snapshots.latest().created_at if funding_snapshots.latest() else 0,
+    'binance_stream': lambda: binance_monitor.stream.last_message_time if binance_monitor.stream else 0,
+    'hyperliquid_stream': lambda: hl_stream.last_message_time,
+    'binance_account': lambda: binance_trader.user_stream.state.updated_at if binance_trader.user_stream else 0,
+    'hyperliquid_account': lambda: hyperliquid_trader.account_stream.state.updated_at if hyperliquid_trader.account_stream else 0,
+    'hyperliquid_predicted_fundings': lambda: hl_api.venue_rates_at,
+    'binance_instruments': lambda: binance_monitor.instruments.updated_at,
+    'hyperliquid_markets': lambda: hyperliquid_trader.markets.updated_at,
+})
+metrics.REGISTRY.gauge('funding_snapshot_version', "资金费率快照的当前版本号", callback=lambda: funding_snapshots.version)
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus文本格式的指标"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/api/funding_rates')
+def get_funding_rates():
+    try:
+        # 服务刚启动、后台还没有生成快照时同步构建一次
+        snapshot = funding_snapshots.latest() or funding_snapshots.refresh()
+        if snapshot is None:
+            raise Exception("资金费率数据尚未就绪")
+
+        response = app.response_class(snapshot.body, mimetype='application/json')
+        response.set_etag(snapshot.etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        # 客户端携带的If-None-Match与当前版本一致时返回304
+        return response.make_conditional(request)
+
+    except Exception as e:
+        logger.error("获取资金费率时发生错误: %s", e)
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        })
+
+@app.route('/api/funding_rates/stream')
+def stream_funding_rates():
+    """通过Server-Sent Events推送资金费率和套利机会的变化"""
+    # 浏览器重连时会自动带上Last-Event-ID，只需补发缺失的变化
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        since_version = int(since) if since else None
+    except ValueError:
+        since_version = None
+
+    return Response(
+        funding_snapshots.stream_events(since_version),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
         }
-        
-        # 寻找套利机会
-        opportunities = find_arbitrage_opportunities(hl_rates, binance_rates)
-        
+    )
+
+@app.route('/api/funding_history/<symbol>')
+def get_funding_history(symbol):
+    """查询单个交易对的资金费率历史
+
+    参数 hours 为查询最近多少小时（默认24），venue 为 binance 或 hyperliquid（默认两个都返回）
+    """
+    try:
+        if funding_store is None:
+            raise Exception("未启用资金费率存储")
+        hours = float(request.args.get('hours', 24))
+        venue = request.args.get('venue')
+        if venue is not None and venue not in VENUES:
+            raise Exception(f"未知的交易所: {venue}")
+
+        end_ms = int(datetime.now().timestamp() * 1000)
+        start_ms = end_ms - int(hours * 3600 * 1000)
+        records = funding_store.history(symbol_registry.canonical(symbol), start_ms, end_ms, venue)
+
+        data = {}
+        for name in ([venue] if venue else VENUES):
+            rows = records[records['venue'] == VENUES[name]]
+            data[name] = {
+                'ts': rows['ts'].tolist(),
+                'next_funding_time': rows['next_funding_time'].tolist(),
+                # JSON不支持NaN，缺失值返回null
+                'rate': [None if isnan(x) else x for x in rows['rate'].tolist()],
+                'predicted_rate': [None if isnan(x) else x for x in rows['predicted_rate'].tolist()],
+                'mark_price': [None if isnan(x) else x for x in rows['mark_price'].tolist()]
+            }
         return jsonify({
             'status': 'success',
-            'data': {
-                'all_contracts': all_contracts,
-                'contract_counts': contract_counts,
-                'opportunities': opportunities
-            }
+            'data': data
         })
-        
     except Exception as e:
-        print(f"获取资金费率时发生错误: {e}")
         return jsonify({
             'status': 'error',
             'message': str(e)
@@ -314,7 +415,7 @@ def get_binance_balance():
 def get_binance_position(symbol):
     """获取币安指定交易对的持仓信息"""
     try:
-        position = binance_trader.get_position(symbol)
+        position = binance_trader.get_position(symbol_registry.binance_symbol(symbol))
         return jsonify({
             'status': 'success',
             'data': position
@@ -340,8 +441,8 @@ def place_binance_order():
                     'message': f'缺少必需参数: {field}'
                 })
         
-        # 获取参数
-        symbol = data['symbol']
+        # 获取参数（统一名称如 'PEPE' 转换为币安交易对 '1000PEPEUSDT'）
+        symbol = symbol_registry.binance_symbol(data['symbol'])
         side = data['side']
         usdt_amount = float(data['quantity'])  # 这里的quantity实际上是USDT金额
         leverage = int(data['leverage'])
@@ -378,7 +479,7 @@ def place_binance_order():
 def close_binance_position(symbol):
     """币安平仓接口"""
     try:
-        response = binance_trader.close_position(symbol)
+        response = binance_trader.close_position(symbol_registry.binance_symbol(symbol))
         if response:
             return jsonify({
                 'status': 'success',
@@ -399,7 +500,7 @@ def close_binance_position(symbol):
 def get_binance_price(symbol):
     """获取币安交易对的当前价格"""
     try:
-        price = binance_trader.get_symbol_price(symbol)
+        price = binance_trader.get_symbol_price(symbol_registry.binance_symbol(symbol))
         return jsonify({
             'status': 'success',
             'data': {
@@ -416,7 +517,7 @@ def get_binance_price(symbol):
 def get_binance_symbol_info(symbol):
     """获取币安交易对的信息"""
     try:
-        symbol_info = binance_trader.get_symbol_info(symbol)
+        symbol_info = binance_trader.get_symbol_info(symbol_registry.binance_symbol(symbol))
         return jsonify({
             'status': 'success',
             'data': symbol_info
@@ -431,9 +532,8 @@ def get_binance_symbol_info(symbol):
 def get_binance_symbols():
     """获取所有可交易的合约对"""
     try:
-        exchange_info = binance_trader.client.futures_exchange_info()
         symbols = []
-        for symbol_info in exchange_info['symbols']:
+        for symbol_info in binance_trader.instruments.all():
             if symbol_info['status'] == 'TRADING' and symbol_info['symbol'].endswith('USDT'):
                 symbols.append({
                     'symbol': symbol_info['symbol'],
@@ -458,7 +558,7 @@ def get_binance_symbols():
 def get_binance_max_leverage(symbol):
     """获取币安指定交易对的最大杠杆倍数"""
     try:
-        max_leverage = binance_trader.get_max_leverage(symbol)
+        max_leverage = binance_trader.get_max_leverage(symbol_registry.binance_symbol(symbol))
         return jsonify({
             'status': 'success',
             'data': max_leverage
@@ -473,26 +573,8 @@ def get_binance_max_leverage(symbol):
 def close_all_binance_positions():
     """一键平仓所有币安持仓"""
     try:
-        # 获取所有持仓
-        positions = binance_trader.get_all_positions()
-        
-        # 遍历平仓所有有持仓量的仓位
-        results = []
-        for position in positions:
-            if float(position['positionAmt']) != 0:  # 只平掉有仓位的
-                try:
-                    response = binance_trader.close_position(position['symbol'])
-                    results.append({
-                        'symbol': position['symbol'],
-                        'status': 'success',
-                        'data': response
-                    })
-                except Exception as e:
-                    results.append({
-                        'symbol': position['symbol'],
-                        'status': 'error',
-                        'message': str(e)
-                    })
+        # 按同一份持仓快照生成全部平仓单，批量提交
+        results = binance_trader.close_all_positions()
         
         return jsonify({
             'status': 'success',
@@ -521,6 +603,36 @@ def get_all_binance_positions():
             'message': str(e)
         })
 
+@app.route('/api/binance/open_orders', methods=['GET'])
+def get_binance_open_orders():
+    """获取币安未完成的挂单，可用 symbol 参数过滤"""
+    try:
+        symbol = request.args.get('symbol')
+        orders = binance_trader.get_open_orders(symbol_registry.binance_symbol(symbol) if symbol else None)
+        return jsonify({
+            'status': 'success',
+            'data': orders
+        })
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        })
+
+@app.route('/api/position/close_all', methods=['POST'])
+def close_all_positions():
+    """两个交易所同时一键平仓所有持仓"""
+    try:
+        return jsonify({
+            'status': 'success',
+            'data': arbitrage_executor.close_all()
+        })
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        })
+
 @app.route('/api/hyperliquid/balance', methods=['GET'])
 def get_hyperliquid_balance():
     """获取Hyperliquid账户余额"""
@@ -542,8 +654,8 @@ def get_hyperliquid_balance():
 def get_hyperliquid_position(symbol):
     """获取Hyperliquid指定交易对的持仓信息"""
     try:
-        # 移除USDT后缀
-        symbol = symbol.replace('USDT', '')
+        # 转换为Hyperliquid币种名称（如 '1000PEPEUSDT' -> 'kPEPE'）
+        symbol = symbol_registry.hl_coin(symbol)
         position = hyperliquid_trader.get_position(symbol)
         return jsonify({
             'status': 'success',
@@ -573,8 +685,8 @@ def hyperliquid_order():
         if not quantity and not usdt_amount:
             return jsonify({'status': 'error', 'message': '必须指定数量或USDT金额'}), 400
 
-        # 移除 USDT 后缀
-        symbol = symbol.replace('USDT', '')
+        # 转换为Hyperliquid币种名称（如 '1000PEPEUSDT' -> 'kPEPE'）
+        symbol = symbol_registry.hl_coin(symbol)
 
         result = hyperliquid_trader.place_order(
             symbol=symbol,
@@ -586,7 +698,7 @@ def hyperliquid_order():
             leverage=leverage
         )
         
-        print(f"下单结果: {result}")
+        logger.info("下单结果: %s", result)
         
         # 如果result是字典类型且包含status字段
         if isinstance(result, dict):
@@ -601,7 +713,7 @@ def hyperliquid_order():
             }), 400
 
     except Exception as e:
-        print(f"下单异常: {str(e)}")
+        logger.error("下单异常: %s", e)
         return jsonify({
             'status': 'error',
             'message': str(e)
@@ -611,8 +723,8 @@ def hyperliquid_order():
 def close_hyperliquid_position(symbol):
     """Hyperliquid平仓接口"""
     try:
-        # 移除USDT后缀
-        symbol = symbol.replace('USDT', '')
+        # 转换为Hyperliquid币种名称（如 '1000PEPEUSDT' -> 'kPEPE'）
+        symbol = symbol_registry.hl_coin(symbol)
         response = hyperliquid_trader.close_position(symbol)
         if response:
             return jsonify({
@@ -634,15 +746,15 @@ def close_hyperliquid_position(symbol):
 def get_hyperliquid_max_leverage(symbol):
     """获取Hyperliquid指定交易对的最大杠杆倍数"""
     try:
-        # 从路径中提取基础交易对名称
-        base_symbol = symbol.split('/')[0] if '/' in symbol else symbol.replace('USDC:USDC', '')
+        # 从路径中提取Hyperliquid币种名称
+        base_symbol = symbol_registry.hl_coin(symbol)
         max_leverage = hyperliquid_trader.get_max_leverage(base_symbol)
         return jsonify({
             'status': 'success',
             'data': max_leverage
         })
     except Exception as e:
-        print(f"获取最大杠杆倍数失败: {str(e)}")
+        logger.error("获取最大杠杆倍数失败: %s", e)
         return jsonify({
             'status': 'error',
             'message': str(e)
@@ -669,26 +781,8 @@ def get_hyperliquid_symbols():
 def close_all_hyperliquid_positions():
     """一键平仓所有Hyperliquid持仓"""
     try:
-        # 获取所有持仓
-        positions = hyperliquid_trader.get_all_positions()
-        
-        # 遍历平仓所有有持仓量的仓位
-        results = []
-        for position in positions:
-            if float(position['positionAmt']) != 0:  # 只平掉有仓位的
-                try:
-                    response = hyperliquid_trader.close_position(position['symbol'])
-                    results.append({
-                        'symbol': position['symbol'],
-                        'status': 'success',
-                        'data': response
-                    })
-                except Exception as e:
-                    results.append({
-                        'symbol': position['symbol'],
-                        'status': 'error',
-                        'message': str(e)
-                    })
+        # 按同一份持仓快照生成全部平仓单，批量提交
+        results = hyperliquid_trader.close_all_positions()
         
         return jsonify({
             'status': 'success',
@@ -717,30 +811,75 @@ def get_all_hyperliquid_positions():
             'message': str(e)
         })
 
+@app.route('/api/arbitrage/open', methods=['POST'])
+def open_arbitrage():
+    """套利开仓：一个交易所做多、另一个做空，两边同时下单
+
+    请求参数: symbol, long_exchange（binance/hyperliquid）, quantity（每边的USDT金额）, leverage,
+    可选 order_type 和限价单的 binance_price / hyperliquid_price
+    """
+    try:
+        data = request.get_json() or {}
+        symbol = data.get('symbol')
+        long_exchange = data.get('long_exchange')
+        if not symbol or not long_exchange:
+            return jsonify({'status': 'error', 'message': '缺少必要参数'}), 400
+
+        prices = {venue: float(data[f'{venue}_price']) for venue in ('binance', 'hyperliquid')
+                  if data.get(f'{venue}_price')}
+        result = arbitrage_executor.open(
+            symbol=symbol_registry.canonical(symbol),
+            long_venue=long_exchange,
+            usdt_amount=float(data['quantity']),
+            leverage=int(data.get('leverage', 1)),
+            order_type=data.get('order_type', 'MARKET'),
+            prices=prices
+        )
+        if result['status'] == 'error':
+            return jsonify(result), 400
+        return jsonify({
+            'status': result['status'],
+            'message': {
+                'partial': '只有一边成交，请检查单边持仓',
+                'unknown': '下单超时，成交情况未知，请检查持仓'
+            }.get(result['status'], '套利开仓成功'),
+            'data': result
+        })
+    except (KeyError, ValueError) as e:
+        return jsonify({
+            'status': 'error',
+            'message': f"参数错误: {str(e)}"
+        }), 400
+    except Exception as e:
+        logger.error("套利开仓异常: %s", e)
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        })
+
 @app.route('/api/max_leverage/<symbol>', methods=['GET'])
 def get_max_leverage(symbol):
     """获取两个交易所的最大杠杆"""
     try:
-        # 确保symbol是正确的格式（添加USDT后缀如果没有）
-        if not symbol.endswith('USDT'):
-            symbol = symbol + 'USDT'
+        # 转换为币安交易对名称（统一名称如 'PEPE' 对应 '1000PEPEUSDT'）
+        symbol = symbol_registry.binance_symbol(symbol)
             
-        print(f"获取杠杆倍数，交易对: {symbol}")  # 添加调试日志
+        logger.debug("获取杠杆倍数，交易对: %s", symbol)
         
         # 获取币安的最大杠杆
         try:
             binance_leverage = binance_trader.get_max_leverage(symbol)
-            print(f"币安最大杠杆: {binance_leverage}")  # 添加调试日志
+            logger.debug("币安最大杠杆: %s", binance_leverage)
         except Exception as e:
-            print(f"获取币安杠杆失败: {str(e)}")  # 添加调试日志
+            logger.warning("获取币安杠杆失败: %s", e)
             binance_leverage = 5  # 设置默认值
             
         # 获取Hyperliquid的最大杠杆
         try:
             hyperliquid_leverage = hyperliquid_trader.get_max_leverage(symbol)
-            print(f"Hyperliquid最大杠杆: {hyperliquid_leverage}")  # 添加调试日志
+            logger.debug("Hyperliquid最大杠杆: %s", hyperliquid_leverage)
         except Exception as e:
-            print(f"获取Hyperliquid杠杆失败: {str(e)}")  # 添加调试日志
+            logger.warning("获取Hyperliquid杠杆失败: %s", e)
             hyperliquid_leverage = 5  # 设置默认值
             
         return jsonify({
@@ -751,7 +890,7 @@ def get_max_leverage(symbol):
             }
         })
     except Exception as e:
-        print(f"获取杠杆倍数失败: {str(e)}")  # 添加调试日志
+        logger.error("获取杠杆倍数失败: %s", e)
         return jsonify({
             'status': 'error',
             'message': str(e)
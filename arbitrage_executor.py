@@ -0,0 +1,221 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, Optional
+
+import metrics
+from logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+VENUES = ('binance', 'hyperliquid')
+
+LEG_SKEW = metrics.REGISTRY.histogram(
+    'arbitrage_leg_skew_seconds', "套利开仓两条腿的成交确认时间差",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+
+
+class DualLegExecutor:
+    """同时开仓套利的两条腿
+
+    先在工作线程中并发完成两边的准备工作（价格、数量、杠杆设置），两边都准备好之后
+    再同时放行，各自只剩一次下单请求，未对冲的时间窗口缩短到一次请求往返。
+    任何一边准备失败都不会下单；下单阶段只有一边成功时返回 partial，由调用方处理单边持仓；
+    下单超时的一边无法确认是否成交，返回 unknown。
+
+    下单使用单独的线程池，每个进行中的开仓占两个线程，同时进行的开仓数量不超过 max_concurrent_opens，
+    放行后的下单请求不会排在其他开仓的准备工作或一键平仓后面。
+    """
+
+    def __init__(self, binance_trader, hyperliquid_trader, binance_symbol: Optional[Callable[[str], str]] = None,
+                 hl_coin: Optional[Callable[[str], str]] = None, prepare_timeout: float = 30.0,
+                 submit_timeout: float = 30.0, max_concurrent_opens: int = 4):
+        """
+        Args:
+            binance_trader: BinanceTrader 对象
+            hyperliquid_trader: HyperliquidTrader 对象
+            binance_symbol: 把统一名称转换为币安交易对的函数（如 SymbolRegistry.binance_symbol）
+            hl_coin: 把统一名称转换为Hyperliquid币种的函数（如 SymbolRegistry.hl_coin）
+            prepare_timeout: 准备阶段的超时时间（秒）
+            submit_timeout: 下单阶段的超时时间（秒）
+            max_concurrent_opens: 同时进行的开仓数量上限
+        """
+        self.traders = {'binance': binance_trader, 'hyperliquid': hyperliquid_trader}
+        self.binance_symbol = binance_symbol or (lambda symbol: symbol)
+        self.hl_coin = hl_coin or (lambda symbol: symbol)
+        self.prepare_timeout = prepare_timeout
+        self.submit_timeout = submit_timeout
+        # 线程常驻复用，开仓时不用再创建线程；下单线程池按每个开仓两条腿预留
+        self._prepare_pool = ThreadPoolExecutor(max_workers=2 * max_concurrent_opens,
+                                                thread_name_prefix="arbitrage-prepare")
+        self._submit_pool = ThreadPoolExecutor(max_workers=2 * max_concurrent_opens,
+                                               thread_name_prefix="arbitrage-submit")
+        self._close_pool = ThreadPoolExecutor(max_workers=len(VENUES), thread_name_prefix="arbitrage-close")
+        # 开仓占用的下单线程在两条腿的请求都返回后才释放，超时未返回的请求继续占用
+        self._open_slots = threading.BoundedSemaphore(max_concurrent_opens)
+
+    def close(self):
+        for pool in (self._prepare_pool, self._submit_pool, self._close_pool):
+            pool.shutdown(wait=False)
+
+    def close_all(self) -> Dict[str, Dict]:
+        """两个交易所同时批量平掉所有持仓
+
+        Returns:
+            Dict: 每个交易所的 {'status', 'data'（每个交易对的结果）或 'message'}
+        """
+        futures = {venue: self._close_pool.submit(self.traders[venue].close_all_positions) for venue in VENUES}
+        results = {}
+        for venue, future in futures.items():
+            try:
+                results[venue] = {'status': 'success', 'data': future.result(self.submit_timeout)}
+            except Exception as e:
+                logger.error("%s 一键平仓失败: %s", venue, e)
+                results[venue] = {'status': 'error', 'message': str(e)}
+        return results
+
+    def _prepare(self, venue: str, symbol: str, side: str, usdt_amount: float, leverage: int, order_type: str,
+                 price: Optional[float]):
+        if venue == 'binance':
+            return self.traders[venue].prepare_order(
+                symbol=self.binance_symbol(symbol), side=side, usdt_amount=usdt_amount, leverage=leverage,
+                order_type=order_type, price=price
+            )
+        return self.traders[venue].prepare_order(
+            self.hl_coin(symbol), side, order_type=order_type, usdt_amount=usdt_amount, price=price, leverage=leverage
+        )
+
+    def _submit(self, venue: str, prepared: Dict, gate: threading.Event) -> Dict:
+        gate.wait()
+        sent_at = time.perf_counter()
+        try:
+            order = self.traders[venue].submit_order(prepared)
+            return {'ok': True, 'order': order, 'sent_at': sent_at, 'acked_at': time.perf_counter()}
+        except Exception as e:
+            return {'ok': False, 'error': str(e), 'sent_at': sent_at, 'acked_at': time.perf_counter()}
+
+    def _release_when_done(self, futures):
+        """所有下单请求返回后释放开仓名额"""
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            self._open_slots.release()
+
+        for future in futures:
+            future.add_done_callback(done)
+
+    def open(self, symbol: str, long_venue: str, usdt_amount: float, leverage: int,
+             order_type: str = 'MARKET', prices: Optional[Dict[str, float]] = None) -> Dict:
+        """在 long_venue 做多、另一个交易所做空，两边各开 usdt_amount 的仓位
+
+        Args:
+            symbol: 统一交易对名称（如 'BTC'、'PEPE'）
+            long_venue: 做多的交易所（'binance' 或 'hyperliquid'）
+            usdt_amount: 每条腿的名义价值（USDT）
+            leverage: 两边使用的杠杆倍数
+            order_type: 'MARKET' 或 'LIMIT'
+            prices: 限价单时每个交易所的价格
+
+        Returns:
+            Dict: status（success/partial/unknown/error）、两条腿的结果和耗时（毫秒）
+        """
+        if long_venue not in VENUES:
+            raise ValueError("long_exchange 必须是 'binance' 或 'hyperliquid'")
+        if usdt_amount <= 0:
+            raise ValueError("USDT金额必须大于0")
+        order_type = order_type.upper()
+        prices = prices or {}
+        sides = {venue: 'BUY' if venue == long_venue else 'SELL' for venue in VENUES}
+        started = time.perf_counter()
+        if not self._open_slots.acquire(timeout=self.prepare_timeout):
+            return {'status': 'error', 'message': '进行中的开仓过多，请稍后再试', 'prepare_ms': 0.0}
+
+        # 1. 并发准备两条腿，任何一边失败都不下单
+        futures = {
+            venue: self._prepare_pool.submit(self._prepare, venue, symbol, sides[venue], usdt_amount, leverage, order_type,
+                                     prices.get(venue))
+            for venue in VENUES
+        }
+        prepared, errors = {}, {}
+        for venue, future in futures.items():
+            try:
+                prepared[venue] = future.result(self.prepare_timeout)
+            except FutureTimeoutError:
+                errors[venue] = f"准备 {self.prepare_timeout:g} 秒未完成"
+            except Exception as e:
+                errors[venue] = str(e)
+        prepare_ms = (time.perf_counter() - started) * 1000
+        if errors:
+            self._open_slots.release()
+            logger.warning("套利开仓 %s 准备失败，未下单: %s", symbol, errors)
+            return {
+                'status': 'error',
+                'message': '；'.join(f"{venue}: {error}" for venue, error in errors.items()),
+                'prepare_ms': prepare_ms
+            }
+
+        # 2. 两边同时放行，各自只发送一次下单请求
+        gate = threading.Event()
+        futures = {venue: self._submit_pool.submit(self._submit, venue, prepared[venue], gate) for venue in VENUES}
+        self._release_when_done(futures.values())
+        gate.set()
+        results = {}
+        for venue, future in futures.items():
+            try:
+                results[venue] = future.result(self.submit_timeout)
+            except FutureTimeoutError:
+                # 请求已发出但没有返回，无法确认是否成交
+                now = time.perf_counter()
+                results[venue] = {'ok': None, 'error': f"下单 {self.submit_timeout:g} 秒未返回，结果未知",
+                                  'sent_at': now, 'acked_at': now}
+            except Exception as e:
+                now = time.perf_counter()
+                results[venue] = {'ok': False, 'error': str(e), 'sent_at': now, 'acked_at': now}
+
+        binance, hyperliquid = results['binance'], results['hyperliquid']
+        send_skew = abs(binance['sent_at'] - hyperliquid['sent_at'])
+        ack_skew = abs(binance['acked_at'] - hyperliquid['acked_at'])
+        first_sent = min(binance['sent_at'], hyperliquid['sent_at'])
+        LEG_SKEW.observe(ack_skew)
+
+        legs = {}
+        for venue, result in results.items():
+            legs[venue] = {
+                'side': sides[venue],
+                'status': {True: 'success', False: 'error', None: 'unknown'}[result['ok']],
+                'latency_ms': (result['acked_at'] - result['sent_at']) * 1000,
+            }
+            if result['ok']:
+                legs[venue]['data'] = result['order']
+            else:
+                legs[venue]['message'] = result['error']
+
+        filled = [venue for venue, result in results.items() if result['ok']]
+        unknown = [venue for venue, result in results.items() if result['ok'] is None]
+        if len(filled) == 2:
+            status = 'success'
+        elif unknown:
+            status = 'unknown'
+            logger.error("套利开仓 %s 的 %s 下单超时，成交情况未知，请检查持仓: %s", symbol, '、'.join(unknown), legs)
+        elif filled:
+            status = 'partial'
+            logger.error("套利开仓 %s 只有 %s 成交，存在单边持仓: %s", symbol, filled[0], legs)
+        else:
+            status = 'error'
+            logger.error("套利开仓 %s 两边下单均失败: %s", symbol, legs)
+
+        return {
+            'status': status,
+            'symbol': symbol,
+            'legs': legs,
+            'prepare_ms': prepare_ms,
+            'submit_ms': (max(binance['acked_at'], hyperliquid['acked_at']) - first_sent) * 1000,
+            'send_skew_ms': send_skew * 1000,
+            'inter_leg_latency_ms': ack_skew * 1000,
+            'total_ms': (time.perf_counter() - started) * 1000
+        }
@@ -0,0 +1,244 @@
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pytz
+
+from symbol_registry import SymbolRegistry
+
+BEIJING_TZ = pytz.timezone('Asia/Shanghai')
+
+# 策略编号，0表示暂无套利机会
+STRATEGY_NONE = 0
+# 两个都是负费率
+STRATEGY_NEG_HL_LONG = 1          # Hyperliquid做多收取，Binance做空支付
+STRATEGY_NEG_BN_LONG = 2          # Binance做多收取，Hyperliquid做空支付
+# 两个都是正费率
+STRATEGY_POS_HL_SHORT = 3         # Hyperliquid做空收取，Binance做多支付
+STRATEGY_POS_BN_SHORT = 4         # Binance做空收取，Hyperliquid做多支付
+# 一正一负
+STRATEGY_MIX_HL_SHORT = 5         # Hyperliquid做空收取，Binance做多收取
+STRATEGY_MIX_HL_LONG = 6          # Hyperliquid做多收取，Binance做空支付
+STRATEGY_MIX_BN_SHORT = 7         # Binance做空收取，Hyperliquid做多收取
+STRATEGY_MIX_BN_LONG = 8          # Binance做多收取，Hyperliquid做空支付
+
+# 先结算且费率更大、负责收取资金费的交易所
+HL_COLLECTS = (STRATEGY_NEG_HL_LONG, STRATEGY_POS_HL_SHORT, STRATEGY_MIX_HL_SHORT, STRATEGY_MIX_HL_LONG)
+BINANCE_COLLECTS = (STRATEGY_NEG_BN_LONG, STRATEGY_POS_BN_SHORT, STRATEGY_MIX_BN_SHORT, STRATEGY_MIX_BN_LONG)
+# 按策略编号索引的Hyperliquid持仓方向（1做多，-1做空），Binance方向相反
+HL_SIDE = np.array([0, 1, -1, -1, 1, -1, 1, 1, -1], dtype=np.int8)
+
+
+def classify(hl_rate: np.ndarray, binance_rate: np.ndarray, hl_settles_first: np.ndarray) -> np.ndarray:
+    """按先结算、费率绝对值更大的规则批量判断套利策略
+
+    Args:
+        hl_rate: Hyperliquid费率（百分比）
+        binance_rate: Binance费率（百分比）
+        hl_settles_first: Hyperliquid是否先结算
+
+    Returns:
+        np.ndarray: 每个交易对的策略编号
+    """
+    hl_side = (np.abs(hl_rate) > np.abs(binance_rate)) & hl_settles_first
+    bn_side = (np.abs(hl_rate) <= np.abs(binance_rate)) & ~hl_settles_first
+
+    both_neg = (hl_rate <= 0) & (binance_rate <= 0)
+    both_pos = (hl_rate >= 0) & (binance_rate >= 0) & ~both_neg
+    mixed = ~both_neg & ~both_pos
+
+    return np.select(
+        [
+            both_neg & hl_side,
+            both_neg & bn_side,
+            both_pos & hl_side,
+            both_pos & bn_side,
+            mixed & hl_side & (hl_rate > 0),
+            mixed & hl_side,
+            mixed & bn_side & (binance_rate > 0),
+            mixed & bn_side,
+        ],
+        [
+            STRATEGY_NEG_HL_LONG,
+            STRATEGY_NEG_BN_LONG,
+            STRATEGY_POS_HL_SHORT,
+            STRATEGY_POS_BN_SHORT,
+            STRATEGY_MIX_HL_SHORT,
+            STRATEGY_MIX_HL_LONG,
+            STRATEGY_MIX_BN_SHORT,
+            STRATEGY_MIX_BN_LONG,
+        ],
+        default=STRATEGY_NONE
+    ).astype(np.int8)
+
+
+def describe_strategy(code: int, hl_rate: float, binance_rate: float) -> str:
+    """生成策略说明文字"""
+    if code == STRATEGY_NEG_HL_LONG:
+        return f"在Hyperliquid做多收取{abs(hl_rate)}%资金费，在Binance做空支付{abs(binance_rate):.4f}%资金费"
+    if code == STRATEGY_NEG_BN_LONG:
+        return f"在Binance做多收取{abs(binance_rate):.4f}%资金费，在Hyperliquid做空支付{abs(hl_rate)}%资金费"
+    if code == STRATEGY_POS_HL_SHORT:
+        return f"在Hyperliquid做空收取{hl_rate}%资金费，在Binance做多支付{binance_rate:.4f}%资金费"
+    if code == STRATEGY_POS_BN_SHORT:
+        return f"在Binance做空收取{binance_rate:.4f}%资金费，在Hyperliquid做多支付{hl_rate}%资金费"
+    if code == STRATEGY_MIX_HL_SHORT:
+        return f"在Hyperliquid做空收取{hl_rate}%资金费，在Binance做多收取{abs(binance_rate):.4f}%资金费"
+    if code == STRATEGY_MIX_HL_LONG:
+        return f"在Hyperliquid做多收取{abs(hl_rate)}%资金费，在Binance做空支付{binance_rate:.4f}%资金费"
+    if code == STRATEGY_MIX_BN_SHORT:
+        return f"在Binance做空收取{binance_rate:.4f}%资金费，在Hyperliquid做多收取{abs(hl_rate)}%资金费"
+    if code == STRATEGY_MIX_BN_LONG:
+        return f"在Binance做多收取{abs(binance_rate):.4f}%资金费，在Hyperliquid做空支付{hl_rate}%资金费"
+    return "暂无套利机会"
+
+
+class RateUniverse:
+    """两个交易所共同上线的交易对及其费率、下次结算时间，按列存放在对齐的数组中"""
+
+    def __init__(self, symbols: List[str], hl_rate: np.ndarray, binance_rate: np.ndarray,
+                 hl_next: np.ndarray, binance_next: np.ndarray, hl_next_display: List[str],
+                 binance_symbols: Optional[List[str]] = None, hl_coins: Optional[List[str]] = None):
+        """
+        Args:
+            symbols: 统一币种名称，下标即交易对编号
+            hl_rate: Hyperliquid费率（百分比）
+            binance_rate: Binance费率（百分比，保留4位小数）
+            hl_next: Hyperliquid下次结算时间（秒级时间戳）
+            binance_next: Binance下次结算时间（秒级时间戳）
+            hl_next_display: Hyperliquid下次结算时间的显示文本
+            binance_symbols: 币安交易对名称，默认为 symbol + 'USDT'
+            hl_coins: Hyperliquid币种名称，默认与统一名称相同
+        """
+        self.symbols = symbols
+        self.hl_rate = hl_rate
+        self.binance_rate = binance_rate
+        self.hl_next = hl_next
+        self.binance_next = binance_next
+        self.hl_next_display = hl_next_display
+        self.binance_symbols = binance_symbols if binance_symbols is not None else [f"{s}USDT" for s in symbols]
+        self.hl_coins = hl_coins if hl_coins is not None else list(symbols)
+        self.difference = np.round(hl_rate - binance_rate, 4)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    @classmethod
+    def from_rates(cls, hl_rates: Dict, binance_rates: Dict,
+                   resolve_binance_next: Optional[Callable[[str, int], Optional[int]]] = None,
+                   registry: Optional[SymbolRegistry] = None) -> 'RateUniverse':
+        """由两个交易所的资金费率字典构建
+
+        Args:
+            hl_rates: HyperliquidAPI 返回的资金费率，键为 'BTCUSDT' 形式
+            binance_rates: FundingRateMonitor 返回的资金费率
+            resolve_binance_next: 可选，把已过期的币安结算时间（毫秒）换成最新时间
+            registry: 可选，交易对注册表，用于匹配名称不同的合约（如 kPEPE 与 1000PEPEUSDT）
+        """
+        symbols, hl_rate, binance_rate, hl_next, binance_next, hl_display = [], [], [], [], [], []
+        binance_symbols, hl_coins = [], []
+        for symbol, hl_info in hl_rates.items():
+            if registry is not None:
+                base_symbol = registry.canonical(symbol)
+                binance_symbol = registry.binance_symbol(base_symbol)
+                hl_coin = registry.hl_coin(symbol)
+            else:
+                # 移除USDT后缀以匹配币安的交易对格式
+                base_symbol = hl_coin = symbol[:-4]
+                binance_symbol = f"{base_symbol}USDT"
+            binance_info = binance_rates.get(binance_symbol)
+            if binance_info is None:
+                continue
+
+            hl_funding_time = hl_info.get('next_funding_time')
+            if not isinstance(hl_funding_time, datetime):
+                continue  # 如果不是有效的时间格式，跳过这个交易对
+            if hl_funding_time.tzinfo is None:
+                hl_funding_time = BEIJING_TZ.localize(hl_funding_time)
+
+            try:
+                bn_next_ms = int(binance_info.next_funding_time)
+                if resolve_binance_next is not None:
+                    bn_next_ms = resolve_binance_next(binance_symbol, bn_next_ms) or bn_next_ms
+                hl_value = float(hl_info['funding_rate']) * 100
+                bn_value = round(float(binance_info.rate), 4)
+            except (TypeError, ValueError, KeyError):
+                continue
+
+            symbols.append(base_symbol)
+            binance_symbols.append(binance_symbol)
+            hl_coins.append(hl_coin)
+            hl_rate.append(hl_value)
+            binance_rate.append(bn_value)
+            hl_next.append(int(hl_funding_time.timestamp()))
+            binance_next.append(bn_next_ms // 1000)
+            hl_display.append(hl_info['next_funding_time'].strftime('%Y-%m-%d %H:%M:%S'))
+
+        return cls(
+            symbols,
+            np.array(hl_rate, dtype=np.float64),
+            np.array(binance_rate, dtype=np.float64),
+            np.array(hl_next, dtype=np.int64),
+            np.array(binance_next, dtype=np.int64),
+            hl_display,
+            binance_symbols,
+            hl_coins
+        )
+
+    def hl_settles_first(self) -> np.ndarray:
+        return self.hl_next < self.binance_next
+
+    def strategies(self) -> np.ndarray:
+        """每个交易对的策略编号（不考虑费率差阈值）"""
+        return classify(self.hl_rate, self.binance_rate, self.hl_settles_first())
+
+    def sweep(self, thresholds: List[float]) -> Dict[float, Dict[str, int]]:
+        """统计不同费率差阈值下的机会数量
+
+        Returns:
+            Dict[float, Dict[str, int]]: 阈值到满足阈值的交易对数量和其中有明确策略的数量
+        """
+        abs_diff = np.abs(self.difference)
+        has_strategy = self.strategies() != STRATEGY_NONE
+        result = {}
+        for threshold in thresholds:
+            hits = abs_diff >= threshold
+            result[threshold] = {
+                'candidates': int(hits.sum()),
+                'with_strategy': int((hits & has_strategy).sum())
+            }
+        return result
+
+    def opportunities(self, min_diff: float = 0.25) -> List[Dict]:
+        """查找费率差达到阈值的套利机会，按费率差绝对值从大到小排序"""
+        if not len(self):
+            return []
+
+        abs_diff = np.abs(self.difference)
+        hits = np.flatnonzero(abs_diff >= min_diff)
+        if not hits.size:
+            return []
+        hits = hits[np.argsort(-abs_diff[hits], kind='stable')]
+        codes = self.strategies()[hits].tolist()
+
+        opportunities = []
+        for i, code in zip(hits.tolist(), codes):
+            hl_rate = float(self.hl_rate[i])
+            binance_rate = float(self.binance_rate[i])
+            opportunities.append({
+                'symbol': self.symbols[i],
+                'binance_symbol': self.binance_symbols[i],
+                'hl_coin': self.hl_coins[i],
+                'hl_rate': hl_rate,
+                'binance_rate': binance_rate,
+                'difference': float(self.difference[i]),
+                'next_funding_hl': self.hl_next_display[i],
+                'binance_next_funding': format_timestamp(int(self.binance_next[i])),
+                'strategy': describe_strategy(code, hl_rate, binance_rate)
+            })
+        return opportunities
+
+
+def format_timestamp(timestamp_s: int) -> str:
+    """把秒级时间戳格式化为北京时间"""
+    return datetime.fromtimestamp(timestamp_s, pytz.UTC).astimezone(BEIJING_TZ).strftime('%Y-%m-%d %H:%M:%S')
@@ -0,0 +1,155 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from typing import Awaitable, Optional
+
+import aiohttp
+
+from logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+
+class BackgroundEventLoop:
+    """在独立后台线程中运行的常驻事件循环
+
+    Flask的异步视图每次请求都会创建新的事件循环，而aiohttp的会话绑定在创建它的
+    事件循环上。把长期存在的会话放到这个常驻循环里，各个请求通过 run() 把协程
+    提交过来执行，就可以在请求之间复用连接池。
+    """
+
+    def __init__(self, name: str = "async-runtime"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """获取事件循环，首次访问时启动后台线程"""
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name=self.name, daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def submit(self, coro: Awaitable) -> Future:
+        """从任意线程提交协程，返回 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def run(self, coro: Awaitable):
+        """在常驻循环中执行协程，可以在任意其他事件循环中 await"""
+        loop = self.loop
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    def run_sync(self, coro: Awaitable, timeout: Optional[float] = None):
+        """在同步代码中执行协程并等待结果"""
+        return self.submit(coro).result(timeout)
+
+    def stop(self):
+        """停止事件循环并等待后台线程退出"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = None
+            self._thread = None
+        if loop is None:
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not None:
+            thread.join(timeout=5)
+        loop.close()
+
+
+class PooledSession:
+    """运行在常驻事件循环上的aiohttp长连接会话
+
+    连接池有上限并开启keep-alive和DNS缓存，在所有请求之间复用。
+    """
+
+    def __init__(self, name: str, pool_size: int = 10, dns_ttl: int = 300, timeout: float = 10.0):
+        """
+        Args:
+            name: 后台线程名称
+            pool_size: 连接池最大连接数
+            dns_ttl: DNS缓存时间（秒）
+            timeout: 单次请求超时时间（秒）
+        """
+        self.runtime = BackgroundEventLoop(name)
+        self.pool_size = pool_size
+        self.dns_ttl = dns_ttl
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def get(self) -> aiohttp.ClientSession:
+        """获取会话，必须在常驻事件循环中调用"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                ttl_dns_cache=self.dns_ttl,
+                keepalive_timeout=60
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    async def run(self, coro: Awaitable):
+        """在会话所在的常驻循环中执行协程"""
+        return await self.runtime.run(coro)
+
+    async def _close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def close(self):
+        """关闭连接池和常驻事件循环"""
+        try:
+            self.runtime.run_sync(self._close(), timeout=5)
+        except Exception as e:
+            logger.error("关闭%s会话失败: %s", self.runtime.name, e)
+        self.runtime.stop()
+
+
+class AsyncRateLimiter:
+    """令牌桶限流器，多个并发任务共享同一份请求额度"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Args:
+            rate: 每秒补充的令牌数（请求权重）
+            burst: 桶容量，允许的最大突发请求权重
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self, weight: float = 1):
+        """等待直到有足够的令牌"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= weight:
+                    self._tokens -= weight
+                    return
+                await asyncio.sleep((weight - self._tokens) / self.rate)
+
+    def penalize(self, seconds: float):
+        """收到限流响应后清空令牌，暂停指定秒数"""
+        self._tokens = -seconds * self.rate
+        self._updated = time.monotonic()
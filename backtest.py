@@ -0,0 +1,214 @@
+import argparse
+import os
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from arbitrage_scanner import HL_COLLECTS, HL_SIDE, STRATEGY_NONE, classify
+from funding_backfill import DEFAULT_HISTORY_DIR
+from funding_store import FundingHistoryStore
+from symbol_registry import SymbolRegistry
+
+HOUR_MS = 3600 * 1000
+HOURS_PER_YEAR = 24 * 365
+# 默认吃单手续费（百分比）
+BINANCE_TAKER_FEE = 0.05
+HYPERLIQUID_TAKER_FEE = 0.035
+
+
+class FundingPanel(NamedTuple):
+    """按小时对齐的两个交易所资金费率，形状均为 (交易对数, 小时数)"""
+    symbols: List[str]           # 统一名称
+    hours: np.ndarray            # 每列的整点时间（毫秒）
+    hl_rate: np.ndarray          # 下一个整点Hyperliquid结算的费率（百分比），缺失为NaN
+    binance_rate: np.ndarray     # 下一次Binance结算的费率（百分比），缺失为NaN
+    binance_next: np.ndarray     # 下一次Binance结算时间（毫秒），缺失为0
+
+
+def load_panel(store: FundingHistoryStore, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> FundingPanel:
+    """读取历史资金费率，按统一名称匹配两个交易所并对齐到整点
+
+    在整点 t 做决策时，Hyperliquid的下一次结算在 t+1小时，Binance的下一次结算是
+    t 之后最近的一次结算；用实际结算的费率代替当时看到的预测费率。
+    """
+    registry = SymbolRegistry()
+    registry.update_binance({
+        symbol: {'baseAsset': symbol[:-4], 'quoteAsset': 'USDT'}
+        for symbol in store.symbols('binance') if symbol.endswith('USDT')
+    })
+    registry.update_hyperliquid(store.symbols('hyperliquid'))
+    pairs = registry.shared()
+
+    hl_data, bn_data = [], []
+    for instrument in pairs:
+        hl_data.append(store.read('hyperliquid', instrument.hl_coin))
+        bn_data.append(store.read('binance', instrument.binance_symbol))
+
+    if start_ms is None:
+        start_ms = min((int(d['time'][0]) for d in hl_data if len(d)), default=0)
+    if end_ms is None:
+        end_ms = max((int(d['time'][-1]) for d in hl_data if len(d)), default=0)
+    hours = np.arange(start_ms // HOUR_MS * HOUR_MS, end_ms // HOUR_MS * HOUR_MS, HOUR_MS, dtype=np.int64)
+
+    shape = (len(pairs), len(hours))
+    hl_rate = np.full(shape, np.nan)
+    binance_rate = np.full(shape, np.nan)
+    binance_next = np.zeros(shape, dtype=np.int64)
+    if not len(hours):
+        return FundingPanel([i.canonical for i in pairs], hours, hl_rate, binance_rate, binance_next)
+
+    for row, (hl, bn) in enumerate(zip(hl_data, bn_data)):
+        if len(hl):
+            # 结算时间可能有毫秒级偏差，取最近的整点；t 列对应 t+1小时的结算
+            column = (np.asarray(hl['time']) + HOUR_MS // 2) // HOUR_MS * HOUR_MS
+            column = (column - HOUR_MS - hours[0]) // HOUR_MS
+            valid = (column >= 0) & (column < len(hours))
+            hl_rate[row, column[valid]] = hl['rate'][valid]
+        if len(bn):
+            bn_time = np.asarray(bn['time'])
+            index = np.searchsorted(bn_time, hours, side='right')
+            valid = index < len(bn_time)
+            binance_next[row, valid] = bn_time[index[valid]]
+            binance_rate[row, valid] = bn['rate'][index[valid]]
+
+    return FundingPanel([i.canonical for i in pairs], hours, hl_rate, binance_rate, binance_next)
+
+
+class Backtester:
+    """按 find_arbitrage_opportunities 的规则回测资金费率套利
+
+    每个整点按“先结算、费率绝对值更大的一方收取资金费”的规则和费率差阈值决定
+    持仓，持有到下一个整点。信号不变时继续持有，开仓、平仓和换方向时按两边的
+    吃单手续费扣费。收益以单边名义本金的百分比表示。
+    """
+
+    def __init__(self, panel: FundingPanel, binance_fee: float = BINANCE_TAKER_FEE,
+                 hl_fee: float = HYPERLIQUID_TAKER_FEE):
+        self.panel = panel
+        self.binance_fee = binance_fee
+        self.hl_fee = hl_fee
+
+        hl_rate = panel.hl_rate
+        # 与实时扫描一致：币安费率保留4位小数，费率差保留4位小数
+        binance_rate = np.round(panel.binance_rate, 4)
+        available = ~np.isnan(hl_rate) & ~np.isnan(binance_rate)
+        self.available = available
+        self.hl_rate = np.where(available, hl_rate, 0.0)
+        self.binance_rate = np.where(available, binance_rate, 0.0)
+        self.abs_diff = np.abs(np.round(self.hl_rate - self.binance_rate, 4))
+
+        hl_next = panel.hours + HOUR_MS
+        hl_settles_first = hl_next[None, :] < panel.binance_next
+        self.strategies = np.where(available, classify(self.hl_rate, self.binance_rate, hl_settles_first), STRATEGY_NONE)
+
+        # 持有一小时的资金费收益：Hyperliquid每个整点结算，Binance只在本小时内结算时计入
+        hl_side = HL_SIDE[self.strategies].astype(np.float64)
+        binance_settles = panel.binance_next <= hl_next[None, :]
+        self.funding = -hl_side * self.hl_rate + hl_side * self.binance_rate * binance_settles
+
+    def positions(self, min_diff: float) -> np.ndarray:
+        """每个整点的持仓策略编号，0表示空仓"""
+        return np.where(self.abs_diff >= min_diff, self.strategies, STRATEGY_NONE)
+
+    def run(self, min_diff: float = 0.25) -> Dict:
+        """按指定费率差阈值回测
+
+        Returns:
+            Dict: per_symbol 为每个交易对的结果，aggregate 为汇总
+        """
+        positions = self.positions(min_diff)
+        held = positions != STRATEGY_NONE
+        funding = np.where(held, self.funding, 0.0)
+
+        # 按实际持有的两条腿判断成交：开仓、平仓各算一次，换方向算两次；
+        # 方向相同的策略编号之间切换（如费率过零、先结算的交易所变化）不需要下单
+        side = HL_SIDE[positions]
+        previous = np.concatenate([np.zeros((len(side), 1), dtype=side.dtype), side[:, :-1]], axis=1)
+        changed = side != previous
+        opens = held & changed
+        closes = (previous != 0) & changed
+        # 回测结束时仍持有的仓位按平仓计费
+        final_close = held[:, -1] if positions.shape[1] else np.zeros(len(positions), dtype=bool)
+        round_fee = self.binance_fee + self.hl_fee
+        fees = (opens.sum(axis=1) + closes.sum(axis=1) + final_close) * round_fee
+
+        funding_pnl = funding.sum(axis=1)
+        net = funding_pnl - fees
+        years = max(positions.shape[1], 1) / HOURS_PER_YEAR
+        hl_collects = np.isin(positions, HL_COLLECTS)
+
+        per_symbol = {}
+        for i, symbol in enumerate(self.panel.symbols):
+            if not opens[i].any():
+                continue
+            per_symbol[symbol] = {
+                'trades': int(opens[i].sum()),
+                'hours_held': int(held[i].sum()),
+                'hl_collect_hours': int(hl_collects[i].sum()),
+                'funding_pnl': float(funding_pnl[i]),
+                'fees': float(fees[i]),
+                'net_pnl': float(net[i]),
+                'annual_yield': float(net[i] / years)
+            }
+
+        traded = np.array([s in per_symbol for s in self.panel.symbols], dtype=bool)
+        aggregate = {
+            'min_diff': min_diff,
+            'symbols': len(self.panel.symbols),
+            'symbols_traded': int(traded.sum()),
+            'trades': int(opens.sum()),
+            'hours_held': int(held.sum()),
+            'funding_pnl': float(funding_pnl.sum()),
+            'fees': float(fees.sum()),
+            'net_pnl': float(net.sum()),
+            # 每个交易对投入相同本金时的平均年化收益
+            'avg_annual_yield': float(net[traded].mean() / years) if traded.any() else 0.0
+        }
+        return {'per_symbol': per_symbol, 'aggregate': aggregate}
+
+    def sweep(self, thresholds: List[float]) -> List[Dict]:
+        """比较不同费率差阈值的汇总结果"""
+        return [self.run(threshold)['aggregate'] for threshold in thresholds]
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="用历史资金费率回测套利策略")
+    parser.add_argument('--dir', default=os.getenv('FUNDING_HISTORY_DIR', DEFAULT_HISTORY_DIR), help="历史数据目录")
+    parser.add_argument('--days', type=float, help="只回测最近多少天")
+    parser.add_argument('--min-diff', type=float, default=0.25, help="费率差阈值（百分比）")
+    parser.add_argument('--sweep', type=float, nargs='*', help="比较多个费率差阈值")
+    parser.add_argument('--binance-fee', type=float, default=BINANCE_TAKER_FEE, help="币安吃单手续费（百分比）")
+    parser.add_argument('--hl-fee', type=float, default=HYPERLIQUID_TAKER_FEE, help="Hyperliquid吃单手续费（百分比）")
+    parser.add_argument('--top', type=int, default=20, help="显示收益最高的交易对数量")
+    args = parser.parse_args()
+
+    started = time.time()
+    start_ms = int((time.time() - args.days * 86400) * 1000) if args.days else None
+    panel = load_panel(FundingHistoryStore(args.dir), start_ms=start_ms)
+    backtester = Backtester(panel, binance_fee=args.binance_fee, hl_fee=args.hl_fee)
+    result = backtester.run(args.min_diff)
+    elapsed = time.time() - started
+
+    aggregate = result['aggregate']
+    print(f"\n回测 {len(panel.symbols)} 个交易对 × {len(panel.hours)} 小时，耗时 {elapsed:.2f} 秒")
+    print(f"费率差阈值 {args.min_diff}%: 交易 {aggregate['trades']} 次，持仓 {aggregate['hours_held']} 小时，"
+          f"资金费 {aggregate['funding_pnl']:.4f}%，手续费 {aggregate['fees']:.4f}%，净收益 {aggregate['net_pnl']:.4f}%，"
+          f"平均年化 {aggregate['avg_annual_yield']:.2f}%")
+
+    print(f"\n{'交易对':<12} {'交易次数':>8} {'持仓小时':>8} {'资金费%':>10} {'手续费%':>10} {'净收益%':>10} {'年化%':>10}")
+    ranked = sorted(result['per_symbol'].items(), key=lambda x: x[1]['net_pnl'], reverse=True)
+    for symbol, stats in ranked[:args.top]:
+        print(f"{symbol:<12} {stats['trades']:>8} {stats['hours_held']:>8} {stats['funding_pnl']:>10.4f} "
+              f"{stats['fees']:>10.4f} {stats['net_pnl']:>10.4f} {stats['annual_yield']:>10.2f}")
+
+    if args.sweep:
+        print(f"\n{'阈值%':>8} {'交易对':>8} {'交易次数':>8} {'净收益%':>12} {'平均年化%':>10}")
+        for stats in backtester.sweep(args.sweep):
+            print(f"{stats['min_diff']:>8} {stats['symbols_traded']:>8} {stats['trades']:>8} "
+                  f"{stats['net_pnl']:>12.4f} {stats['avg_annual_yield']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
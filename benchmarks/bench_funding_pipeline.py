@@ -0,0 +1,412 @@
+"""资金费率处理流程的基准测试
+
+用录制（或生成）的接口返回数据代替网络请求，分别测量每个处理阶段的耗时：
+
+    hl_parse        HyperliquidAPI.get_predicted_funding_rates 解析 meta 和 predictedFundings
+    binance_rates   FundingRateMonitor.get_funding_rates 处理 exchangeInfo 和 premiumIndex
+    all_contracts   合并两个交易所的合约列表（app.py 的 build_funding_payload）
+    opportunities   find_arbitrage_opportunities
+    serialize       序列化为 /api/funding_rates 的响应体
+
+用法:
+    python benchmarks/bench_funding_pipeline.py --capture        # 从交易所录制一份数据
+    python benchmarks/bench_funding_pipeline.py --synthetic 300  # 生成300个交易对的模拟数据
+    python benchmarks/bench_funding_pipeline.py --save-baseline  # 运行并把结果保存为基线
+    python benchmarks/bench_funding_pipeline.py                  # 运行并与基线比较
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from arbitrage_scanner import RateUniverse
+from funding_payload import build_all_contracts, count_contracts
+from funding_rate_monitor import FundingRateMonitor
+from funding_snapshot import encode_payload
+from hyperliquid import HyperliquidAPI
+from symbol_registry import SymbolRegistry
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.path.join(BENCH_DIR, 'fixtures')
+RESULT_PATH = os.path.join(BENCH_DIR, 'results', 'latest.json')
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+# 每个数据文件对应的接口
+FIXTURES = {
+    'meta': 'meta.json',                              # Hyperliquid {"type": "meta"}
+    'predicted_fundings': 'predicted_fundings.json',  # Hyperliquid {"type": "predictedFundings"}
+    'exchange_info': 'exchange_info.json',            # Binance /fapi/v1/exchangeInfo
+    'mark_price': 'mark_price.json',                  # Binance /fapi/v1/premiumIndex
+}
+HOUR_MS = 3600 * 1000
+
+
+def capture_fixtures(directory: str):
+    """从交易所公共接口录制一份数据"""
+    import requests
+
+    info_url = "https://api.hyperliquid.xyz/info"
+    fapi_url = "https://fapi.binance.com"
+    payloads = {
+        'meta': requests.post(info_url, json={"type": "meta"}, timeout=10).content,
+        'predicted_fundings': requests.post(info_url, json={"type": "predictedFundings"}, timeout=10).content,
+        'exchange_info': requests.get(f"{fapi_url}/fapi/v1/exchangeInfo", timeout=10).content,
+        'mark_price': requests.get(f"{fapi_url}/fapi/v1/premiumIndex", timeout=10).content,
+    }
+    save_fixtures(directory, payloads, {'source': 'capture'})
+
+
+def synthetic_fixtures(directory: str, size: int = 250, seed: int = 7):
+    """生成与真实接口格式一致的模拟数据
+
+    两个交易所共同上线 size 个币种，其中一部分使用不同的倍数名称（kXXX 与 1000XXXUSDT），
+    另有只在单个交易所上线的币种，费率分布中包含少量满足套利阈值的交易对。
+    """
+    rng = random.Random(seed)
+    now_ms = int(time.time() * 1000)
+    next_hour = now_ms // HOUR_MS * HOUR_MS + HOUR_MS
+    next_binance = now_ms // (8 * HOUR_MS) * (8 * HOUR_MS) + 8 * HOUR_MS
+
+    def name(i: int) -> str:
+        letters = ''
+        i += 26 * 26
+        while i:
+            i, r = divmod(i, 26)
+            letters = chr(ord('A') + r) + letters
+        return letters
+
+    shared = [name(i) for i in range(size)]
+    hl_only = [name(size + i) for i in range(size // 10)]
+    binance_only = [name(size + size // 10 + i) for i in range(size // 2)]
+    scaled = set(shared[::25])
+
+    def hl_coin(base: str) -> str:
+        return f"k{base}" if base in scaled else base
+
+    def binance_symbol(base: str) -> str:
+        return f"1000{base}USDT" if base in scaled else f"{base}USDT"
+
+    def rate(spread: float) -> float:
+        # 大部分费率接近0，少量交易对费率偏离较大
+        value = rng.gauss(0.0001, 0.0002)
+        if rng.random() < 0.05:
+            value += rng.choice((-1, 1)) * spread
+        return round(value, 8)
+
+    meta = {'universe': [
+        {'name': hl_coin(base), 'szDecimals': rng.randint(0, 5), 'maxLeverage': rng.choice((3, 5, 10, 20, 40, 50)),
+         **({'isDelisted': True} if rng.random() < 0.02 else {})}
+        for base in shared + hl_only
+    ]}
+
+    binance_rates = {base: rate(0.005) for base in shared + binance_only}
+    predicted = []
+    for base in shared + hl_only:
+        venues = [['HlPerp', {'fundingRate': str(rate(0.0005)), 'nextFundingTime': next_hour, 'fundingIntervalHours': 1}]]
+        if base in binance_rates:
+            venues.insert(0, ['BinPerp', {'fundingRate': str(binance_rates[base]), 'nextFundingTime': next_binance,
+                                          'fundingIntervalHours': 8}])
+        venues.append(['BybitPerp', {'fundingRate': str(rate(0.005)), 'nextFundingTime': next_binance,
+                                     'fundingIntervalHours': 8}])
+        predicted.append([hl_coin(base), venues])
+
+    exchange_info = {'symbols': []}
+    mark_price = []
+    for base in shared + binance_only:
+        symbol = binance_symbol(base)
+        price = round(rng.lognormvariate(0, 2), 6)
+        exchange_info['symbols'].append({
+            'symbol': symbol,
+            'status': 'TRADING' if rng.random() > 0.02 else 'SETTLING',
+            'baseAsset': symbol[:-4],
+            'quoteAsset': 'USDT',
+            'contractType': 'PERPETUAL',
+            'quantityPrecision': 3,
+            'pricePrecision': 6,
+            'filters': [
+                {'filterType': 'PRICE_FILTER', 'tickSize': '0.000001', 'minPrice': '0.000001', 'maxPrice': '100000'},
+                {'filterType': 'LOT_SIZE', 'stepSize': '0.001', 'minQty': '0.001', 'maxQty': '100000'},
+                {'filterType': 'MIN_NOTIONAL', 'notional': '5'},
+            ]
+        })
+        mark_price.append({
+            'symbol': symbol,
+            'markPrice': str(price),
+            'indexPrice': str(price),
+            'estimatedSettlePrice': str(price),
+            'lastFundingRate': str(binance_rates[base]),
+            'interestRate': '0.00010000',
+            'nextFundingTime': next_binance,
+            'time': now_ms
+        })
+
+    payloads = {
+        'meta': meta,
+        'predicted_fundings': predicted,
+        'exchange_info': exchange_info,
+        'mark_price': mark_price,
+    }
+    save_fixtures(directory, {k: json.dumps(v).encode('utf-8') for k, v in payloads.items()},
+                  {'source': 'synthetic', 'size': size, 'seed': seed})
+
+
+def save_fixtures(directory: str, payloads: Dict[str, bytes], manifest: Dict):
+    os.makedirs(directory, exist_ok=True)
+    for key, body in payloads.items():
+        with open(os.path.join(directory, FIXTURES[key]), 'wb') as f:
+            f.write(body)
+    manifest['captured_at'] = int(time.time() * 1000)
+    with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def load_fixtures(directory: str) -> Dict:
+    """读取数据文件，结算时间按录制时刻平移到当前时间之后，保证每次运行走相同的分支"""
+    with open(os.path.join(directory, 'manifest.json')) as f:
+        manifest = json.load(f)
+    payloads = {}
+    for key, filename in FIXTURES.items():
+        with open(os.path.join(directory, filename), 'rb') as f:
+            payloads[key] = json.loads(f.read())
+
+    shift = int(time.time() * 1000) - manifest['captured_at']
+    shift = (shift // (8 * HOUR_MS) + 1) * 8 * HOUR_MS
+    for item in payloads['mark_price']:
+        if item.get('nextFundingTime'):
+            item['nextFundingTime'] = int(item['nextFundingTime']) + shift
+    for _, venues in payloads['predicted_fundings']:
+        for venue in venues:
+            if isinstance(venue, list) and len(venue) > 1 and isinstance(venue[1], dict) and venue[1].get('nextFundingTime'):
+                venue[1]['nextFundingTime'] = int(venue[1]['nextFundingTime']) + shift
+
+    # 保存为字节串，每次回放都重新解析，与真实请求的开销一致
+    return {
+        'manifest': manifest,
+        'bodies': {key: json.dumps(value).encode('utf-8') for key, value in payloads.items()},
+        'counts': {key: len(value['universe'] if key == 'meta' else value['symbols'] if key == 'exchange_info' else value)
+                   for key, value in payloads.items()}
+    }
+
+
+class ReplayResponse:
+    """按 aiohttp 响应的接口返回录制的数据"""
+
+    def __init__(self, body: bytes):
+        self.status = 200
+        self._body = body
+
+    async def json(self, content_type=None):
+        return json.loads(self._body)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class ReplaySession:
+    """代替 aiohttp.ClientSession，按请求类型回放 Hyperliquid info 接口的数据"""
+
+    def __init__(self, bodies: Dict[str, bytes]):
+        self.bodies = bodies
+
+    def post(self, url, headers=None, json=None):
+        key = 'meta' if json.get('type') == 'meta' else 'predicted_fundings'
+        return ReplayResponse(self.bodies[key])
+
+
+class ReplayClient:
+    """代替 python-binance Client，回放行情接口的数据"""
+
+    def __init__(self, bodies: Dict[str, bytes]):
+        self.bodies = bodies
+
+    def futures_exchange_info(self):
+        return json.loads(self.bodies['exchange_info'])
+
+    def futures_mark_price(self, **params):
+        return json.loads(self.bodies['mark_price'])
+
+
+def measure(fn: Callable, iterations: int, warmup: int) -> Dict:
+    """多次执行并统计耗时（毫秒）"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        'min_ms': round(samples[0], 4),
+        'median_ms': round(statistics.median(samples), 4),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+        'mean_ms': round(statistics.fmean(samples), 4),
+        'iterations': iterations
+    }
+
+
+def run_benchmarks(fixtures: Dict, iterations: int = 50, warmup: int = 5, min_diff: float = 0.25) -> Dict[str, Dict]:
+    """依次测量每个处理阶段，后一阶段使用前一阶段的输出"""
+    bodies = fixtures['bodies']
+    stages = {}
+    loop = asyncio.new_event_loop()
+    hl_api = HyperliquidAPI()
+    monitor = FundingRateMonitor(client=ReplayClient(bodies))
+    try:
+        session = ReplaySession(bodies)
+
+        def hl_parse():
+            # 不使用合约列表缓存，每次都完整解析 meta 和 predictedFundings
+            hl_api._contracts = []
+            return loop.run_until_complete(hl_api.get_predicted_funding_rates(session))
+
+        stages['hl_parse'] = measure(hl_parse, iterations, warmup)
+        hl_rates = hl_parse()
+
+        stages['binance_rates'] = measure(monitor.get_funding_rates, iterations, warmup)
+        binance_rates = monitor.get_funding_rates()
+
+        registry = SymbolRegistry()
+        registry.update_binance(monitor.instruments.instruments)
+        registry.update_hyperliquid([item['name'] for item in json.loads(bodies['meta'])['universe']])
+        resolve = monitor.calendar.resolve
+
+        def all_contracts():
+            return build_all_contracts(hl_rates, binance_rates, registry, resolve)
+
+        stages['all_contracts'] = measure(all_contracts, iterations, warmup)
+        contracts = all_contracts()
+
+        def opportunities():
+            return RateUniverse.from_rates(hl_rates, binance_rates, resolve, registry).opportunities(min_diff)
+
+        stages['opportunities'] = measure(opportunities, iterations, warmup)
+        payload = {
+            'all_contracts': contracts,
+            'contract_counts': count_contracts(contracts),
+            'opportunities': opportunities()
+        }
+
+        stages['serialize'] = measure(lambda: encode_payload(payload), iterations, warmup)
+
+        stages['hl_parse']['items'] = len(hl_rates)
+        stages['binance_rates']['items'] = len(binance_rates)
+        stages['all_contracts']['items'] = len(contracts)
+        stages['opportunities']['items'] = len(payload['opportunities'])
+        stages['serialize']['bytes'] = len(encode_payload(payload))
+    finally:
+        loop.close()
+        hl_api.close()
+        monitor.market_data.close()
+
+    stages['total'] = {'median_ms': round(sum(s['median_ms'] for s in stages.values()), 4)}
+    return stages
+
+
+def compare(stages: Dict[str, Dict], baseline: Optional[Dict], threshold: float) -> Dict[str, Dict]:
+    """按中位数与基线比较，变慢超过 threshold 百分比的阶段标记为退化"""
+    if not baseline:
+        return {}
+    comparison = {}
+    for name, current in stages.items():
+        previous = baseline.get('stages', {}).get(name)
+        if not previous or not previous.get('median_ms'):
+            continue
+        change = (current['median_ms'] - previous['median_ms']) / previous['median_ms'] * 100
+        comparison[name] = {
+            'baseline_ms': previous['median_ms'],
+            'current_ms': current['median_ms'],
+            'change_pct': round(change, 2),
+            'regression': change > threshold
+        }
+    return comparison
+
+
+def write_json(path: str, data: Dict):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="资金费率处理流程的基准测试")
+    parser.add_argument('--fixtures', default=FIXTURE_DIR, help="数据文件目录")
+    parser.add_argument('--capture', action='store_true', help="先从交易所录制一份新数据")
+    parser.add_argument('--synthetic', type=int, metavar='N', help="先生成N个共同交易对的模拟数据")
+    parser.add_argument('--iterations', type=int, default=50, help="每个阶段的测量次数")
+    parser.add_argument('--warmup', type=int, default=5, help="每个阶段的预热次数")
+    parser.add_argument('--output', default=RESULT_PATH, help="结果文件")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="基线结果文件")
+    parser.add_argument('--save-baseline', action='store_true', help="把本次结果保存为基线")
+    parser.add_argument('--threshold', type=float, default=10.0, help="判定为退化的变慢百分比")
+    parser.add_argument('--fail-on-regression', action='store_true', help="有阶段退化时返回非0退出码")
+    args = parser.parse_args()
+
+    if args.capture:
+        capture_fixtures(args.fixtures)
+    elif args.synthetic:
+        synthetic_fixtures(args.fixtures, size=args.synthetic)
+    elif not os.path.exists(os.path.join(args.fixtures, 'manifest.json')):
+        print(f"{args.fixtures} 中没有数据文件，生成默认的模拟数据")
+        synthetic_fixtures(args.fixtures)
+
+    fixtures = load_fixtures(args.fixtures)
+    stages = run_benchmarks(fixtures, iterations=args.iterations, warmup=args.warmup)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    if baseline and baseline.get('fixtures', {}).get('manifest') != fixtures['manifest']:
+        print("警告: 基线使用的数据文件与本次不同，比较结果仅供参考")
+    comparison = compare(stages, baseline, args.threshold)
+
+    result = {
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count()
+        },
+        'fixtures': {'manifest': fixtures['manifest'], 'counts': fixtures['counts']},
+        'stages': stages,
+        'comparison': comparison
+    }
+    write_json(args.output, result)
+    if args.save_baseline:
+        write_json(args.baseline, result)
+
+    print(f"\n{'阶段':<16} {'中位数ms':>10} {'p95 ms':>10} {'最小ms':>10} {'基线ms':>10} {'变化%':>8}")
+    for name, stats in stages.items():
+        diff = comparison.get(name)
+        baseline_text = f"{diff['baseline_ms']:>10.3f}" if diff else f"{'-':>10}"
+        change_text = f"{diff['change_pct']:>+8.1f}" if diff else f"{'-':>8}"
+        flag = '  退化' if diff and diff['regression'] else ''
+        p95_text = f"{stats['p95_ms']:>10.3f}" if 'p95_ms' in stats else f"{'-':>10}"
+        min_text = f"{stats['min_ms']:>10.3f}" if 'min_ms' in stats else f"{'-':>10}"
+        print(f"{name:<16} {stats['median_ms']:>10.3f} {p95_text} {min_text} {baseline_text} {change_text}{flag}")
+    print(f"\n结果已保存到 {args.output}" + (f"，并保存为基线 {args.baseline}" if args.save_baseline else ""))
+
+    if args.fail_on_regression and any(diff['regression'] for diff in comparison.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from ws_stream import WebSocketStream
+from logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+OPEN_ORDER_STATUSES = ('NEW', 'PARTIALLY_FILLED')
+
+
+class BinanceAccountState:
+    """币安U本位合约账户的内存状态：余额、持仓、杠杆和挂单
+
+    由REST全量同步初始化，之后按用户数据流的推送增量更新。
+    """
+
+    def __init__(self, mark_price: Optional[Callable[[str], float]] = None):
+        """
+        Args:
+            mark_price: 按交易对返回最新标记价格的函数（如来自标记价格推送），用于计算未实现盈亏
+        """
+        self.mark_price = mark_price
+        self.balances: Dict[str, Dict[str, float]] = {}
+        self.positions: Dict[str, Dict] = {}
+        self.leverage: Dict[str, int] = {}
+        self.open_orders: Dict[int, Dict] = {}
+        self.synced_at = 0.0
+        self.updated_at = 0.0
+        self._lock = threading.Lock()
+
+    def load(self, account: Dict, open_orders: List[Dict]):
+        """用 futures_account 和 futures_get_open_orders 的结果全量替换状态"""
+        balances = {
+            asset['asset']: {
+                'wallet_balance': float(asset.get('walletBalance', 0)),
+                'cross_wallet_balance': float(asset.get('crossWalletBalance', asset.get('walletBalance', 0)))
+            }
+            for asset in account.get('assets', [])
+        }
+        positions, leverage = {}, {}
+        for position in account.get('positions', []):
+            symbol = position['symbol']
+            if position.get('leverage'):
+                leverage[symbol] = int(position['leverage'])
+            amount = float(position.get('positionAmt', 0))
+            if amount:
+                positions[symbol] = {
+                    'positionAmt': amount,
+                    'entryPrice': float(position.get('entryPrice', 0)),
+                    'unrealizedProfit': float(position.get('unrealizedProfit', position.get('unRealizedProfit', 0))),
+                    'markPrice': float(position.get('markPrice', 0)),
+                    'isolatedMargin': float(position.get('isolatedWallet', position.get('isolatedMargin', 0))),
+                    'isolated': bool(position.get('isolated', False))
+                }
+        orders = {int(o['orderId']): o for o in open_orders}
+        now = time.time()
+        with self._lock:
+            self.balances = balances
+            self.positions = positions
+            self.leverage = leverage
+            self.open_orders = orders
+            self.synced_at = self.updated_at = now
+
+    def apply_account_update(self, update: Dict):
+        """处理 ACCOUNT_UPDATE 推送中的余额和持仓变化"""
+        with self._lock:
+            for balance in update.get('B', []):
+                self.balances[balance['a']] = {
+                    'wallet_balance': float(balance['wb']),
+                    'cross_wallet_balance': float(balance['cw'])
+                }
+            for position in update.get('P', []):
+                # 单向持仓模式下只有 BOTH
+                if position.get('ps', 'BOTH') != 'BOTH':
+                    continue
+                symbol = position['s']
+                amount = float(position['pa'])
+                if not amount:
+                    self.positions.pop(symbol, None)
+                    continue
+                previous = self.positions.get(symbol, {})
+                self.positions[symbol] = {
+                    'positionAmt': amount,
+                    'entryPrice': float(position['ep']),
+                    'unrealizedProfit': float(position.get('up', 0)),
+                    'markPrice': previous.get('markPrice', 0.0),
+                    'isolatedMargin': float(position.get('iw', 0)),
+                    'isolated': position.get('mt') == 'isolated'
+                }
+            self.updated_at = time.time()
+
+    def apply_order_update(self, order: Dict):
+        """处理 ORDER_TRADE_UPDATE 推送，维护未完成的挂单"""
+        order_id = int(order['i'])
+        with self._lock:
+            if order['X'] in OPEN_ORDER_STATUSES:
+                self.open_orders[order_id] = {
+                    'orderId': order_id,
+                    'symbol': order['s'],
+                    'clientOrderId': order.get('c'),
+                    'side': order['S'],
+                    'type': order['o'],
+                    'timeInForce': order.get('f'),
+                    'origQty': order['q'],
+                    'price': order['p'],
+                    'executedQty': order.get('z', '0'),
+                    'status': order['X'],
+                    'reduceOnly': order.get('R', False),
+                    'updateTime': order.get('T')
+                }
+            else:
+                self.open_orders.pop(order_id, None)
+            self.updated_at = time.time()
+
+    def apply_marks(self, position_info: List[Dict]):
+        """用 futures_position_information 的结果更新持仓的标记价格和未实现盈亏
+
+        futures_account 和 ACCOUNT_UPDATE 推送都不带标记价格，持仓数量仍以推送为准。
+        """
+        with self._lock:
+            for item in position_info:
+                position = self.positions.get(item['symbol'])
+                if position is None or item.get('positionSide', 'BOTH') != 'BOTH':
+                    continue
+                position['markPrice'] = float(item.get('markPrice', 0))
+                position['unrealizedProfit'] = float(item.get('unRealizedProfit', 0))
+            self.updated_at = time.time()
+
+    def set_leverage(self, symbol: str, leverage: int):
+        with self._lock:
+            self.leverage[symbol] = int(leverage)
+            self.updated_at = time.time()
+
+    def balance(self, asset: str = 'USDT') -> float:
+        """钱包余额"""
+        return self.balances.get(asset, {}).get('wallet_balance', 0.0)
+
+    def _position_view(self, symbol: str, position: Dict) -> Dict:
+        amount = position['positionAmt']
+        mark = self.mark_price(symbol) if self.mark_price else 0.0
+        if mark:
+            unrealized = amount * (mark - position['entryPrice'])
+        else:
+            mark, unrealized = position['markPrice'], position['unrealizedProfit']
+        return {
+            'symbol': symbol,
+            'positionSide': 'LONG' if amount > 0 else 'SHORT',
+            'positionAmt': abs(amount),
+            'entryPrice': position['entryPrice'],
+            'unrealizedProfit': unrealized,
+            'leverage': self.leverage.get(symbol, 0),
+            'markPrice': mark,
+            'isolatedMargin': position['isolatedMargin'],
+            'notional': abs(amount * mark)
+        }
+
+    def position(self, symbol: str) -> Optional[Dict]:
+        """指定交易对的持仓，格式与 BinanceTrader.get_all_positions 相同，没有持仓返回None"""
+        position = self.positions.get(symbol)
+        return self._position_view(symbol, position) if position else None
+
+    def all_positions(self) -> List[Dict]:
+        return [self._position_view(symbol, position) for symbol, position in list(self.positions.items())]
+
+    def signed_amount(self, symbol: str) -> float:
+        """带方向的持仓数量，多为正、空为负"""
+        position = self.positions.get(symbol)
+        return position['positionAmt'] if position else 0.0
+
+
+class BinanceUserDataStream(WebSocketStream):
+    """币安用户数据流：申请listenKey并定期续期，按推送更新账户状态
+
+    每次(重)连接后通过REST全量同步一次，断线期间的变化不会丢失；同步完成前 is_ready() 为False，
+    调用方应回退到REST接口。
+    """
+
+    # listenKey 60分钟未续期即失效，每30分钟续期一次
+    KEEPALIVE_INTERVAL = 30 * 60
+    # 没有标记价格来源时，有持仓期间通过REST刷新标记价格的间隔（秒）
+    MARK_REFRESH_INTERVAL = 5.0
+
+    def __init__(self, client, ws_base_url: str, state: Optional[BinanceAccountState] = None,
+                 on_leverage: Optional[Callable[[str, int], None]] = None):
+        """
+        Args:
+            client: python-binance 的 Client 对象（需要API密钥）
+            ws_base_url: WebSocket基础地址，如 wss://fstream.binance.com/ws
+            state: 账户状态，不传则新建
+            on_leverage: 杠杆变化时的回调 (symbol, leverage)，用于同步杠杆缓存
+        """
+        # 用户数据流只在账户变化时推送，不能按消息间隔判断连接是否过期，依靠心跳检测断线
+        super().__init__(ws_base_url, name="币安用户数据", stale_after=24 * 3600)
+        self.client = client
+        self.ws_base_url = ws_base_url.rstrip('/')
+        self.state = state or BinanceAccountState()
+        self.on_leverage = on_leverage
+        self.listen_key: Optional[str] = None
+        self.synced = False
+        self._keepalive_thread: Optional[threading.Thread] = None
+
+    def start(self):
+        super().start()
+        if self._keepalive_thread is None or not self._keepalive_thread.is_alive():
+            self._keepalive_thread = threading.Thread(target=self._keepalive, name=f"{self.name}-keepalive",
+                                                      daemon=True)
+            self._keepalive_thread.start()
+            if self.state.mark_price is None:
+                threading.Thread(target=self._refresh_marks_loop, name=f"{self.name}-marks", daemon=True).start()
+
+    def stop(self):
+        super().stop()
+        if self.listen_key:
+            try:
+                self.client.futures_stream_close(self.listen_key)
+            except Exception:
+                pass
+
+    def is_ready(self) -> bool:
+        """已连接且完成了本次连接后的全量同步"""
+        return self.connected and self.synced
+
+    def connect_url(self) -> str:
+        self.synced = False
+        # 已有有效的listenKey时交易所会返回同一个key并延长有效期
+        self.listen_key = self.client.futures_stream_get_listen_key()
+        return f"{self.ws_base_url}/{self.listen_key}"
+
+    def resync(self):
+        """通过REST全量同步余额、持仓、杠杆和挂单"""
+        account = self.client.futures_account()
+        open_orders = self.client.futures_get_open_orders()
+        self.state.load(account, open_orders)
+        self.refresh_marks()
+        if self.on_leverage:
+            for symbol, leverage in self.state.leverage.items():
+                self.on_leverage(symbol, leverage)
+        logger.info("%s 已同步: %d 个持仓，%d 个挂单", self.name, len(self.state.positions), len(self.state.open_orders))
+
+    def refresh_marks(self):
+        """有持仓时通过REST更新标记价格和未实现盈亏"""
+        if self.state.positions:
+            self.state.apply_marks(self.client.futures_position_information())
+
+    def on_connected(self):
+        try:
+            self.resync()
+        except Exception:
+            # 同步失败时断开重连，避免在不完整的状态上继续应用推送
+            self.reconnect()
+            raise
+        self.synced = True
+
+    def on_message(self, message):
+        event = message.get('e')
+        if event == 'ACCOUNT_UPDATE':
+            self.state.apply_account_update(message.get('a', {}))
+        elif event == 'ORDER_TRADE_UPDATE':
+            self.state.apply_order_update(message.get('o', {}))
+        elif event == 'ACCOUNT_CONFIG_UPDATE':
+            config = message.get('ac')
+            if config:
+                self.state.set_leverage(config['s'], config['l'])
+                if self.on_leverage:
+                    self.on_leverage(config['s'], int(config['l']))
+        elif event == 'listenKeyExpired':
+            logger.warning("%s listenKey已过期，重新连接", self.name)
+            self.reconnect()
+        elif event == 'MARGIN_CALL':
+            logger.warning("%s 收到追加保证金通知: %s", self.name, message)
+
+    def reconnect(self):
+        """断开当前连接，重连时重新申请listenKey并同步"""
+        self.synced = False
+        if self._ws:
+            try:
+                self._ws.close()
+            except Exception:
+                pass
+
+    def _keepalive(self):
+        while not self._stop_event.wait(self.KEEPALIVE_INTERVAL):
+            if not self.listen_key:
+                continue
+            try:
+                self.client.futures_stream_keepalive(self.listen_key)
+            except Exception as e:
+                logger.warning("%s listenKey续期失败，重新连接: %s", self.name, e)
+                self.reconnect()
+
+    def _refresh_marks_loop(self):
+        while not self._stop_event.wait(self.MARK_REFRESH_INTERVAL):
+            if not self.is_ready():
+                continue
+            try:
+                self.refresh_marks()
+            except Exception as e:
+                logger.debug("%s 刷新标记价格失败: %s", self.name, e)
@@ -3,16 +3,35 @@ import json
 import time
 import hmac
 import hashlib
-from binance.client import Client
+from concurrent.futures import ThreadPoolExecutor
 from binance.enums import *
 from typing import Dict, Optional, Union, List
+from instrument_cache import InstrumentCache
+from leverage_cache import LeverageCache, prewarm
+from binance_account import BinanceAccountState, BinanceUserDataStream
+from exchange_endpoints import create_binance_client
+from metrics import instrument_binance_client
+from logging_setup import get_logger
+
+logger = get_logger(__name__)
 
 class BinanceTrader:
-    def __init__(self):
-        """初始化BinanceTrader"""
+    def __init__(self, instruments: Optional[InstrumentCache] = None):
+        """初始化BinanceTrader
+
+        Args:
+            instruments: 共享的交易对元数据缓存，不传则自行创建
+        """
         self.load_config()
-        self.client = Client(api_key=self.api_key, api_secret=self.api_secret, testnet=self.testnet)
+        self.client = instrument_binance_client(
+            create_binance_client(api_key=self.api_key, api_secret=self.api_secret, testnet=self.testnet)
+        )
+        self.instruments = instruments or InstrumentCache(self.client)
+        # 各交易对当前生效的杠杆，下单时杠杆未变化则不再发送设置请求
+        self.leverage = LeverageCache()
         self.ws_base_url = "wss://fstream.binance.com/ws" if not self.testnet else "wss://stream.binancefuture.com/ws"
+        # 用户数据流维护的账户状态，未启动或未同步时查询走REST
+        self.user_stream: Optional[BinanceUserDataStream] = None
         
         # 定义订单类型常量
         self.ORDER_TYPE_LIMIT = 'LIMIT'
@@ -24,6 +43,7 @@ class BinanceTrader:
         # 优先从环境变量获取
         self.api_key = os.getenv('BINANCE_API_KEY')
         self.api_secret = os.getenv('BINANCE_API_SECRET')
+        self.testnet = os.getenv('BINANCE_TESTNET', '').lower() in ('1', 'true')
 
         # 如果环境变量中没有，则从配置文件获取
         if not self.api_key or not self.api_secret:
@@ -40,8 +60,35 @@ class BinanceTrader:
         if not self.api_key or not self.api_secret:
             raise Exception("未找到API密钥")
 
+    def start_user_stream(self, mark_price=None) -> BinanceUserDataStream:
+        """启动用户数据流，之后余额、持仓和挂单查询直接读取推送维护的账户状态
+
+        Args:
+            mark_price: 按交易对返回最新标记价格的函数，用于计算持仓的未实现盈亏
+        """
+        if self.user_stream is None:
+            self.user_stream = BinanceUserDataStream(
+                self.client, self.ws_base_url, state=BinanceAccountState(mark_price=mark_price),
+                on_leverage=self.leverage.set
+            )
+        self.user_stream.start()
+        return self.user_stream
+
+    def stop_user_stream(self):
+        if self.user_stream:
+            self.user_stream.stop()
+
+    def _account_state(self) -> Optional[BinanceAccountState]:
+        """用户数据流已连接并同步时返回账户状态，否则返回None"""
+        if self.user_stream and self.user_stream.is_ready():
+            return self.user_stream.state
+        return None
+
     def get_account_balance(self) -> float:
         """获取账户USDT余额"""
+        state = self._account_state()
+        if state:
+            return state.balance('USDT')
         try:
             account_info = self.client.futures_account()
             # 获取账户总余额
@@ -75,15 +122,20 @@ class BinanceTrader:
                 - unrealizedProfit: 未实现盈亏
                 - leverage: 杠杆倍数
         """
+        state = self._account_state()
+        if state:
+            return state.position(symbol)
         try:
             # 获取持仓风险信息
             positions = self.client.futures_position_information(symbol=symbol)
-            print(f"获取到的持仓风险信息: {positions}")  # 添加调试信息
+            logger.debug("获取到的持仓风险信息: %s", positions)
             
-            # 获取当前杠杆倍数
-            leverage_info = self.client.futures_leverage_bracket(symbol=symbol)
-            current_leverage = int(leverage_info[0]['brackets'][0]['initialLeverage'])
-            print(f"当前杠杆倍数: {current_leverage}")  # 添加调试信息
+            # 获取当前杠杆倍数，杠杆缓存中没有时再查询
+            current_leverage = self.leverage.get(symbol)
+            if current_leverage is None:
+                leverage_info = self.client.futures_leverage_bracket(symbol=symbol)
+                current_leverage = int(leverage_info[0]['brackets'][0]['initialLeverage'])
+            logger.debug("当前杠杆倍数: %s", current_leverage)
             
             for position in positions:
                 if float(position['positionAmt']) != 0:  # 有持仓
@@ -94,12 +146,12 @@ class BinanceTrader:
                         'positionAmt': abs(position_amt),
                         'entryPrice': float(position['entryPrice']),
                         'unrealizedProfit': float(position['unRealizedProfit']),
-                        'leverage': current_leverage  # 使用从leverage_brackets获取的杠杆倍数
+                        'leverage': current_leverage
                     }
             return None
         except Exception as e:
             error_msg = str(e)
-            print(f"获取持仓信息失败，错误信息: {error_msg}")  # 添加错误日志
+            logger.error("获取持仓信息失败，错误信息: %s", error_msg)
             if 'API-key format invalid' in error_msg:
                 raise Exception("API密钥格式无效，请检查API密钥是否正确配置")
             elif 'Invalid API-key' in error_msg:
@@ -119,17 +171,10 @@ class BinanceTrader:
             Dict: 交易对信息，包含精度等信息
         """
         try:
-            exchange_info = self.client.futures_exchange_info()
-            for symbol_info in exchange_info['symbols']:
-                if symbol_info['symbol'] == symbol:
-                    return {
-                        'quantityPrecision': int(symbol_info['quantityPrecision']),
-                        'pricePrecision': int(symbol_info['pricePrecision']),
-                        'minQty': float([f for f in symbol_info['filters'] if f['filterType'] == 'LOT_SIZE'][0]['minQty']),
-                        'maxQty': float([f for f in symbol_info['filters'] if f['filterType'] == 'LOT_SIZE'][0]['maxQty']),
-                        'stepSize': float([f for f in symbol_info['filters'] if f['filterType'] == 'LOT_SIZE'][0]['stepSize'])
-                    }
-            raise Exception(f"未找到交易对 {symbol} 的信息")
+            symbol_info = self.instruments.get(symbol)
+            if symbol_info is None:
+                raise Exception(f"未找到交易对 {symbol} 的信息")
+            return dict(symbol_info)
         except Exception as e:
             raise Exception(f"获取交易对信息失败: {str(e)}")
 
@@ -183,6 +228,44 @@ class BinanceTrader:
         except Exception as e:
             raise Exception(f"获取最大杠杆倍数失败: {str(e)}")
 
+    def load_leverage(self) -> int:
+        """从账户的交易对配置加载当前杠杆，初始化杠杆缓存
+
+        Returns:
+            int: 加载的交易对数量
+        """
+        try:
+            configs = self.client.futures_symbol_config()
+        except Exception as e:
+            logger.warning("获取交易对配置失败，改用账户信息中的杠杆: %s", e)
+            configs = self.client.futures_account().get('positions', [])
+        leverage = {c['symbol']: int(c['leverage']) for c in configs if c.get('leverage')}
+        self.leverage.seed(leverage)
+        return len(leverage)
+
+    def ensure_leverage(self, symbol: str, leverage: int) -> bool:
+        """杠杆与缓存不一致时设置杠杆
+
+        Returns:
+            bool: 是否实际发送了设置请求
+        """
+        return self.leverage.ensure(
+            symbol, leverage, lambda s, l: self.client.futures_change_leverage(symbol=s, leverage=l)
+        )
+
+    def prewarm_leverage(self, symbols: List[str], leverage: int, max_workers: int = 8) -> Dict[str, int]:
+        """并发把一组交易对的杠杆设置为目标值（超过交易对最大杠杆时取最大杠杆）
+
+        Returns:
+            Dict[str, int]: 统计 {'changed', 'unchanged', 'failed'}
+        """
+        max_leverage = {
+            item['symbol']: int(item['brackets'][0]['initialLeverage'])
+            for item in self.client.futures_leverage_bracket()
+        }
+        return prewarm(symbols, lambda s: min(leverage, max_leverage[s]) if s in max_leverage else None,
+                       self.ensure_leverage, max_workers)
+
     def place_order(self, symbol: str, side: str, quantity: float = None,
                    leverage: int = 1, order_type: str = 'MARKET',
                    price: Optional[float] = None, usdt_amount: float = None,
@@ -203,136 +286,205 @@ class BinanceTrader:
             Dict: 订单信息
         """
         try:
-            # 参数验证
-            if not symbol or not isinstance(symbol, str):
-                raise ValueError("交易对名称无效")
-            
-            if side not in ['BUY', 'SELL']:
-                raise ValueError("交易方向必须是 'BUY' 或 'SELL'")
-            
-            if order_type not in [self.ORDER_TYPE_MARKET, self.ORDER_TYPE_LIMIT]:
-                raise ValueError("订单类型必须是 'MARKET' 或 'LIMIT'")
-            
-            if order_type == self.ORDER_TYPE_LIMIT and (not price or price <= 0):
-                raise ValueError("限价单必须指定有效价格")
+            order_params = self.prepare_order(symbol, side, quantity, leverage, order_type, price, usdt_amount,
+                                              reduce_only)
+            return self.submit_order(order_params)
+        except ValueError as e:
+            raise Exception(str(e))
+        except Exception as e:
+            if isinstance(e, Exception) and str(e).startswith("下单失败"):
+                raise e
+            raise Exception(f"下单失败: {str(e)}")
 
-            if quantity is None and usdt_amount is None:
-                raise ValueError("quantity和usdt_amount必须指定一个")
-            
-            if quantity is not None and usdt_amount is not None:
-                raise ValueError("quantity和usdt_amount只能指定一个")
+    def prepare_order(self, symbol: str, side: str, quantity: float = None,
+                      leverage: int = 1, order_type: str = 'MARKET',
+                      price: Optional[float] = None, usdt_amount: float = None,
+                      reduce_only: bool = False) -> Dict:
+        """完成下单前的准备：校验参数、按USDT金额计算数量并设置杠杆
 
-            if usdt_amount is not None and usdt_amount <= 0:
-                raise ValueError("USDT金额必须大于0")
-            
-            # 准备订单参数
-            order_params = {
-                'symbol': symbol,
-                'side': side,
-                'positionSide': 'BOTH',  # 使用单向持仓模式
-                'reduceOnly': reduce_only  # 添加reduceOnly参数
-            }
+        参数与 place_order 相同，返回可直接传给 submit_order 的订单参数，
+        这样真正发送订单时只需要一次请求。
 
-            # 如果指定了USDT金额，使用U本位合约的下单参数
-            if usdt_amount is not None:
-                # 获取当前价格
-                current_price = float(self.client.futures_mark_price(symbol=symbol)['markPrice'])
-                # 计算合约数量（向下取整到最小精度）
-                symbol_info = self.get_symbol_info(symbol)
-                contract_qty = usdt_amount / current_price
-                contract_qty = float(int(contract_qty * 10 ** symbol_info['quantityPrecision']) / 10 ** symbol_info['quantityPrecision'])
-                order_params['quantity'] = contract_qty
-            else:
-                order_params['quantity'] = quantity
-
-            # 如果是限价单，添加价格和 timeInForce
-            if order_type == self.ORDER_TYPE_LIMIT:
-                order_params.update({
-                    'type': self.ORDER_TYPE_LIMIT,
-                    'price': price,
-                    'timeInForce': self.TIME_IN_FORCE_GTC
-                })
+        Returns:
+            Dict: futures_create_order 的参数
+        """
+        # 参数验证
+        if not symbol or not isinstance(symbol, str):
+            raise ValueError("交易对名称无效")
+        
+        if side not in ['BUY', 'SELL']:
+            raise ValueError("交易方向必须是 'BUY' 或 'SELL'")
+        
+        if order_type not in [self.ORDER_TYPE_MARKET, self.ORDER_TYPE_LIMIT]:
+            raise ValueError("订单类型必须是 'MARKET' 或 'LIMIT'")
+        
+        if order_type == self.ORDER_TYPE_LIMIT and (not price or price <= 0):
+            raise ValueError("限价单必须指定有效价格")
+
+        if quantity is None and usdt_amount is None:
+            raise ValueError("quantity和usdt_amount必须指定一个")
+        
+        if quantity is not None and usdt_amount is not None:
+            raise ValueError("quantity和usdt_amount只能指定一个")
+
+        if usdt_amount is not None and usdt_amount <= 0:
+            raise ValueError("USDT金额必须大于0")
+        
+        # 准备订单参数
+        order_params = {
+            'symbol': symbol,
+            'side': side,
+            'type': order_type,
+            'positionSide': 'BOTH',  # 使用单向持仓模式
+            'reduceOnly': reduce_only  # 添加reduceOnly参数
+        }
+
+        # 如果指定了USDT金额，使用U本位合约的下单参数
+        if usdt_amount is not None:
+            # 获取当前价格
+            current_price = float(self.client.futures_mark_price(symbol=symbol)['markPrice'])
+            # 计算合约数量（向下取整到最小精度）
+            symbol_info = self.get_symbol_info(symbol)
+            contract_qty = usdt_amount / current_price
+            contract_qty = float(int(contract_qty * 10 ** symbol_info['quantityPrecision']) / 10 ** symbol_info['quantityPrecision'])
+            order_params['quantity'] = contract_qty
+        else:
+            order_params['quantity'] = quantity
+
+        # 如果是限价单，添加价格和 timeInForce
+        if order_type == self.ORDER_TYPE_LIMIT:
+            order_params.update({
+                'price': price,
+                'timeInForce': self.TIME_IN_FORCE_GTC
+            })
+        
+        # 设置杠杆（如果需要）
+        if leverage > 1:
+            try:
+                self.ensure_leverage(symbol, leverage)
+            except Exception as e:
+                logger.warning("设置杠杆失败，使用默认杠杆: %s", e)
+
+        order_params['leverage'] = leverage
+        return order_params
+
+    def submit_order(self, order_params: Dict) -> Dict:
+        """发送 prepare_order 准备好的订单
+
+        Returns:
+            Dict: 订单信息
+        """
+        params = dict(order_params)
+        leverage = params.pop('leverage', 1)
+        try:
+            return self.client.futures_create_order(**params)
+        except Exception as e:
+            # 杠杆可能已在别处被修改，下次下单时重新设置
+            self.leverage.invalidate(params.get('symbol'))
+            error_msg = str(e)
+            if 'insufficient balance' in error_msg.lower():
+                raise Exception("余额不足")
+            elif 'price less than' in error_msg.lower():
+                raise Exception("价格太低")
+            elif 'price more than' in error_msg.lower():
+                raise Exception("价格太高")
+            elif 'lot size' in error_msg.lower():
+                raise Exception("数量不符合最小交易单位要求")
+            elif 'maximum allowable position' in error_msg.lower():
+                raise Exception(f"当前杠杆{leverage}倍下超过最大允许持仓量")
             else:
-                order_params['type'] = self.ORDER_TYPE_MARKET
-            
-            # 设置杠杆（如果需要）
-            if leverage > 1:
-                try:
-                    self.client.futures_change_leverage(symbol=symbol, leverage=leverage)
-                except Exception as e:
-                    print(f"设置杠杆失败，使用默认杠杆: {str(e)}")
-            
-            # 发送订单
+                raise Exception(f"下单失败: {error_msg}")
+
+    # 批量下单接口每次最多5个订单
+    BATCH_ORDER_SIZE = 5
+
+    def close_all_positions(self) -> List[Dict]:
+        """按同一份持仓快照一次性平掉所有持仓
+
+        每个持仓生成一个只减仓的市价单，每5个一组通过批量下单接口并发提交。
+
+        Returns:
+            List[Dict]: 每个交易对的结果 {'symbol', 'status', 'data' 或 'message'}
+        """
+        state = self._account_state()
+        if state:
+            amounts = {symbol: position['positionAmt'] for symbol, position in list(state.positions.items())}
+        else:
+            amounts = {
+                p['symbol']: float(p['positionAmt'])
+                for p in self.client.futures_position_information() if float(p['positionAmt']) != 0
+            }
+        orders = []
+        for symbol, amount in amounts.items():
+            info = self.instruments.get(symbol)
+            precision = info['quantityPrecision'] if info else 8
+            orders.append({
+                'symbol': symbol,
+                'side': 'SELL' if amount > 0 else 'BUY',
+                'type': 'MARKET',
+                'quantity': f"{abs(amount):.{precision}f}",
+                'reduceOnly': 'true'
+            })
+        if not orders:
+            return []
+        logger.info("批量平仓 %d 个持仓", len(orders))
+
+        batches = [orders[i:i + self.BATCH_ORDER_SIZE] for i in range(0, len(orders), self.BATCH_ORDER_SIZE)]
+
+        def submit(batch: List[Dict]) -> List[Dict]:
             try:
-                if order_type == self.ORDER_TYPE_MARKET:
-                    response = self.client.futures_create_order(
-                        symbol=symbol,
-                        side=side,
-                        type=order_type,
-                        quantity=order_params['quantity'],
-                        positionSide='BOTH',
-                        reduceOnly=reduce_only
-                    )
-                else:  # LIMIT order
-                    response = self.client.futures_create_order(
-                        symbol=symbol,
-                        side=side,
-                        type=order_type,
-                        quantity=order_params['quantity'],
-                        positionSide='BOTH',
-                        reduceOnly=reduce_only,
-                        price=price,
-                        timeInForce=self.TIME_IN_FORCE_GTC
-                    )
-                return response
+                responses = self.client.futures_place_batch_order(batchOrders=batch)
             except Exception as e:
-                error_msg = str(e)
-                if 'insufficient balance' in error_msg.lower():
-                    raise Exception("余额不足")
-                elif 'price less than' in error_msg.lower():
-                    raise Exception("价格太低")
-                elif 'price more than' in error_msg.lower():
-                    raise Exception("价格太高")
-                elif 'lot size' in error_msg.lower():
-                    raise Exception("数量不符合最小交易单位要求")
-                elif 'maximum allowable position' in error_msg.lower():
-                    raise Exception(f"当前杠杆{leverage}倍下超过最大允许持仓量")
+                return [{'symbol': o['symbol'], 'status': 'error', 'message': f"平仓失败: {e}"} for o in batch]
+            results = []
+            for order, response in zip(batch, responses):
+                if 'code' in response and 'orderId' not in response:
+                    results.append({'symbol': order['symbol'], 'status': 'error',
+                                    'message': f"平仓失败: {response.get('msg')}"})
                 else:
-                    raise Exception(f"下单失败: {error_msg}")
-            
-        except ValueError as e:
-            raise Exception(str(e))
-        except Exception as e:
-            if isinstance(e, Exception) and str(e).startswith("下单失败"):
-                raise e
-            raise Exception(f"下单失败: {str(e)}")
+                    results.append({'symbol': order['symbol'], 'status': 'success', 'data': response})
+            return results
+
+        with ThreadPoolExecutor(max_workers=len(batches), thread_name_prefix="binance-close-all") as pool:
+            results = [result for batch_results in pool.map(submit, batches) for result in batch_results]
+        failed = [r['symbol'] for r in results if r['status'] != 'success']
+        if failed:
+            logger.error("批量平仓失败的交易对: %s", failed)
+        return results
 
     def close_position(self, symbol: str) -> Dict:
         """平仓指定交易对的持仓"""
         try:
-            # 获取当前持仓信息
-            positions = self.client.futures_position_information(symbol=symbol)
-            if not positions:
-                raise ValueError(f"未找到{symbol}的持仓信息")
-            
-            position = None
-            for pos in positions:
-                if float(pos['positionAmt']) != 0:
-                    position = pos
-                    break
-                    
-            if not position:
-                raise ValueError("当前没有持仓")
-            
-            print(f"获取到的持仓信息: {position}")
-            
-            # 获取持仓数量和方向
-            position_amt = float(position['positionAmt'])
+            state = self._account_state()
+            if state:
+                # 用户数据流已同步时直接使用推送维护的持仓数量
+                position_amt = state.signed_amount(symbol)
+                if not position_amt:
+                    raise ValueError("当前没有持仓")
+            else:
+                # 获取当前持仓信息
+                positions = self.client.futures_position_information(symbol=symbol)
+                if not positions:
+                    raise ValueError(f"未找到{symbol}的持仓信息")
+
+                position = None
+                for pos in positions:
+                    if float(pos['positionAmt']) != 0:
+                        position = pos
+                        break
+
+                if not position:
+                    raise ValueError("当前没有持仓")
+
+                logger.debug("获取到的持仓信息: %s", position)
+
+                # 获取持仓数量和方向
+                position_amt = float(position['positionAmt'])
             
             # 确定平仓方向
             side = "SELL" if position_amt > 0 else "BUY"
             
-            print(f"平仓方向: {side}, 持仓数量: {abs(position_amt)}")
+            logger.info("平仓方向: %s, 持仓数量: %s", side, abs(position_amt))
             
             # 执行市价平仓
             response = self.client.futures_create_order(
@@ -343,11 +495,11 @@ class BinanceTrader:
                 positionSide='BOTH'  # 使用单向持仓模式
             )
             
-            print(f"平仓订单响应: {response}")
+            logger.info("平仓订单响应: %s", response)
             return response
             
         except Exception as e:
-            print(f"平仓失败: {str(e)}")
+            logger.error("平仓失败: %s", e)
             raise ValueError(f"平仓失败: {str(e)}")
 
     def get_symbol_price(self, symbol: str) -> float:
@@ -402,19 +554,32 @@ class BinanceTrader:
                 
         except Exception as e:
             error_msg = str(e)
-            print(f"WebSocket请求失败: {error_msg}")
+            logger.error("WebSocket请求失败: %s", error_msg)
             raise Exception(f"获取账户信息失败: {error_msg}")
 
+    def get_open_orders(self, symbol: Optional[str] = None) -> List[Dict]:
+        """获取未完成的挂单"""
+        state = self._account_state()
+        if state:
+            orders = list(state.open_orders.values())
+            return [o for o in orders if o['symbol'] == symbol] if symbol else orders
+        if symbol:
+            return self.client.futures_get_open_orders(symbol=symbol)
+        return self.client.futures_get_open_orders()
+
     def get_all_positions(self):
         """获取所有持仓信息"""
+        state = self._account_state()
+        if state:
+            return state.all_positions()
         try:
-            print("开始获取持仓信息...")  # 添加日志
+            logger.debug("开始获取持仓信息...")
             # 使用get_position_risk获取所有持仓信息
             positions = self.client.futures_position_information()
-            print(f"原始持仓数据: {positions}")  # 添加调试信息
+            logger.debug("原始持仓数据: %s", positions)
             
             if not positions:
-                print("警告：获取到的持仓数据为空")
+                logger.warning("获取到的持仓数据为空")
                 return []
             
             # 过滤出有持仓的仓位
@@ -436,14 +601,14 @@ class BinanceTrader:
                             'notional': abs(float(position.get('notional', 0)))
                         })
                 except Exception as e:
-                    print(f"处理持仓数据时出错: {str(e)}, 持仓数据: {position}")
+                    logger.error("处理持仓数据时出错: %s, 持仓数据: %s", e, position)
                     continue
             
-            print(f"处理后的持仓数据: {active_positions}")  # 添加调试信息
+            logger.debug("处理后的持仓数据: %s", active_positions)
             return active_positions
         except Exception as e:
             error_msg = str(e)
-            print(f"获取持仓信息失败: {error_msg}")  # 保留原有的错误日志
+            logger.error("获取持仓信息失败: %s", error_msg)
             
             if 'API-key format invalid' in error_msg:
                 raise Exception("API密钥格式无效，请检查API密钥是否正确配置")
@@ -476,12 +641,12 @@ class BinanceTrader:
         try:
             # 获取用户的手续费率
             commission_info = self.client.futures_commission_rate(symbol="BTCUSDT")  # 可以用任意交易对，费率是统一的
-            print(f"获取到的手续费信息: {commission_info}")
+            logger.debug("获取到的手续费信息: %s", commission_info)
             
             return {
                 'maker': float(commission_info['makerCommissionRate']),  # maker费率
                 'taker': float(commission_info['takerCommissionRate']),  # taker费率
             }
         except Exception as e:
-            print(f"获取手续费率失败: {str(e)}")
+            logger.error("获取手续费率失败: %s", e)
             raise Exception(f"获取手续费率失败: {str(e)}") 
\ No newline at end of file
@@ -0,0 +1,35 @@
+import os
+
+from binance.client import Client
+
+# 交易所REST接口地址，设置环境变量后所有客户端都改为访问该地址（如本地模拟器 exchange_simulator.py）
+# BINANCE_FAPI_URL=http://127.0.0.1:8900  HYPERLIQUID_API_URL=http://127.0.0.1:8900
+BINANCE_URL_OVERRIDE = os.getenv('BINANCE_FAPI_URL', '').rstrip('/')
+HYPERLIQUID_URL_OVERRIDE = os.getenv('HYPERLIQUID_API_URL', '').rstrip('/')
+
+BINANCE_FAPI_URL = BINANCE_URL_OVERRIDE or "https://fapi.binance.com"
+HYPERLIQUID_API_URL = HYPERLIQUID_URL_OVERRIDE or "https://api.hyperliquid.xyz"
+HYPERLIQUID_INFO_URL = f"{HYPERLIQUID_API_URL}/info"
+
+
+def create_binance_client(**kwargs) -> Client:
+    """创建 python-binance 的 Client，设置了 BINANCE_FAPI_URL 时主网和测试网请求都发往该地址"""
+    if not BINANCE_URL_OVERRIDE:
+        return Client(**kwargs)
+    # 构造时的ping请求固定访问现货主网，先关闭，改完地址后再检查连通性
+    ping = kwargs.pop('ping', True)
+    client = Client(ping=False, **kwargs)
+    client.API_URL = client.API_TESTNET_URL = f"{BINANCE_URL_OVERRIDE}/api"
+    client.FUTURES_URL = client.FUTURES_TESTNET_URL = f"{BINANCE_URL_OVERRIDE}/fapi"
+    if ping:
+        client.ping()
+    return client
+
+
+def apply_hyperliquid_urls(exchange):
+    """设置了 HYPERLIQUID_API_URL 时，把ccxt的Hyperliquid交易所对象指向该地址"""
+    if HYPERLIQUID_URL_OVERRIDE:
+        urls = {'public': HYPERLIQUID_URL_OVERRIDE, 'private': HYPERLIQUID_URL_OVERRIDE}
+        exchange.urls['api'] = dict(urls)
+        exchange.urls['test'] = dict(urls)
+    return exchange
@@ -0,0 +1,1061 @@
+"""本地交易所模拟器
+
+在本机提供币安U本位合约（/fapi）和Hyperliquid（/info、/exchange）的REST接口，
+供离线环境下对Flask应用和下单流程做端到端压测，把我们自己的开销与交易所的耗时分开测量。
+
+    python exchange_simulator.py --port 8900 --latency 30 --jitter 10 --error-rate 0.01
+    BINANCE_FAPI_URL=http://127.0.0.1:8900 HYPERLIQUID_API_URL=http://127.0.0.1:8900 python app.py
+
+支持配置延迟、随机错误和按权重计算的限流（返回429），成交按标记价格加固定滑点确定性撮合。
+/sim/ 下的管理接口可以查看状态、重置账户、调整配置和价格。WebSocket行情不在模拟范围内，
+推送连接失败时应用会自动回退到REST接口。
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qsl, urlparse
+
+from logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+HOUR_MS = 3600 * 1000
+BINANCE_FUNDING_INTERVAL_MS = 8 * HOUR_MS
+
+# (统一名称, 币安交易对, Hyperliquid币种, 价格, 币安最大杠杆, Hyperliquid最大杠杆, Hyperliquid数量小数位)
+DEFAULT_MARKETS = [
+    ('BTC', 'BTCUSDT', 'BTC', 65000.0, 125, 40, 5),
+    ('ETH', 'ETHUSDT', 'ETH', 3200.0, 100, 25, 4),
+    ('SOL', 'SOLUSDT', 'SOL', 150.0, 50, 20, 2),
+    ('DOGE', 'DOGEUSDT', 'DOGE', 0.15, 50, 20, 0),
+    ('PEPE', '1000PEPEUSDT', 'kPEPE', 0.012, 25, 10, 0),
+]
+
+
+class SimMarket(NamedTuple):
+    """两个交易所共同上线的一个合约，价格按各自交易所的合约单位计"""
+    coin: str
+    binance_symbol: str
+    hl_coin: str
+    price: float
+    binance_max_leverage: int
+    hl_max_leverage: int
+    sz_decimals: int
+
+
+class VenueConfig:
+    """单个交易所的故障注入配置"""
+
+    FIELDS = ('latency_ms', 'jitter_ms', 'error_rate', 'weight_limit')
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 weight_limit: int = 0):
+        """
+        Args:
+            latency_ms: 每个请求的固定延迟（毫秒）
+            jitter_ms: 在固定延迟上叠加的 0~jitter_ms 随机延迟
+            error_rate: 返回5xx错误的概率
+            weight_limit: 每分钟的请求权重上限，超过后返回429，0表示不限流
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.weight_limit = weight_limit
+
+    def update(self, values: Dict):
+        for key in self.FIELDS:
+            if key in values:
+                setattr(self, key, type(getattr(self, key))(values[key]))
+
+    def to_dict(self) -> Dict:
+        return {key: getattr(self, key) for key in self.FIELDS}
+
+
+class WeightWindow:
+    """按自然分钟统计请求权重，与币安 X-MBX-USED-WEIGHT-1M 的口径一致"""
+
+    def __init__(self):
+        self.minute = 0
+        self.used = 0
+
+    def consume(self, weight: int, limit: int, now: float) -> Tuple[bool, int, float]:
+        """
+        Returns:
+            Tuple[bool, int, float]: (是否允许, 本分钟已用权重, 距离窗口重置的秒数)
+        """
+        minute = int(now // 60)
+        if minute != self.minute:
+            self.minute = minute
+            self.used = 0
+        retry_after = 60 - now % 60
+        if limit and self.used + weight > limit:
+            return False, self.used, retry_after
+        self.used += weight
+        return True, self.used, retry_after
+
+
+class SimError(Exception):
+    """业务错误，按交易所各自的格式返回"""
+
+    def __init__(self, code: int, message: str, status: int = 400):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.status = status
+
+
+class Position:
+    def __init__(self):
+        self.qty = 0.0          # 正数为多，负数为空
+        self.entry_price = 0.0
+
+
+class Account:
+    """单个交易所的模拟账户"""
+
+    def __init__(self, balance: float):
+        self.balance = balance
+        self.positions: Dict[str, Position] = {}
+        self.leverage: Dict[str, int] = {}
+        self.orders: Dict[int, Dict] = {}
+        self.fees_paid = 0.0
+        self.realized_pnl = 0.0
+
+
+class MatchingEngine:
+    """确定性撮合引擎
+
+    吃单按当前标记价格加减固定滑点成交，可立即成交的限价单同样按该价格成交，
+    其余GTC限价单挂单等待，价格更新后重新检查。相同的价格和下单顺序总是得到相同的结果。
+    """
+
+    def __init__(self, markets: List[SimMarket], balance: float = 10000.0, slippage_bps: float = 1.0,
+                 fees: Optional[Dict[str, Tuple[float, float]]] = None):
+        """
+        Args:
+            markets: 模拟的合约列表
+            balance: 每个交易所的初始余额
+            slippage_bps: 吃单滑点（基点）
+            fees: 每个交易所的 (挂单费率, 吃单费率)
+        """
+        self.markets = {m.coin: m for m in markets}
+        self.initial_balance = balance
+        self.slippage_bps = slippage_bps
+        self.fees = fees or {'binance': (0.0002, 0.0005), 'hyperliquid': (0.0001, 0.00035)}
+        self.prices: Dict[str, float] = {m.coin: m.price for m in markets}
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        """清空持仓和订单，恢复初始余额"""
+        with self._lock:
+            self.accounts = {venue: Account(self.initial_balance) for venue in ('binance', 'hyperliquid')}
+            self._next_order_id = 1000
+
+    def mark_price(self, venue: str, coin: str) -> float:
+        """按交易所合约单位计的标记价格"""
+        return self.prices[coin]
+
+    def set_prices(self, prices: Dict[str, float]):
+        """更新标记价格，并撮合价格穿过的挂单"""
+        with self._lock:
+            for coin, price in prices.items():
+                if coin in self.prices:
+                    self.prices[coin] = float(price)
+            for venue, account in self.accounts.items():
+                for order_id, order in list(account.orders.items()):
+                    fill_price = self._taker_price(venue, order['coin'], order['is_buy'])
+                    if self._crosses(order['is_buy'], order['price'], fill_price):
+                        del account.orders[order_id]
+                        self._fill(venue, order['coin'], order['is_buy'], order['qty'], order['price'], maker=True)
+
+    def _taker_price(self, venue: str, coin: str, is_buy: bool) -> float:
+        slippage = self.slippage_bps / 10000
+        price = self.mark_price(venue, coin)
+        return price * (1 + slippage) if is_buy else price * (1 - slippage)
+
+    @staticmethod
+    def _crosses(is_buy: bool, limit_price: float, fill_price: float) -> bool:
+        return limit_price >= fill_price if is_buy else limit_price <= fill_price
+
+    def position(self, venue: str, coin: str) -> Position:
+        return self.accounts[venue].positions.setdefault(coin, Position())
+
+    def leverage(self, venue: str, coin: str) -> int:
+        market = self.markets[coin]
+        default = min(20, market.binance_max_leverage if venue == 'binance' else market.hl_max_leverage)
+        return self.accounts[venue].leverage.get(coin, default)
+
+    def set_leverage(self, venue: str, coin: str, leverage: int):
+        market = self.markets[coin]
+        max_leverage = market.binance_max_leverage if venue == 'binance' else market.hl_max_leverage
+        if leverage < 1 or leverage > max_leverage:
+            raise SimError(-4028, f"Leverage {leverage} is not valid")
+        with self._lock:
+            self.accounts[venue].leverage[coin] = leverage
+
+    def _fill(self, venue: str, coin: str, is_buy: bool, qty: float, price: float, maker: bool = False):
+        """按成交价格更新持仓、已实现盈亏和手续费"""
+        account = self.accounts[venue]
+        position = self.position(venue, coin)
+        signed = qty if is_buy else -qty
+        realized = 0.0
+        if position.qty and (position.qty > 0) != is_buy:
+            closed = min(abs(position.qty), qty)
+            direction = 1 if position.qty > 0 else -1
+            realized = closed * (price - position.entry_price) * direction
+        new_qty = position.qty + signed
+        if abs(new_qty) < 1e-12:
+            position.qty, position.entry_price = 0.0, 0.0
+        elif position.qty == 0 or (position.qty > 0) == (new_qty > 0) and (position.qty > 0) == is_buy:
+            # 开仓或加仓，按数量加权计算开仓均价
+            position.entry_price = (abs(position.qty) * position.entry_price + qty * price) / abs(new_qty)
+            position.qty = new_qty
+        elif (position.qty > 0) != (new_qty > 0):
+            # 反手：剩余部分以成交价为开仓价
+            position.qty, position.entry_price = new_qty, price
+        else:
+            position.qty = new_qty
+        fee = qty * price * self.fees[venue][0 if maker else 1]
+        account.balance += realized - fee
+        account.realized_pnl += realized
+        account.fees_paid += fee
+
+    def place_order(self, venue: str, coin: str, is_buy: bool, qty: float, order_type: str = 'MARKET',
+                    price: Optional[float] = None, reduce_only: bool = False, tif: str = 'GTC') -> Dict:
+        """下单并立即撮合
+
+        Returns:
+            Dict: order_id, status (FILLED/NEW/EXPIRED), executed_qty, avg_price, price
+        """
+        if coin not in self.markets:
+            raise SimError(-1121, "Invalid symbol.")
+        if qty <= 0:
+            raise SimError(-4003, "Quantity less than or equal to zero.")
+        with self._lock:
+            position = self.position(venue, coin)
+            if reduce_only:
+                if not position.qty or (position.qty > 0) == is_buy:
+                    raise SimError(-2022, "ReduceOnly Order is rejected.")
+                qty = min(qty, abs(position.qty))
+
+            self._next_order_id += 1
+            order_id = self._next_order_id
+            fill_price = self._taker_price(venue, coin, is_buy)
+            result = {'order_id': order_id, 'executed_qty': 0.0, 'avg_price': 0.0,
+                      'price': price if price is not None else 0.0, 'qty': qty}
+
+            if order_type.upper() == 'MARKET' or self._crosses(is_buy, price, fill_price):
+                self._fill(venue, coin, is_buy, qty, fill_price)
+                result.update(status='FILLED', executed_qty=qty, avg_price=fill_price)
+            elif tif.upper() in ('IOC', 'FOK'):
+                result['status'] = 'EXPIRED'
+            else:
+                self.accounts[venue].orders[order_id] = {
+                    'order_id': order_id, 'coin': coin, 'is_buy': is_buy, 'qty': qty, 'price': price,
+                    'reduce_only': reduce_only, 'time': int(time.time() * 1000)
+                }
+                result['status'] = 'NEW'
+            return result
+
+    def cancel_order(self, venue: str, order_id: int) -> Dict:
+        with self._lock:
+            order = self.accounts[venue].orders.pop(order_id, None)
+        if order is None:
+            raise SimError(-2011, "Unknown order sent.")
+        return order
+
+    def unrealized_pnl(self, venue: str, coin: str) -> float:
+        position = self.position(venue, coin)
+        return position.qty * (self.mark_price(venue, coin) - position.entry_price)
+
+    def open_positions(self, venue: str) -> List[Tuple[str, Position]]:
+        with self._lock:
+            return [(coin, p) for coin, p in self.accounts[venue].positions.items() if p.qty]
+
+    def state(self) -> Dict:
+        """账户、持仓和挂单的快照"""
+        with self._lock:
+            return {
+                venue: {
+                    'balance': account.balance,
+                    'realized_pnl': account.realized_pnl,
+                    'fees_paid': account.fees_paid,
+                    'positions': {
+                        coin: {'qty': p.qty, 'entry_price': p.entry_price,
+                               'unrealized_pnl': self.unrealized_pnl(venue, coin)}
+                        for coin, p in account.positions.items() if p.qty
+                    },
+                    'leverage': dict(account.leverage),
+                    'open_orders': list(account.orders.values())
+                }
+                for venue, account in self.accounts.items()
+            }
+
+
+def build_markets(extra: int = 0, seed: int = 1) -> List[SimMarket]:
+    """默认合约列表，另外按种子生成 extra 个合约"""
+    markets = [SimMarket(*item) for item in DEFAULT_MARKETS]
+    rng = random.Random(seed)
+    for i in range(extra):
+        coin = f"SIM{i:03d}"
+        markets.append(SimMarket(coin, f"{coin}USDT", coin, round(rng.lognormvariate(0, 1.5), 4),
+                                 rng.choice((20, 25, 50, 75)), rng.choice((3, 5, 10, 20)), rng.randint(0, 3)))
+    return markets
+
+
+class ExchangeSimulator:
+    """模拟器服务：请求路由、故障注入和两个交易所的接口实现"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8900, markets: Optional[List[SimMarket]] = None,
+                 seed: int = 1, binance: Optional[VenueConfig] = None, hyperliquid: Optional[VenueConfig] = None,
+                 engine: Optional[MatchingEngine] = None, history_days: int = 30):
+        """
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示随机端口
+            markets: 模拟的合约列表，默认 build_markets()
+            seed: 随机种子，决定资金费率、延迟抖动和错误注入的序列
+            binance: 币安接口的故障注入配置
+            hyperliquid: Hyperliquid接口的故障注入配置
+            engine: 撮合引擎，默认按 markets 创建
+            history_days: 历史资金费率接口提供的天数
+        """
+        self.markets = markets or build_markets()
+        self.seed = seed
+        self.engine = engine or MatchingEngine(self.markets)
+        self.config = {'binance': binance or VenueConfig(), 'hyperliquid': hyperliquid or VenueConfig()}
+        self.history_days = history_days
+        self.by_binance = {m.binance_symbol: m for m in self.markets}
+        self.by_hl = {m.hl_coin: m for m in self.markets}
+        self.hl_assets = {m.hl_coin: i for i, m in enumerate(self.markets)}
+        self.funding = {m.coin: self._initial_funding(m.coin) for m in self.markets}
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._windows = {'binance': WeightWindow(), 'hyperliquid': WeightWindow()}
+        self._stats_lock = threading.Lock()
+        self.stats: Dict[str, Dict] = {}
+        self.server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self.server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'ExchangeSimulator':
+        """在后台线程中启动服务"""
+        self._thread = threading.Thread(target=self.server.serve_forever, name="exchange-simulator", daemon=True)
+        self._thread.start()
+        logger.info("交易所模拟器已启动: %s", self.url)
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    # ---- 资金费率 ----
+
+    def _initial_funding(self, coin: str) -> Dict[str, float]:
+        """每个合约的初始资金费率（小数），少数合约两边相差较大，形成套利机会"""
+        rng = random.Random(f"{self.seed}:funding:{coin}")
+        hl_rate = rng.gauss(0.0000125, 0.00002)
+        binance_rate = rng.gauss(0.0001, 0.0001)
+        if rng.random() < 0.3:
+            binance_rate += rng.choice((-1, 1)) * 0.004
+        return {'hyperliquid': round(hl_rate, 8), 'binance': round(binance_rate, 8)}
+
+    def historical_rate(self, venue: str, coin: str, funding_time: int) -> float:
+        """某次已结算的资金费率，同一时间点每次返回相同的值"""
+        rng = random.Random(f"{self.seed}:{venue}:{coin}:{funding_time}")
+        base = self.funding[coin][venue]
+        return round(base + rng.gauss(0, abs(base) * 0.5 + 0.00001), 8)
+
+    @staticmethod
+    def next_binance_funding(now_ms: int) -> int:
+        return (now_ms // BINANCE_FUNDING_INTERVAL_MS + 1) * BINANCE_FUNDING_INTERVAL_MS
+
+    @staticmethod
+    def next_hl_funding(now_ms: int) -> int:
+        return (now_ms // HOUR_MS + 1) * HOUR_MS
+
+    # ---- 故障注入 ----
+
+    def _record(self, venue: str, endpoint: str, outcome: str):
+        key = f"{venue} {endpoint}"
+        with self._stats_lock:
+            entry = self.stats.setdefault(key, {'requests': 0, 'errors': 0, 'rate_limited': 0})
+            entry['requests'] += 1
+            if outcome != 'ok':
+                entry[outcome] += 1
+
+    def inject(self, venue: str, weight: int) -> Tuple[Optional[str], Dict[str, str]]:
+        """按配置施加延迟、限流和随机错误
+
+        Returns:
+            Tuple[Optional[str], Dict[str, str]]: (None/'rate_limited'/'errors', 需要附加的响应头)
+        """
+        config = self.config[venue]
+        with self._rng_lock:
+            jitter = self._rng.random() * config.jitter_ms
+            roll = self._rng.random()
+            allowed, used, retry_after = self._windows[venue].consume(weight, config.weight_limit, time.time())
+        delay = (config.latency_ms + jitter) / 1000
+        if delay > 0:
+            time.sleep(delay)
+        headers = {'X-MBX-USED-WEIGHT-1M': str(used)} if venue == 'binance' else {}
+        if not allowed:
+            headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+            return 'rate_limited', headers
+        if roll < config.error_rate:
+            return 'errors', headers
+        return None, headers
+
+    # ---- 币安 ----
+
+    BINANCE_WEIGHTS = {'exchangeInfo': 1, 'premiumIndex': 10, 'fundingRate': 1, 'account': 5, 'positionRisk': 5,
+                       'leverageBracket': 1, 'batchOrders': 5, 'openOrders': 40}
+
+    def handle_binance(self, method: str, path: str, params: Dict) -> Tuple[int, object]:
+        parts = path.strip('/').split('/')
+        # /fapi/v1/order -> order，/api/v3/ping -> ping
+        endpoint = '/'.join(parts[2:])
+        now_ms = int(time.time() * 1000)
+
+        if endpoint in ('ping',):
+            return 200, {}
+        if endpoint == 'time':
+            return 200, {'serverTime': now_ms}
+        if endpoint == 'exchangeInfo':
+            return 200, self.binance_exchange_info(now_ms)
+        if endpoint == 'premiumIndex':
+            symbol = params.get('symbol')
+            if symbol:
+                return 200, self.binance_premium_index(self._binance_market(symbol), now_ms)
+            return 200, [self.binance_premium_index(m, now_ms) for m in self.markets]
+        if endpoint == 'fundingRate':
+            return 200, self.binance_funding_history(params, now_ms)
+        if endpoint == 'account':
+            return 200, self.binance_account(now_ms)
+        if endpoint == 'positionRisk':
+            return 200, self.binance_positions(params.get('symbol'), now_ms)
+        if endpoint == 'leverageBracket':
+            markets = [self._binance_market(params['symbol'])] if params.get('symbol') else self.markets
+            brackets = [{
+                'symbol': m.binance_symbol,
+                'notionalCoef': 1.0,
+                'brackets': [{'bracket': 1, 'initialLeverage': m.binance_max_leverage, 'notionalCap': 5000000,
+                              'notionalFloor': 0, 'maintMarginRatio': 0.004, 'cum': 0.0}]
+            } for m in markets]
+            return 200, brackets
+        if endpoint == 'symbolConfig':
+            markets = [self._binance_market(params['symbol'])] if params.get('symbol') else self.markets
+            return 200, [{'symbol': m.binance_symbol, 'marginType': 'CROSSED', 'isAutoAddMargin': 'false',
+                          'leverage': self.engine.leverage('binance', m.coin), 'maxNotionalValue': '5000000'}
+                         for m in markets]
+        if endpoint == 'leverage' and method == 'POST':
+            market = self._binance_market(params.get('symbol'))
+            leverage = int(params.get('leverage', 0))
+            self.engine.set_leverage('binance', market.coin, leverage)
+            return 200, {'leverage': leverage, 'maxNotionalValue': '5000000', 'symbol': market.binance_symbol}
+        if endpoint == 'commissionRate':
+            maker, taker = self.engine.fees['binance']
+            return 200, {'symbol': params.get('symbol', ''), 'makerCommissionRate': str(maker),
+                         'takerCommissionRate': str(taker)}
+        if endpoint == 'order' and method == 'POST':
+            return 200, self.binance_order(params, now_ms)
+        if endpoint == 'order' and method == 'DELETE':
+            order = self.engine.cancel_order('binance', int(params.get('orderId', 0)))
+            market = self.by_binance_coin(order['coin'])
+            return 200, self._binance_order_response(market, params, order['order_id'], 'CANCELED', order['qty'],
+                                                     0.0, order['price'], now_ms)
+        if endpoint == 'batchOrders' and method == 'POST':
+            results = []
+            for order in json.loads(params.get('batchOrders') or '[]'):
+                try:
+                    results.append(self.binance_order(order, now_ms))
+                except SimError as e:
+                    results.append({'code': e.code, 'msg': e.message})
+            return 200, results
+        if endpoint == 'openOrders':
+            return 200, [
+                self._binance_order_response(self.by_binance_coin(o['coin']),
+                                             {'side': 'BUY' if o['is_buy'] else 'SELL', 'type': 'LIMIT'},
+                                             o['order_id'], 'NEW', o['qty'], 0.0, o['price'], o['time'])
+                for o in self.engine.state()['binance']['open_orders']
+                if not params.get('symbol') or self.by_binance_coin(o['coin']).binance_symbol == params['symbol']
+            ]
+        if endpoint == 'listenKey':
+            if method == 'POST':
+                return 200, {'listenKey': uuid.uuid4().hex}
+            return 200, {}
+        raise SimError(-1000, f"Unsupported endpoint {method} {path}", status=404)
+
+    def by_binance_coin(self, coin: str) -> SimMarket:
+        return self.engine.markets[coin]
+
+    def _binance_market(self, symbol: Optional[str]) -> SimMarket:
+        market = self.by_binance.get(symbol or '')
+        if market is None:
+            raise SimError(-1121, "Invalid symbol.")
+        return market
+
+    def binance_exchange_info(self, now_ms: int) -> Dict:
+        symbols = []
+        for m in self.markets:
+            price_precision = max(0, 6 - len(str(int(m.price))))
+            quantity_precision = max(0, min(3, len(str(int(m.price))) - 1))
+            symbols.append({
+                'symbol': m.binance_symbol,
+                'pair': m.binance_symbol,
+                'contractType': 'PERPETUAL',
+                'status': 'TRADING',
+                'baseAsset': m.binance_symbol[:-4],
+                'quoteAsset': 'USDT',
+                'marginAsset': 'USDT',
+                'pricePrecision': price_precision,
+                'quantityPrecision': quantity_precision,
+                'filters': [
+                    {'filterType': 'PRICE_FILTER', 'minPrice': '0', 'maxPrice': '10000000',
+                     'tickSize': format(10 ** -price_precision, f'.{price_precision}f')},
+                    {'filterType': 'LOT_SIZE', 'minQty': format(10 ** -quantity_precision, f'.{quantity_precision}f'),
+                     'maxQty': '10000000', 'stepSize': format(10 ** -quantity_precision, f'.{quantity_precision}f')},
+                    {'filterType': 'MIN_NOTIONAL', 'notional': '5'},
+                ]
+            })
+        return {'timezone': 'UTC', 'serverTime': now_ms, 'rateLimits': [
+            {'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'MINUTE', 'intervalNum': 1,
+             'limit': self.config['binance'].weight_limit or 2400}
+        ], 'assets': [{'asset': 'USDT', 'marginAvailable': True}], 'symbols': symbols}
+
+    def binance_premium_index(self, m: SimMarket, now_ms: int) -> Dict:
+        price = self.engine.mark_price('binance', m.coin)
+        return {
+            'symbol': m.binance_symbol,
+            'markPrice': f"{price:.8f}",
+            'indexPrice': f"{price:.8f}",
+            'estimatedSettlePrice': f"{price:.8f}",
+            'lastFundingRate': f"{self.funding[m.coin]['binance']:.8f}",
+            'interestRate': '0.00010000',
+            'nextFundingTime': self.next_binance_funding(now_ms),
+            'time': now_ms
+        }
+
+    def binance_funding_history(self, params: Dict, now_ms: int) -> List[Dict]:
+        market = self._binance_market(params.get('symbol'))
+        limit = min(int(params.get('limit', 100)), 1000)
+        end = min(int(params.get('endTime', now_ms)), now_ms)
+        first = self.next_binance_funding(now_ms - self.history_days * 24 * HOUR_MS)
+        start = max(int(params.get('startTime', 0)), first)
+        if 'startTime' not in params:
+            start = max(first, end - limit * BINANCE_FUNDING_INTERVAL_MS)
+        funding_time = -(-start // BINANCE_FUNDING_INTERVAL_MS) * BINANCE_FUNDING_INTERVAL_MS
+        rows = []
+        while funding_time <= end and len(rows) < limit:
+            rows.append({
+                'symbol': market.binance_symbol,
+                'fundingTime': funding_time,
+                'fundingRate': f"{self.historical_rate('binance', market.coin, funding_time):.8f}",
+                'markPrice': f"{market.price:.8f}"
+            })
+            funding_time += BINANCE_FUNDING_INTERVAL_MS
+        return rows
+
+    def binance_account(self, now_ms: int) -> Dict:
+        state = self.engine.state()['binance']
+        unrealized = sum(p['unrealized_pnl'] for p in state['positions'].values())
+        margin = sum(abs(p['qty']) * self.engine.mark_price('binance', coin) / self.engine.leverage('binance', coin)
+                     for coin, p in state['positions'].items())
+        balance = state['balance']
+        asset = {
+            'asset': 'USDT',
+            'walletBalance': f"{balance:.8f}",
+            'unrealizedProfit': f"{unrealized:.8f}",
+            'marginBalance': f"{balance + unrealized:.8f}",
+            'initialMargin': f"{margin:.8f}",
+            'availableBalance': f"{balance + unrealized - margin:.8f}",
+            'maxWithdrawAmount': f"{balance + unrealized - margin:.8f}",
+            'updateTime': now_ms
+        }
+        return {
+            'totalWalletBalance': asset['walletBalance'],
+            'totalUnrealizedProfit': asset['unrealizedProfit'],
+            'totalMarginBalance': asset['marginBalance'],
+            'totalInitialMargin': asset['initialMargin'],
+            'availableBalance': asset['availableBalance'],
+            'maxWithdrawAmount': asset['maxWithdrawAmount'],
+            'assets': [asset],
+            'positions': self.binance_positions(None, now_ms)
+        }
+
+    def binance_positions(self, symbol: Optional[str], now_ms: int) -> List[Dict]:
+        if symbol:
+            market = self._binance_market(symbol)
+            coins = [(market.coin, self.engine.position('binance', market.coin))]
+        else:
+            coins = self.engine.open_positions('binance')
+        positions = []
+        for coin, position in coins:
+            market = self.engine.markets[coin]
+            price = self.engine.mark_price('binance', coin)
+            leverage = self.engine.leverage('binance', coin)
+            notional = position.qty * price
+            positions.append({
+                'symbol': market.binance_symbol,
+                'positionSide': 'BOTH',
+                'positionAmt': f"{position.qty:.8f}",
+                'entryPrice': f"{position.entry_price:.8f}",
+                'breakEvenPrice': f"{position.entry_price:.8f}",
+                'markPrice': f"{price:.8f}",
+                'unRealizedProfit': f"{self.engine.unrealized_pnl('binance', coin):.8f}",
+                'liquidationPrice': '0',
+                'leverage': str(leverage),
+                'marginType': 'cross',
+                'isolatedMargin': '0.00000000',
+                'isolatedWallet': '0',
+                'notional': f"{notional:.8f}",
+                'initialMargin': f"{abs(notional) / leverage:.8f}",
+                'marginAsset': 'USDT',
+                'updateTime': now_ms
+            })
+        return positions
+
+    def binance_order(self, params: Dict, now_ms: int) -> Dict:
+        market = self._binance_market(params.get('symbol'))
+        side = str(params.get('side', '')).upper()
+        if side not in ('BUY', 'SELL'):
+            raise SimError(-1102, "Mandatory parameter 'side' was not sent, was empty/null, or malformed.")
+        order_type = str(params.get('type', 'MARKET')).upper()
+        qty = float(params.get('quantity', 0))
+        price = float(params['price']) if params.get('price') else None
+        if order_type == 'LIMIT' and price is None:
+            raise SimError(-1102, "Mandatory parameter 'price' was not sent, was empty/null, or malformed.")
+        reduce_only = str(params.get('reduceOnly', 'false')).lower() == 'true'
+        mark = self.engine.mark_price('binance', market.coin)
+        if not reduce_only and qty * (price or mark) < 5:
+            raise SimError(-4164, "Order's notional must be no smaller than 5 (unless you choose reduce only).")
+        result = self.engine.place_order('binance', market.coin, side == 'BUY', qty, order_type, price,
+                                         reduce_only, params.get('timeInForce', 'GTC'))
+        return self._binance_order_response(market, params, result['order_id'], result['status'], result['qty'],
+                                            result['executed_qty'], result['price'], now_ms, result['avg_price'])
+
+    @staticmethod
+    def _binance_order_response(market: SimMarket, params: Dict, order_id: int, status: str, qty: float,
+                                executed_qty: float, price: float, now_ms: int, avg_price: float = 0.0) -> Dict:
+        return {
+            'orderId': order_id,
+            'symbol': market.binance_symbol,
+            'status': status,
+            'clientOrderId': params.get('newClientOrderId', f"sim{order_id}"),
+            'price': f"{price or 0:.8f}",
+            'avgPrice': f"{avg_price:.8f}",
+            'origQty': f"{qty:.8f}",
+            'executedQty': f"{executed_qty:.8f}",
+            'cumQuote': f"{executed_qty * avg_price:.8f}",
+            'timeInForce': params.get('timeInForce', 'GTC'),
+            'type': str(params.get('type', 'MARKET')).upper(),
+            'origType': str(params.get('type', 'MARKET')).upper(),
+            'reduceOnly': str(params.get('reduceOnly', 'false')).lower() == 'true',
+            'closePosition': False,
+            'side': str(params.get('side', '')).upper(),
+            'positionSide': 'BOTH',
+            'stopPrice': '0',
+            'workingType': 'CONTRACT_PRICE',
+            'priceProtect': False,
+            'updateTime': now_ms
+        }
+
+    # ---- Hyperliquid ----
+
+    HL_WEIGHTS = {'l2Book': 2, 'allMids': 2, 'clearinghouseState': 2, 'orderStatus': 2,
+                  'spotClearinghouseState': 2, 'exchangeStatus': 2, 'fundingHistory': 20}
+
+    def _hl_market(self, coin: Optional[str]) -> SimMarket:
+        market = self.by_hl.get(coin or '')
+        if market is None:
+            raise SimError(0, f"Unknown coin {coin}")
+        return market
+
+    def hl_meta(self) -> Dict:
+        return {'universe': [
+            {'name': m.hl_coin, 'szDecimals': m.sz_decimals, 'maxLeverage': m.hl_max_leverage, 'onlyIsolated': False}
+            for m in self.markets
+        ]}
+
+    def hl_asset_ctx(self, m: SimMarket) -> Dict:
+        price = self.engine.mark_price('hyperliquid', m.coin)
+        return {
+            'funding': f"{self.funding[m.coin]['hyperliquid']:.8f}",
+            'openInterest': '1000.0',
+            'prevDayPx': f"{price:.6g}",
+            'dayNtlVlm': '1000000.0',
+            'premium': '0.0',
+            'oraclePx': f"{price:.6g}",
+            'markPx': f"{price:.6g}",
+            'midPx': f"{price:.6g}",
+            'impactPxs': [f"{price * 0.9999:.6g}", f"{price * 1.0001:.6g}"],
+            'dayBaseVlm': '1000.0'
+        }
+
+    def handle_hl_info(self, body: Dict) -> object:
+        info_type = body.get('type')
+        now_ms = int(time.time() * 1000)
+        if info_type == 'meta':
+            return self.hl_meta()
+        if info_type == 'metaAndAssetCtxs':
+            if body.get('dex'):
+                return [{'universe': []}, []]
+            return [self.hl_meta(), [self.hl_asset_ctx(m) for m in self.markets]]
+        if info_type == 'spotMeta':
+            return self.hl_spot_meta()
+        if info_type == 'spotMetaAndAssetCtxs':
+            return [self.hl_spot_meta(), []]
+        if info_type == 'perpDexs':
+            return [None]
+        if info_type == 'allMids':
+            return {m.hl_coin: f"{self.engine.mark_price('hyperliquid', m.coin):.6g}" for m in self.markets}
+        if info_type == 'predictedFundings':
+            next_binance = self.next_binance_funding(now_ms)
+            next_hl = self.next_hl_funding(now_ms)
+            return [
+                [m.hl_coin, [
+                    ['BinPerp', {'fundingRate': f"{self.funding[m.coin]['binance']:.8f}",
+                                 'nextFundingTime': next_binance, 'fundingIntervalHours': 8}],
+                    ['HlPerp', {'fundingRate': f"{self.funding[m.coin]['hyperliquid']:.8f}",
+                                'nextFundingTime': next_hl, 'fundingIntervalHours': 1}],
+                ]]
+                for m in self.markets
+            ]
+        if info_type == 'fundingHistory':
+            return self.hl_funding_history(body, now_ms)
+        if info_type == 'l2Book':
+            market = self._hl_market(body.get('coin'))
+            price = self.engine.mark_price('hyperliquid', market.coin)
+            step = price * 0.0001
+            return {'coin': market.hl_coin, 'time': now_ms, 'levels': [
+                [{'px': f"{price - step * (i + 1):.6g}", 'sz': '100.0', 'n': 1} for i in range(20)],
+                [{'px': f"{price + step * (i + 1):.6g}", 'sz': '100.0', 'n': 1} for i in range(20)],
+            ]}
+        if info_type == 'clearinghouseState':
+            return self.hl_clearinghouse_state(now_ms)
+        if info_type == 'spotClearinghouseState':
+            return {'balances': [{'coin': 'USDC', 'token': 0, 'hold': '0.0', 'total': '0.0', 'entryNtl': '0.0'}]}
+        if info_type in ('openOrders', 'frontendOpenOrders'):
+            return [{
+                'coin': self.engine.markets[o['coin']].hl_coin,
+                'side': 'B' if o['is_buy'] else 'A',
+                'limitPx': f"{o['price']:.6g}",
+                'sz': f"{o['qty']}",
+                'oid': o['order_id'],
+                'timestamp': o['time'],
+                'origSz': f"{o['qty']}",
+                'reduceOnly': o['reduce_only'],
+                'orderType': 'Limit',
+                'tif': 'Gtc'
+            } for o in self.engine.state()['hyperliquid']['open_orders']]
+        if info_type == 'userFees':
+            maker, taker = self.engine.fees['hyperliquid']
+            return {'userCrossRate': str(taker), 'userAddRate': str(maker), 'dailyUserVlm': [],
+                    'feeSchedule': {'cross': str(taker), 'add': str(maker)}}
+        if info_type == 'exchangeStatus':
+            return {'time': now_ms, 'specialStatuses': None}
+        if info_type == 'userAbstraction':
+            return 'default'
+        raise SimError(0, f"Unsupported info type {info_type}", status=422)
+
+    @staticmethod
+    def hl_spot_meta() -> Dict:
+        return {'universe': [], 'tokens': [{
+            'name': 'USDC', 'szDecimals': 8, 'weiDecimals': 8, 'index': 0,
+            'tokenId': '0x6d1e7cde53ba9467b783cb7c530ce054', 'isCanonical': True,
+            'evmContract': None, 'fullName': None
+        }]}
+
+    def hl_funding_history(self, body: Dict, now_ms: int) -> List[Dict]:
+        market = self._hl_market(body.get('coin'))
+        first = self.next_hl_funding(now_ms - self.history_days * 24 * HOUR_MS)
+        start = max(int(body.get('startTime', 0)), first)
+        end = min(int(body.get('endTime') or now_ms), now_ms)
+        funding_time = -(-start // HOUR_MS) * HOUR_MS
+        rows = []
+        while funding_time <= end and len(rows) < 500:
+            rows.append({
+                'coin': market.hl_coin,
+                'fundingRate': f"{self.historical_rate('hyperliquid', market.coin, funding_time):.8f}",
+                'premium': '0.0',
+                'time': funding_time
+            })
+            funding_time += HOUR_MS
+        return rows
+
+    def hl_clearinghouse_state(self, now_ms: int) -> Dict:
+        state = self.engine.state()['hyperliquid']
+        positions = []
+        total_ntl = margin_used = unrealized_total = 0.0
+        for coin, p in state['positions'].items():
+            market = self.engine.markets[coin]
+            price = self.engine.mark_price('hyperliquid', coin)
+            leverage = self.engine.leverage('hyperliquid', coin)
+            value = abs(p['qty']) * price
+            margin = value / leverage
+            total_ntl += value
+            margin_used += margin
+            unrealized_total += p['unrealized_pnl']
+            positions.append({'type': 'oneWay', 'position': {
+                'coin': market.hl_coin,
+                'szi': f"{p['qty']}",
+                'leverage': {'type': 'cross', 'value': leverage},
+                'entryPx': f"{p['entry_price']:.6g}",
+                'positionValue': f"{value:.6f}",
+                'unrealizedPnl': f"{p['unrealized_pnl']:.6f}",
+                'returnOnEquity': f"{p['unrealized_pnl'] / margin if margin else 0:.6f}",
+                'liquidationPx': None,
+                'marginUsed': f"{margin:.6f}",
+                'maxLeverage': market.hl_max_leverage,
+                'cumFunding': {'allTime': '0.0', 'sinceOpen': '0.0', 'sinceChange': '0.0'}
+            }})
+        account_value = state['balance'] + unrealized_total
+        summary = {
+            'accountValue': f"{account_value:.6f}",
+            'totalNtlPos': f"{total_ntl:.6f}",
+            'totalRawUsd': f"{account_value:.6f}",
+            'totalMarginUsed': f"{margin_used:.6f}"
+        }
+        return {
+            'marginSummary': summary,
+            'crossMarginSummary': dict(summary),
+            'crossMaintenanceMarginUsed': f"{margin_used / 2:.6f}",
+            'withdrawable': f"{account_value - margin_used:.6f}",
+            'assetPositions': positions,
+            'time': now_ms
+        }
+
+    def handle_hl_exchange(self, body: Dict) -> Dict:
+        action = body.get('action') or {}
+        action_type = action.get('type')
+        coins = {i: m for i, m in enumerate(self.markets)}
+        if action_type == 'order':
+            statuses = []
+            for order in action.get('orders', []):
+                market = coins.get(int(order.get('a', -1)))
+                if market is None:
+                    statuses.append({'error': 'Invalid asset'})
+                    continue
+                tif = (order.get('t') or {}).get('limit', {}).get('tif', 'Gtc')
+                try:
+                    result = self.engine.place_order(
+                        'hyperliquid', market.coin, bool(order.get('b')), float(order.get('s', 0)), 'LIMIT',
+                        float(order.get('p', 0)), bool(order.get('r')), tif
+                    )
+                except SimError as e:
+                    statuses.append({'error': e.message})
+                    continue
+                if result['status'] == 'FILLED':
+                    statuses.append({'filled': {'totalSz': f"{result['executed_qty']}",
+                                                'avgPx': f"{result['avg_price']:.6g}", 'oid': result['order_id']}})
+                elif result['status'] == 'NEW':
+                    statuses.append({'resting': {'oid': result['order_id']}})
+                else:
+                    statuses.append({'error': 'Order could not immediately match against any resting orders.'})
+            return {'status': 'ok', 'response': {'type': 'order', 'data': {'statuses': statuses}}}
+        if action_type == 'cancel':
+            statuses = []
+            for cancel in action.get('cancels', []):
+                try:
+                    self.engine.cancel_order('hyperliquid', int(cancel.get('o', 0)))
+                    statuses.append('success')
+                except SimError:
+                    statuses.append({'error': 'Order was never placed, already canceled, or filled.'})
+            return {'status': 'ok', 'response': {'type': 'cancel', 'data': {'statuses': statuses}}}
+        if action_type == 'updateLeverage':
+            market = coins.get(int(action.get('asset', -1)))
+            if market is None:
+                return {'status': 'err', 'response': 'Invalid asset'}
+            try:
+                self.engine.set_leverage('hyperliquid', market.coin, int(action.get('leverage', 0)))
+            except SimError:
+                return {'status': 'err', 'response': 'Invalid leverage value'}
+            return {'status': 'ok', 'response': {'type': 'default'}}
+        if action_type in ('approveBuilderFee', 'setReferrer'):
+            # ccxt 初始化客户端时发送，直接确认
+            return {'status': 'ok', 'response': {'type': 'default'}}
+        return {'status': 'err', 'response': f"Unsupported action {action_type}"}
+
+    # ---- 管理接口 ----
+
+    def handle_admin(self, method: str, path: str, body: Dict) -> object:
+        endpoint = path[len('/sim/'):]
+        if endpoint == 'state':
+            return {'accounts': self.engine.state(), 'prices': dict(self.engine.prices),
+                    'funding': self.funding, 'config': {k: v.to_dict() for k, v in self.config.items()},
+                    'stats': self.stats}
+        if endpoint == 'reset' and method == 'POST':
+            self.engine.reset()
+            with self._stats_lock:
+                self.stats = {}
+            return {'status': 'ok'}
+        if endpoint == 'config' and method == 'POST':
+            for venue, values in body.items():
+                if venue in self.config:
+                    self.config[venue].update(values)
+            return {k: v.to_dict() for k, v in self.config.items()}
+        if endpoint == 'prices' and method == 'POST':
+            self.engine.set_prices(body)
+            return dict(self.engine.prices)
+        if endpoint == 'funding' and method == 'POST':
+            for coin, rates in body.items():
+                if coin in self.funding:
+                    self.funding[coin].update({k: float(v) for k, v in rates.items() if k in self.funding[coin]})
+            return self.funding
+        raise SimError(0, f"Unsupported endpoint {method} {path}", status=404)
+
+
+def _make_handler(simulator: ExchangeSimulator):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, fmt, *args):
+            logger.debug("%s %s", self.address_string(), fmt % args)
+
+        def _send(self, status: int, payload, headers: Optional[Dict[str, str]] = None):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_body(self) -> bytes:
+            length = int(self.headers.get('Content-Length') or 0)
+            return self.rfile.read(length) if length else b''
+
+        def _dispatch(self, method: str):
+            url = urlparse(self.path)
+            path = url.path
+            raw = self._read_body()
+            try:
+                if path.startswith('/sim/'):
+                    self._send(200, simulator.handle_admin(method, path, json.loads(raw or b'{}')))
+                elif path.startswith('/fapi/') or path.startswith('/api/'):
+                    self._handle_binance(method, path, url.query, raw)
+                elif path in ('/info', '/exchange') and method == 'POST':
+                    self._handle_hyperliquid(path, raw)
+                else:
+                    self._send(404, {'error': f"Unknown path {path}"})
+            except SimError as e:
+                self._send(e.status, {'code': e.code, 'msg': e.message})
+            except Exception as e:
+                logger.error("模拟器处理 %s %s 出错: %s", method, path, e)
+                self._send(500, {'code': -1000, 'msg': str(e)})
+
+        def _handle_binance(self, method: str, path: str, query: str, raw: bytes):
+            params = dict(parse_qsl(query))
+            if raw:
+                params.update(parse_qsl(raw.decode('utf-8')))
+            endpoint = path.rstrip('/').split('/')[-1]
+            weight = simulator.BINANCE_WEIGHTS.get(endpoint, 1)
+            if endpoint == 'premiumIndex' and params.get('symbol'):
+                weight = 1
+            outcome, headers = simulator.inject('binance', weight)
+            simulator._record('binance', endpoint, outcome or 'ok')
+            if outcome == 'rate_limited':
+                self._send(429, {'code': -1003, 'msg': 'Too many requests; current limit of IP is exceeded.'}, headers)
+                return
+            if outcome == 'errors':
+                self._send(503, {'code': -1001, 'msg': 'Internal error; unable to process your request. Please try again.'}, headers)
+                return
+            try:
+                status, payload = simulator.handle_binance(method, path, params)
+            except SimError as e:
+                self._send(e.status, {'code': e.code, 'msg': e.message}, headers)
+                return
+            self._send(status, payload, headers)
+
+        def _handle_hyperliquid(self, path: str, raw: bytes):
+            try:
+                body = json.loads(raw or b'{}')
+            except ValueError:
+                self._send(400, {'error': 'Failed to deserialize the JSON body'})
+                return
+            if path == '/info':
+                endpoint = body.get('type', '')
+                weight = simulator.HL_WEIGHTS.get(endpoint, 20)
+            else:
+                endpoint = f"exchange.{(body.get('action') or {}).get('type', '')}"
+                weight = 1
+            outcome, headers = simulator.inject('hyperliquid', weight)
+            simulator._record('hyperliquid', endpoint, outcome or 'ok')
+            if outcome == 'rate_limited':
+                self._send(429, None, headers)
+                return
+            if outcome == 'errors':
+                self._send(500, None, headers)
+                return
+            try:
+                payload = simulator.handle_hl_info(body) if path == '/info' else simulator.handle_hl_exchange(body)
+            except SimError as e:
+                self._send(e.status, {'error': e.message}, headers)
+                return
+            self._send(200, payload, headers)
+
+        def do_GET(self):
+            self._dispatch('GET')
+
+        def do_POST(self):
+            self._dispatch('POST')
+
+        def do_PUT(self):
+            self._dispatch('PUT')
+
+        def do_DELETE(self):
+            self._dispatch('DELETE')
+
+    return Handler
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="本地交易所模拟器（币安U本位合约 + Hyperliquid）")
+    parser.add_argument('--host', default='127.0.0.1', help="监听地址")
+    parser.add_argument('--port', type=int, default=8900, help="监听端口")
+    parser.add_argument('--latency', type=float, default=0.0, help="每个请求的固定延迟（毫秒）")
+    parser.add_argument('--jitter', type=float, default=0.0, help="叠加的随机延迟上限（毫秒）")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="返回5xx错误的概率")
+    parser.add_argument('--binance-weight-limit', type=int, default=2400, help="币安每分钟请求权重上限，0表示不限流")
+    parser.add_argument('--hl-weight-limit', type=int, default=1200, help="Hyperliquid每分钟请求权重上限，0表示不限流")
+    parser.add_argument('--extra-markets', type=int, default=0, help="在默认合约之外生成的合约数量")
+    parser.add_argument('--balance', type=float, default=10000.0, help="每个交易所的初始余额")
+    parser.add_argument('--slippage-bps', type=float, default=1.0, help="吃单滑点（基点）")
+    parser.add_argument('--seed', type=int, default=1, help="随机种子")
+    args = parser.parse_args()
+
+    markets = build_markets(args.extra_markets, args.seed)
+    simulator = ExchangeSimulator(
+        args.host, args.port, markets=markets, seed=args.seed,
+        binance=VenueConfig(args.latency, args.jitter, args.error_rate, args.binance_weight_limit),
+        hyperliquid=VenueConfig(args.latency, args.jitter, args.error_rate, args.hl_weight_limit),
+        engine=MatchingEngine(markets, balance=args.balance, slippage_bps=args.slippage_bps)
+    )
+    print(f"交易所模拟器运行在 {simulator.url}，{len(markets)} 个合约")
+    print(f"BINANCE_FAPI_URL={simulator.url} HYPERLIQUID_API_URL={simulator.url} python app.py")
+    try:
+        simulator.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
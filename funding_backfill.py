@@ -0,0 +1,213 @@
+import argparse
+import asyncio
+import os
+import time
+from typing import Dict, Iterable, List, Optional
+
+import aiohttp
+
+from async_runtime import AsyncRateLimiter
+from exchange_endpoints import BINANCE_FAPI_URL, HYPERLIQUID_INFO_URL
+from funding_store import FundingHistoryStore
+from logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_HISTORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'funding_history')
+# 币安 /fapi/v1/fundingRate 与其他接口共享每5分钟500次的额度，这里留出余量
+BINANCE_REQUESTS_PER_SECOND = 1.5
+# Hyperliquid info接口每分钟1200权重，fundingHistory 每次约20权重
+HYPERLIQUID_REQUESTS_PER_SECOND = 0.8
+MAX_RETRIES = 5
+
+
+class FundingBackfill:
+    """并发下载两个交易所已结算的历史资金费率
+
+    每个交易对按时间分页下载，所有交易对共享各交易所的限流额度。进度保存在
+    历史文件本身（最后一条记录的时间），中断后重新运行会从断点继续。
+    """
+
+    BINANCE_URL = BINANCE_FAPI_URL
+    HYPERLIQUID_URL = HYPERLIQUID_INFO_URL
+    BINANCE_PAGE_SIZE = 1000
+    HYPERLIQUID_PAGE_SIZE = 500
+
+    def __init__(self, store: FundingHistoryStore, concurrency: int = 8, start_ms: Optional[int] = None,
+                 binance_url: str = BINANCE_URL, hyperliquid_url: str = HYPERLIQUID_URL):
+        """
+        Args:
+            store: 历史资金费率存储
+            concurrency: 同时下载的交易对数量
+            start_ms: 没有历史数据的交易对从该时间开始下载，默认从交易所最早的数据开始
+            binance_url: 币安合约接口地址
+            hyperliquid_url: Hyperliquid info接口地址
+        """
+        self.store = store
+        self.concurrency = concurrency
+        self.start_ms = start_ms
+        self.binance_url = binance_url
+        self.hyperliquid_url = hyperliquid_url
+        self.binance_rps = BINANCE_REQUESTS_PER_SECOND
+        self.hyperliquid_rps = HYPERLIQUID_REQUESTS_PER_SECOND
+        self.limiters: Dict[str, AsyncRateLimiter] = {}
+
+    async def _request(self, session: aiohttp.ClientSession, venue: str, method: str, url: str, **kwargs):
+        """在限流额度内发送请求，收到429/418时按 Retry-After 暂停整个交易所的请求后重试"""
+        limiter = self.limiters[venue]
+        for attempt in range(MAX_RETRIES):
+            await limiter.acquire()
+            try:
+                async with session.request(method, url, **kwargs) as response:
+                    if response.status in (429, 418):
+                        retry_after = float(response.headers.get('Retry-After') or 2 ** attempt)
+                        logger.warning("%s 触发限流，暂停%.0f秒", venue, retry_after)
+                        limiter.penalize(retry_after)
+                        continue
+                    data = await response.json(content_type=None)
+                    if response.status != 200:
+                        raise Exception(f"请求失败，状态码: {response.status}，返回: {data}")
+                    return data
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning("%s 请求出错（第%d次）: %s", venue, attempt + 1, e)
+                await asyncio.sleep(2 ** attempt)
+        raise Exception(f"{venue} 请求重试{MAX_RETRIES}次后仍然失败")
+
+    async def list_binance_symbols(self, session: aiohttp.ClientSession) -> List[str]:
+        """所有正在交易的U本位永续合约"""
+        data = await self._request(session, 'binance', 'GET', f"{self.binance_url}/fapi/v1/exchangeInfo")
+        return [
+            item['symbol'] for item in data.get('symbols', [])
+            if item.get('status') == 'TRADING' and item.get('contractType') == 'PERPETUAL'
+        ]
+
+    async def list_hyperliquid_coins(self, session: aiohttp.ClientSession) -> List[str]:
+        """所有未下架的Hyperliquid永续合约"""
+        data = await self._request(session, 'hyperliquid', 'POST', self.hyperliquid_url, json={"type": "meta"})
+        return [item['name'] for item in data.get('universe', []) if not item.get('isDelisted', False)]
+
+    def _cursor(self, venue: str, symbol: str) -> int:
+        last = self.store.last_time(venue, symbol)
+        return last + 1 if last is not None else (self.start_ms or 0)
+
+    async def backfill_binance(self, session: aiohttp.ClientSession, symbol: str) -> int:
+        """下载单个币安交易对从断点到现在的历史资金费率"""
+        cursor = self._cursor('binance', symbol)
+        end_ms = int(time.time() * 1000)
+        total = 0
+        while cursor < end_ms:
+            rows = await self._request(session, 'binance', 'GET', f"{self.binance_url}/fapi/v1/fundingRate", params={
+                'symbol': symbol,
+                'startTime': cursor,
+                'endTime': end_ms,
+                'limit': self.BINANCE_PAGE_SIZE
+            })
+            if not rows:
+                break
+            total += self.store.append('binance', symbol, [
+                (int(row['fundingTime']), float(row['fundingRate']) * 100, float(row.get('markPrice') or 'nan'))
+                for row in rows
+            ])
+            cursor = int(rows[-1]['fundingTime']) + 1
+            if len(rows) < self.BINANCE_PAGE_SIZE:
+                break
+        return total
+
+    async def backfill_hyperliquid(self, session: aiohttp.ClientSession, coin: str) -> int:
+        """下载单个Hyperliquid币种从断点到现在的历史资金费率"""
+        cursor = self._cursor('hyperliquid', coin)
+        end_ms = int(time.time() * 1000)
+        total = 0
+        while cursor < end_ms:
+            rows = await self._request(session, 'hyperliquid', 'POST', self.hyperliquid_url, json={
+                'type': 'fundingHistory',
+                'coin': coin,
+                'startTime': cursor,
+                'endTime': end_ms
+            })
+            if not rows:
+                break
+            total += self.store.append('hyperliquid', coin, [
+                (int(row['time']), float(row['fundingRate']) * 100, float('nan'))
+                for row in rows
+            ])
+            cursor = int(rows[-1]['time']) + 1
+            if len(rows) < self.HYPERLIQUID_PAGE_SIZE:
+                break
+        return total
+
+    async def run(self, venues: Iterable[str] = ('binance', 'hyperliquid'),
+                  symbols: Optional[Dict[str, List[str]]] = None) -> Dict[str, int]:
+        """下载所有交易对的历史资金费率
+
+        Args:
+            venues: 要下载的交易所
+            symbols: 可选，按交易所指定交易对，不指定时下载所有上线的交易对
+
+        Returns:
+            Dict[str, int]: 每个交易所新写入的记录数
+        """
+        # 限流器绑定当前事件循环，每次运行重新创建
+        self.limiters = {
+            'binance': AsyncRateLimiter(self.binance_rps, burst=5),
+            'hyperliquid': AsyncRateLimiter(self.hyperliquid_rps, burst=2)
+        }
+        semaphore = asyncio.Semaphore(self.concurrency)
+        totals = {venue: 0 for venue in venues}
+        failed = []
+
+        async def backfill_one(venue: str, symbol: str):
+            async with semaphore:
+                try:
+                    if venue == 'binance':
+                        count = await self.backfill_binance(session, symbol)
+                    else:
+                        count = await self.backfill_hyperliquid(session, symbol)
+                    totals[venue] += count
+                    logger.debug("%s %s 写入 %d 条记录", venue, symbol, count)
+                except Exception as e:
+                    failed.append((venue, symbol))
+                    logger.error("%s %s 下载历史资金费率失败: %s", venue, symbol, e)
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency * 2, ttl_dns_cache=300)
+        async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=30)) as session:
+            tasks = []
+            for venue in venues:
+                names = (symbols or {}).get(venue)
+                if not names:
+                    names = await (self.list_binance_symbols(session) if venue == 'binance'
+                                   else self.list_hyperliquid_coins(session))
+                logger.info("%s 开始下载 %d 个交易对的历史资金费率", venue, len(names))
+                tasks += [backfill_one(venue, name) for name in names]
+            await asyncio.gather(*tasks)
+
+        logger.info("历史资金费率下载完成: %s，失败 %d 个", totals, len(failed))
+        return totals
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="下载两个交易所的历史资金费率")
+    parser.add_argument('--venue', choices=['binance', 'hyperliquid'], action='append',
+                        help="只下载指定交易所，可重复指定，默认两个都下载")
+    parser.add_argument('--symbols', nargs='*', help="只下载指定交易对（币安如 BTCUSDT，Hyperliquid如 BTC）")
+    parser.add_argument('--days', type=float, help="没有历史数据的交易对只下载最近多少天")
+    parser.add_argument('--concurrency', type=int, default=8, help="同时下载的交易对数量")
+    parser.add_argument('--dir', default=os.getenv('FUNDING_HISTORY_DIR', DEFAULT_HISTORY_DIR), help="数据目录")
+    parser.add_argument('--loop', type=float, help="作为后台任务运行，每隔多少秒增量下载一次")
+    args = parser.parse_args()
+
+    venues = args.venue or ['binance', 'hyperliquid']
+    symbols = {venue: args.symbols for venue in venues} if args.symbols else None
+    start_ms = int((time.time() - args.days * 86400) * 1000) if args.days else None
+    backfill = FundingBackfill(FundingHistoryStore(args.dir), concurrency=args.concurrency, start_ms=start_ms)
+
+    while True:
+        asyncio.run(backfill.run(venues, symbols))
+        if not args.loop:
+            break
+        time.sleep(args.loop)
+
+
+if __name__ == "__main__":
+    main()
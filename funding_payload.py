@@ -0,0 +1,160 @@
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+import pytz
+
+from symbol_registry import SymbolRegistry
+from logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+BEIJING_TZ = pytz.timezone('Asia/Shanghai')
+
+
+def format_binance_next_funding(timestamp_ms: int, symbol: Optional[str] = None,
+                                resolve: Optional[Callable[[str, int], Optional[int]]] = None) -> str:
+    """将币安的时间戳转换为北京时间，如果时间已过期则从结算时间表获取最新时间
+
+    Args:
+        timestamp_ms: 毫秒级时间戳，代表下次结算时间
+        symbol: 交易对名称，用于重新获取结算时间
+        resolve: 结算时间表的查询函数，如 FundingCalendar.resolve
+
+    Returns:
+        str: 格式化的北京时间
+    """
+    try:
+        # 获取当前北京时间
+        current_time = datetime.now(BEIJING_TZ)
+
+        # 将毫秒转换为秒
+        timestamp_s = timestamp_ms / 1000
+        # 创建UTC时间
+        utc_time = datetime.fromtimestamp(timestamp_s, pytz.UTC)
+        # 转换为北京时间
+        beijing_time = utc_time.astimezone(BEIJING_TZ)
+
+        # 如果结算时间已过且提供了交易对名称，从结算时间表获取最新的结算时间
+        # （过期时结算时间表会批量刷新所有交易对，而不是逐个请求）
+        if beijing_time < current_time and symbol and resolve is not None:
+            new_timestamp_ms = resolve(symbol, timestamp_ms)
+            if new_timestamp_ms and new_timestamp_ms != timestamp_ms:
+                # 递归调用，但这次不传symbol参数以避免无限循环
+                return format_binance_next_funding(new_timestamp_ms)
+
+        return beijing_time.strftime('%Y-%m-%d %H:%M:%S')
+    except Exception as e:
+        logger.error("时间转换错误: %s", e)
+        return "-"
+
+
+def build_all_contracts(hl_rates: Dict, binance_rates: Dict, registry: SymbolRegistry,
+                        resolve_binance_next: Optional[Callable[[str, int], Optional[int]]] = None) -> Dict[str, Dict]:
+    """把两个交易所的资金费率合并为按统一名称索引的合约列表
+
+    Args:
+        hl_rates: HyperliquidAPI 返回的资金费率
+        binance_rates: FundingRateMonitor 返回的资金费率
+        registry: 交易对注册表
+        resolve_binance_next: 可选，把已过期的币安结算时间换成最新时间
+
+    Returns:
+        Dict[str, Dict]: 统一名称到合约信息的映射
+    """
+    all_contracts = {}
+
+    # 处理 Hyperliquid 合约
+    for symbol, hl_data in hl_rates.items():
+        try:
+            if not hl_data or not isinstance(hl_data, dict) or "funding_rate" not in hl_data:
+                logger.debug("跳过无效的 Hyperliquid 合约数据: %s", symbol)
+                continue
+
+            # 通过注册表获取统一名称和两个交易所的原生名称（如 kPEPE 对应 1000PEPEUSDT）
+            base_symbol = registry.canonical(symbol)
+            binance_symbol = registry.binance_symbol(base_symbol)
+
+            # 确保funding_rate是数字
+            try:
+                # Hyperliquid的费率保持原始格式
+                hl_rate = float(hl_data["funding_rate"])
+            except (TypeError, ValueError):
+                logger.debug("无效的 Hyperliquid 费率数据: %s", hl_data['funding_rate'])
+                continue
+
+            # 处理next_funding_time
+            if isinstance(hl_data["next_funding_time"], datetime):
+                hl_next_funding = hl_data["next_funding_time"].strftime("%Y-%m-%d %H:%M:%S")
+            else:
+                try:
+                    hl_next_funding = str(hl_data["next_funding_time"])
+                except:
+                    hl_next_funding = None
+
+            contract_info = {
+                "symbol": base_symbol,
+                "binance_symbol": binance_symbol,
+                "hl_coin": registry.hl_coin(symbol),
+                "hl_rate": hl_rate,
+                "hl_next_funding": hl_next_funding,
+                "binance_rate": None,
+                "binance_next_funding": None
+            }
+
+            # 尝试匹配 Binance 合约
+            if binance_symbol in binance_rates:
+                bn_data = binance_rates[binance_symbol]
+                if hasattr(bn_data, 'rate') and bn_data.rate is not None:
+                    try:
+                        # Binance的费率已经是百分比形式，不需要再乘以100
+                        contract_info["binance_rate"] = round(float(bn_data.rate), 4)
+                        if hasattr(bn_data, 'next_funding_time'):
+                            contract_info["binance_next_funding"] = format_binance_next_funding(
+                                bn_data.next_funding_time, binance_symbol, resolve_binance_next)
+                    except (TypeError, ValueError):
+                        logger.debug("无效的 Binance 费率数据: %s", bn_data.rate)
+
+            all_contracts[base_symbol] = contract_info
+            logger.debug("处理合约 %s 完成: %s", base_symbol, contract_info)
+        except Exception as e:
+            logger.error("处理 Hyperliquid 合约 %s 时出错: %s", symbol, e)
+            continue
+
+    # 处理 Binance 合约
+    for symbol, bn_data in binance_rates.items():
+        try:
+            base_symbol = registry.canonical(symbol)
+
+            if base_symbol not in all_contracts:
+                try:
+                    # Binance的费率已经是百分比形式，不需要再乘以100
+                    binance_rate = round(float(bn_data.rate), 4) if hasattr(bn_data, 'rate') and bn_data.rate is not None else None
+                    binance_next_funding = format_binance_next_funding(
+                        bn_data.next_funding_time, symbol, resolve_binance_next) if hasattr(bn_data, 'next_funding_time') else None
+                except (TypeError, ValueError):
+                    logger.debug("无效的 Binance 费率数据: %s", getattr(bn_data, 'rate', None))
+                    continue
+
+                contract_info = {
+                    "symbol": base_symbol,
+                    "binance_symbol": symbol,
+                    "hl_coin": None,
+                    "binance_rate": binance_rate,
+                    "binance_next_funding": binance_next_funding,
+                    "hl_rate": None,
+                    "hl_next_funding": None
+                }
+                all_contracts[base_symbol] = contract_info
+        except Exception as e:
+            logger.error("处理 Binance 合约 %s 时出错: %s", symbol, e)
+            continue
+
+    return all_contracts
+
+
+def count_contracts(all_contracts: Dict[str, Dict]) -> Dict[str, int]:
+    """统计两个交易所有效合约的数量"""
+    return {
+        'hyperliquid': len([c for c in all_contracts.values() if c['hl_rate'] is not None]),
+        'binance': len([c for c in all_contracts.values() if c['binance_rate'] is not None])
+    }
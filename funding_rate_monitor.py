@@ -1,32 +1,227 @@
 from binance.client import Client
 from binance.enums import *
 import time
+import threading
 from datetime import datetime
 import sys
-from typing import Dict, List, Tuple, NamedTuple
+from typing import Dict, List, Tuple, NamedTuple, Optional
+from ws_stream import WebSocketStream
+from async_runtime import PooledSession
+from instrument_cache import InstrumentCache, parse_exchange_info
+from exchange_endpoints import BINANCE_FAPI_URL, create_binance_client
+from logging_setup import get_logger
+import metrics
+
+logger = get_logger(__name__)
 
 class FundingRateInfo(NamedTuple):
     """资金费率信息"""
     rate: float
     next_funding_time: int
+    mark_price: float = 0.0
+
+class FundingCalendar:
+    """币安各交易对的下次结算时间表
+
+    推送和REST数据到达时随时更新；查询到已过期的结算时间时，用一次不带symbol的
+    futures_mark_price 批量刷新全部交易对，之后的查询都直接读内存。
+    """
+
+    def __init__(self, client: Client, min_refresh_interval: float = 5):
+        """
+        Args:
+            client: python-binance 的 Client 对象
+            min_refresh_interval: 两次批量刷新之间的最小间隔（秒）。
+                结算刚发生时交易所可能仍返回旧时间，避免在此期间反复请求
+        """
+        self.client = client
+        self.min_refresh_interval = min_refresh_interval
+        self.next_funding_times: Dict[str, int] = {}
+        self.last_refresh = 0.0
+        self._refresh_lock = threading.Lock()
+
+    def update(self, symbol: str, next_funding_time: int):
+        """记录交易对的下次结算时间，只接受更晚的时间"""
+        if next_funding_time > self.next_funding_times.get(symbol, 0):
+            self.next_funding_times[symbol] = next_funding_time
+
+    def refresh(self) -> bool:
+        """批量刷新所有交易对的下次结算时间"""
+        with self._refresh_lock:
+            if time.time() - self.last_refresh < self.min_refresh_interval:
+                return False
+            self.last_refresh = time.time()
+            try:
+                for item in self.client.futures_mark_price():
+                    if item.get('nextFundingTime'):
+                        self.update(item['symbol'], int(item['nextFundingTime']))
+                return True
+            except Exception as e:
+                logger.error("批量刷新结算时间失败: %s", e)
+                return False
+
+    def resolve(self, symbol: str, timestamp_ms: Optional[int] = None) -> Optional[int]:
+        """获取交易对的下次结算时间
+
+        Args:
+            symbol: 交易对名称
+            timestamp_ms: 调用方已知的结算时间（毫秒）
+
+        Returns:
+            Optional[int]: 最新的下次结算时间（毫秒）
+        """
+        now_ms = int(time.time() * 1000)
+        known = max(timestamp_ms or 0, self.next_funding_times.get(symbol, 0))
+        if known > now_ms:
+            return known
+        # 已过结算时间：全市场在同一时间点结算，一次批量刷新覆盖所有交易对
+        self.refresh()
+        return self.next_funding_times.get(symbol, known) or None
+
+class AsyncMarketDataClient:
+    """币安U本位合约公共行情接口的异步客户端
+
+    基于aiohttp长连接池，可在多个请求中并发使用，不需要为每个请求占用一个线程。
+    """
+
+    BASE_URL = BINANCE_FAPI_URL
+
+    def __init__(self, base_url: str = BASE_URL, pool_size: int = 10, timeout: float = 10.0):
+        self.base_url = base_url
+        self._http = PooledSession("binance-http", pool_size=pool_size, timeout=timeout)
+
+    async def _request(self, path: str, params: Optional[Dict] = None):
+        session = await self._http.get()
+        with metrics.track('binance', path.strip('/')) as call:
+            async with session.get(f"{self.base_url}{path}", params=params) as response:
+                call.status = response.status
+                call.used_weight = response.headers.get('X-MBX-USED-WEIGHT-1M')
+                data = await response.json(content_type=None)
+                if response.status != 200:
+                    raise Exception(f"请求{path}失败，状态码: {response.status}，返回: {data}")
+                return data
+
+    async def get(self, path: str, params: Optional[Dict] = None):
+        """发送GET请求，可以在任意事件循环中调用"""
+        return await self._http.run(self._request(path, params))
+
+    async def get_exchange_info(self) -> Dict:
+        """获取交易规则和交易对信息"""
+        return await self.get("/fapi/v1/exchangeInfo")
+
+    async def get_premium_index(self, symbol: Optional[str] = None):
+        """获取标记价格和资金费率，不传symbol时返回所有交易对"""
+        return await self.get("/fapi/v1/premiumIndex", {"symbol": symbol} if symbol else None)
+
+    def close(self):
+        """关闭连接池"""
+        self._http.close()
+
+class MarkPriceStream(WebSocketStream):
+    """订阅币安全市场标记价格推送 !markPrice@arr，实时更新资金费率"""
+
+    STREAM_URL = "wss://fstream.binance.com/ws/!markPrice@arr"
+    # 推送间隔为3秒，相邻两次推送的事件时间相差超过该值视为丢失数据
+    MAX_EVENT_GAP_MS = 10000
+
+    def __init__(self, monitor: 'FundingRateMonitor', url: str = STREAM_URL):
+        super().__init__(url, name="Binance标记价格", stale_after=15.0)
+        self.monitor = monitor
+        self.last_event_time = 0
+
+    def on_connected(self):
+        # 每次(重)连接后通过REST补齐断线期间的数据
+        self.last_event_time = 0
+        self.monitor.resync()
+
+    def on_message(self, message):
+        if not isinstance(message, list) or not message:
+            return
+
+        event_time = int(message[0].get('E', 0))
+        if self.last_event_time and event_time - self.last_event_time > self.MAX_EVENT_GAP_MS:
+            logger.warning("%s 推送间隔%sms，重新同步资金费率", self.name, event_time - self.last_event_time)
+            self.monitor.resync()
+        self.last_event_time = max(self.last_event_time, event_time)
+
+        for item in message:
+            symbol = item.get('s')
+            if not symbol or 'r' not in item or item['r'] == '':
+                continue
+            self.monitor.update_rate(symbol, float(item['r']) * 100, int(item['T']), float(item.get('p') or 0))
 
 class FundingRateMonitor:
-    def __init__(self):
-        """初始化资金费率监控器"""
+    def __init__(self, instruments: Optional[InstrumentCache] = None, client: Optional[Client] = None):
+        """初始化资金费率监控器
+
+        Args:
+            instruments: 共享的交易对元数据缓存，不传则自行创建
+            client: 可选的 python-binance Client 对象，不传则创建不带密钥的公共客户端
+        """
         self.funding_rates: Dict[str, FundingRateInfo] = {}
-        self.rest_client = Client()
+        self.rest_client = metrics.instrument_binance_client(client or create_binance_client())
+        self.instruments = instruments or InstrumentCache(self.rest_client)
+        self.active_symbols: set = set()
+        self.calendar = FundingCalendar(self.rest_client)
+        self.stream: Optional[MarkPriceStream] = None
+        self.market_data = AsyncMarketDataClient()
+        self._lock = threading.Lock()
+
+    def start_stream(self):
+        """启动WebSocket推送模式，之后资金费率在内存中实时更新"""
+        if self.stream is None:
+            self.stream = MarkPriceStream(self)
+        self.stream.start()
+
+    def stop_stream(self):
+        """停止WebSocket推送模式"""
+        if self.stream:
+            self.stream.stop()
+
+    def is_streaming(self) -> bool:
+        """推送模式是否可用（已连接且数据未过期）"""
+        return self.stream is not None and self.stream.is_fresh()
+
+    def resync(self):
+        """通过REST接口重新同步活跃交易对和资金费率"""
+        try:
+            self.get_funding_rates()
+        except Exception as e:
+            logger.error("重新同步资金费率失败: %s", e)
+
+    def update_rate(self, symbol: str, funding_rate: float, next_funding_time: int, mark_price: float = 0.0):
+        """更新单个交易对的资金费率
+
+        只有当资金费率发生变化且变化超过0.01%时才更新，标记价格总是保持最新
+        """
+        if self.active_symbols and symbol not in self.active_symbols:
+            return
+        # 结算时间不受费率变化阈值限制，总是保持最新
+        self.calendar.update(symbol, next_funding_time)
+        current = self.funding_rates.get(symbol)
+        if current is None or abs(current.rate - funding_rate) > 0.01:
+            with self._lock:
+                self.funding_rates[symbol] = FundingRateInfo(
+                    rate=funding_rate,
+                    next_funding_time=next_funding_time,
+                    mark_price=mark_price
+                )
+        elif mark_price and current.mark_price != mark_price:
+            with self._lock:
+                self.funding_rates[symbol] = current._replace(mark_price=mark_price)
+
+    def snapshot(self) -> Dict[str, FundingRateInfo]:
+        """返回当前资金费率的副本"""
+        with self._lock:
+            return dict(self.funding_rates)
         
     def get_active_symbols(self) -> List[str]:
         """获取所有活跃的交易对"""
         try:
-            exchange_info = self.rest_client.futures_exchange_info()
-            active_symbols = [
-                symbol['symbol'] for symbol in exchange_info['symbols']
-                if symbol['status'] == 'TRADING'  # 只获取正在交易的交易对
-            ]
-            return active_symbols
+            # 只获取正在交易的交易对
+            return self.instruments.active_symbols()
         except Exception as e:
-            print(f"获取活跃交易对失败: {e}")
+            logger.error("获取活跃交易对失败: %s", e)
             return []
         
     def get_funding_rates(self) -> Dict[str, FundingRateInfo]:
@@ -37,30 +232,58 @@ class FundingRateMonitor:
         """
         try:
             active_symbols = self.get_active_symbols()
+            if active_symbols:
+                self.active_symbols = set(active_symbols)
             premium_index = self.rest_client.futures_mark_price()
+            return self._apply_premium_index(premium_index)
             
-            # 过滤出活跃交易对的数据
-            active_data = [item for item in premium_index if item['symbol'] in active_symbols]
-            sorted_data = sorted(active_data, key=lambda x: abs(float(x['lastFundingRate'])), reverse=True)
-            
-            # 更新资金费率
-            for item in sorted_data:
-                symbol = item['symbol']
-                funding_rate = float(item['lastFundingRate']) * 100
-                next_funding_time = int(item['nextFundingTime'])
+        except Exception as e:
+            logger.error("获取资金费率失败: %s", e)
+            return {}
+
+    def _apply_premium_index(self, premium_index: List[Dict]) -> Dict[str, FundingRateInfo]:
+        """用 premiumIndex 接口的返回数据更新资金费率"""
+        # 过滤出活跃交易对的数据
+        active_data = [item for item in premium_index if item['symbol'] in self.active_symbols]
+        sorted_data = sorted(active_data, key=lambda x: abs(float(x['lastFundingRate'])), reverse=True)
+        
+        # 更新资金费率
+        for item in sorted_data:
+            self.update_rate(
+                item['symbol'],
+                float(item['lastFundingRate']) * 100,
+                int(item['nextFundingTime']),
+                float(item.get('markPrice') or 0)
+            )
                 
-                # 只有当资金费率发生变化且变化超过0.01%时才更新
-                if (symbol not in self.funding_rates or 
-                    abs(self.funding_rates[symbol].rate - funding_rate) > 0.01):
-                    self.funding_rates[symbol] = FundingRateInfo(
-                        rate=funding_rate,
-                        next_funding_time=next_funding_time
-                    )
-                    
-            return self.funding_rates
-            
+        return self.snapshot()
+
+    async def async_get_active_symbols(self) -> List[str]:
+        """异步获取所有活跃的交易对，元数据缓存有效时直接读取缓存"""
+        try:
+            if self.instruments.instruments and not self.instruments.is_expired():
+                return self.instruments.active_symbols()
+            exchange_info = await self.market_data.get_exchange_info()
+            self.instruments.set_instruments(parse_exchange_info(exchange_info))
+            return self.instruments.active_symbols()
+        except Exception as e:
+            logger.error("获取活跃交易对失败: %s", e)
+            return []
+
+    async def async_get_funding_rates(self) -> Dict[str, FundingRateInfo]:
+        """异步获取所有活跃交易对的当前资金费率
+
+        Returns:
+            Dict[str, FundingRateInfo]: 交易对到资金费率信息的映射
+        """
+        try:
+            active_symbols = await self.async_get_active_symbols()
+            if active_symbols:
+                self.active_symbols = set(active_symbols)
+            premium_index = await self.market_data.get_premium_index()
+            return self._apply_premium_index(premium_index)
         except Exception as e:
-            print(f"获取资金费率失败: {e}")
+            logger.error("获取资金费率失败: %s", e)
             return {}
 
     async def get_all_funding_rates(self) -> Dict[str, FundingRateInfo]:
@@ -70,10 +293,13 @@ class FundingRateMonitor:
             Dict[str, FundingRateInfo]: 交易对到资金费率信息的映射
         """
         try:
-            # 直接调用同步方法，因为binance-python库不支持异步操作
-            return self.get_funding_rates()
+            # 推送模式下直接读取内存中的数据
+            if self.is_streaming() and self.funding_rates:
+                return self.snapshot()
+            # 使用基于aiohttp的异步客户端，不阻塞事件循环也不占用线程
+            return await self.async_get_funding_rates()
         except Exception as e:
-            print(f"获取资金费率失败: {e}")
+            logger.error("获取资金费率失败: %s", e)
             return {}
         
     def get_top_rates(self, limit: int = 20) -> List[Tuple[str, FundingRateInfo]]:
@@ -85,7 +311,7 @@ class FundingRateMonitor:
         Returns:
             List[Tuple[str, FundingRateInfo]]: 按资金费率绝对值排序的交易对列表
         """
-        return sorted(self.funding_rates.items(), 
+        return sorted(self.snapshot().items(), 
                      key=lambda x: abs(x[1].rate), 
                      reverse=True)[:limit]
         
@@ -110,18 +336,22 @@ class FundingRateMonitor:
         
         return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
         
-    def start_monitoring(self, update_interval: int = 3):
+    def start_monitoring(self, update_interval: int = 3, use_stream: bool = False):
         """开始监控资金费率
         
         Args:
             update_interval (int): 更新间隔（秒）
+            use_stream (bool): 是否使用WebSocket推送模式，推送断开时回退到REST
         """
         print("启动U本位合约资金费率监控程序...")
         print(f"（每{update_interval}秒更新一次，只显示变化超过0.01%的更新）")
+        if use_stream:
+            self.start_stream()
         
         while True:
             try:
-                self.get_funding_rates()
+                if not self.is_streaming():
+                    self.get_funding_rates()
                 
                 # 显示前20个最高的资金费率
                 print("\n当前资金费率排名（按绝对值从高到低）：")
@@ -134,17 +364,18 @@ class FundingRateMonitor:
                 
             except KeyboardInterrupt:
                 print("\n正在停止监控...")
+                self.stop_stream()
+                self.market_data.close()
                 sys.exit(0)
                 
             except Exception as e:
-                print(f"监控出错: {e}")
-                print("5秒后重试...")
+                logger.error("监控出错: %s，5秒后重试...", e)
                 time.sleep(5)
 
 def main():
     """主函数，用于直接运行此脚本"""
     monitor = FundingRateMonitor()
-    monitor.start_monitoring()
+    monitor.start_monitoring(use_stream='--stream' in sys.argv)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
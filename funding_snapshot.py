@@ -0,0 +1,176 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional
+from logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+
+def encode_payload(data: Dict) -> bytes:
+    """序列化为 /api/funding_rates 的响应体"""
+    return json.dumps({'status': 'success', 'data': data}).encode('utf-8')
+
+
+class FundingSnapshot(NamedTuple):
+    """一次资金费率快照"""
+    version: int
+    created_at: float
+    data: Dict
+    body: bytes
+    etag: str
+
+
+class FundingSnapshotEngine:
+    """后台定时构建资金费率快照
+
+    每个周期调用一次 build 协程生成页面所需的数据，并预先序列化为JSON字节。
+    接口直接返回最新快照，请求耗时与交易所接口的延迟无关。
+    """
+
+    def __init__(self, build: Callable[[], Awaitable[Dict]], interval: float = 3.0, history_size: int = 20):
+        """
+        Args:
+            build: 返回快照数据（all_contracts、contract_counts、opportunities）的协程函数
+            interval: 刷新间隔（秒）
+            history_size: 保留的历史版本数量，用于计算增量
+        """
+        self.build = build
+        self.interval = interval
+        self.version = 0
+        self.last_checked = 0.0
+        self._snapshot: Optional[FundingSnapshot] = None
+        self._history = deque(maxlen=history_size)
+        self._delta_cache: OrderedDict = OrderedDict()
+        self._delta_lock = threading.Lock()
+        self._updated = threading.Condition()
+        self._build_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """启动后台刷新线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="funding-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台刷新"""
+        self._stop_event.set()
+
+    def latest(self) -> Optional[FundingSnapshot]:
+        """获取最新的快照"""
+        return self._snapshot
+
+    def refresh(self) -> Optional[FundingSnapshot]:
+        """立即构建一次快照，数据没有变化时沿用原版本号"""
+        with self._build_lock:
+            try:
+                data = asyncio.run(self.build())
+            except Exception as e:
+                logger.error("构建资金费率快照失败: %s", e)
+                return self._snapshot
+
+            body = encode_payload(data)
+            self.last_checked = time.time()
+            if self._snapshot is not None and self._snapshot.body == body:
+                return self._snapshot
+
+            self.version += 1
+            digest = hashlib.sha1(body).hexdigest()[:16]
+            snapshot = FundingSnapshot(
+                version=self.version,
+                created_at=self.last_checked,
+                data=data,
+                body=body,
+                etag=f"{self.version}-{digest}"
+            )
+            with self._updated:
+                self._snapshot = snapshot
+                self._history.append(snapshot)
+                self._updated.notify_all()
+            return snapshot
+
+    def wait_for_update(self, version: int, timeout: float) -> Optional[FundingSnapshot]:
+        """等待比指定版本更新的快照
+
+        Returns:
+            Optional[FundingSnapshot]: 新快照，超时返回None
+        """
+        with self._updated:
+            self._updated.wait_for(lambda: self._snapshot is not None and self._snapshot.version > version, timeout)
+            snapshot = self._snapshot
+        if snapshot is not None and snapshot.version > version:
+            return snapshot
+        return None
+
+    def delta(self, since_version: Optional[int], snapshot: FundingSnapshot) -> Optional[Dict]:
+        """计算从 since_version 到 snapshot 发生变化的合约和套利机会
+
+        Returns:
+            Optional[Dict]: 增量数据；历史中找不到起始版本时返回None，调用方应发送全量
+        """
+        if since_version is None:
+            return None
+        key = (since_version, snapshot.version)
+        with self._delta_lock:
+            if key in self._delta_cache:
+                return self._delta_cache[key]
+
+        base = next((s for s in list(self._history) if s.version == since_version), None)
+        if base is None:
+            return None
+
+        old_contracts = base.data['all_contracts']
+        new_contracts = snapshot.data['all_contracts']
+        old_opps = {o['symbol']: o for o in base.data['opportunities']}
+        new_opps = {o['symbol']: o for o in snapshot.data['opportunities']}
+        result = {
+            'contracts': {k: v for k, v in new_contracts.items() if old_contracts.get(k) != v},
+            'removed_contracts': [k for k in old_contracts if k not in new_contracts],
+            'opportunities': [o for k, o in new_opps.items() if old_opps.get(k) != o],
+            'removed_opportunities': [k for k in old_opps if k not in new_opps],
+            'contract_counts': snapshot.data['contract_counts']
+        }
+
+        # 多个客户端通常处于同一版本，缓存计算结果
+        with self._delta_lock:
+            self._delta_cache[key] = result
+            while len(self._delta_cache) > 64:
+                self._delta_cache.popitem(last=False)
+        return result
+
+    def stream_events(self, since_version: Optional[int] = None, heartbeat: float = 15.0):
+        """生成Server-Sent Events消息
+
+        首条消息为全量数据（客户端携带的版本仍在历史中时改为增量），之后每当
+        快照版本更新时只推送变化部分。
+        """
+        version = since_version if since_version is not None else -1
+        # 服务重启后版本号从头开始，客户端携带的版本比当前还新时发送全量
+        if version > self.version:
+            version = -1
+        while True:
+            snapshot = self.wait_for_update(version, heartbeat)
+            if snapshot is None:
+                yield ": keepalive\n\n"
+                continue
+
+            delta = self.delta(version, snapshot)
+            if delta is None:
+                event, payload = 'full', snapshot.data
+            else:
+                event, payload = 'delta', delta
+            version = snapshot.version
+            yield f"id: {version}\nevent: {event}\ndata: {json.dumps(payload)}\n\n"
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            started = time.time()
+            self.refresh()
+            self._stop_event.wait(max(self.interval - (time.time() - started), 0.1))
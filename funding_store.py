@@ -0,0 +1,218 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# 固定长度记录（48字节），按时间顺序追加写入当天的文件
+RECORD_DTYPE = np.dtype([
+    ('ts', '<i8'),                   # 记录时间（毫秒）
+    ('next_funding_time', '<i8'),    # 下次结算时间（毫秒）
+    ('rate', '<f8'),                 # 当前资金费率（百分比）
+    ('predicted_rate', '<f8'),       # 预测资金费率（百分比），没有时为NaN
+    ('mark_price', '<f8'),           # 标记价格，没有时为NaN
+    ('symbol_id', '<u4'),            # 交易对编号，见 symbols.json
+    ('venue', 'u1'),                 # 交易所编号，见 VENUES
+], align=True)
+
+VENUES = {'binance': 0, 'hyperliquid': 1}
+VENUE_NAMES = {v: k for k, v in VENUES.items()}
+
+# (交易对, 费率, 预测费率, 标记价格, 下次结算时间)
+TickRow = Tuple[str, float, float, float, int]
+
+
+class FundingStore:
+    """只追加的资金费率时间序列存储
+
+    每条记录为固定长度的二进制结构，按UTC日期分文件保存，交易对名称通过
+    symbols.json 映射为编号。读取时用 np.memmap 直接映射文件，按时间范围
+    二分查找得到的切片不复制数据。
+    """
+
+    def __init__(self, root: str, heartbeat: float = 60.0):
+        """
+        Args:
+            root: 数据目录
+            heartbeat: 数据没有变化时，同一交易对至少每隔多少秒记录一次
+        """
+        self.root = root
+        self.heartbeat = heartbeat
+        os.makedirs(root, exist_ok=True)
+        self._index_path = os.path.join(root, 'symbols.json')
+        self.symbols: List[str] = self._load_index()
+        self.symbol_ids: Dict[str, int] = {name: i for i, name in enumerate(self.symbols)}
+        # (交易所, 交易对编号) -> (上次记录时间, 费率, 预测费率, 下次结算时间)
+        self._last: Dict[Tuple[int, int], Tuple] = {}
+        self._lock = threading.Lock()
+
+    def _load_index(self) -> List[str]:
+        if not os.path.exists(self._index_path):
+            return []
+        with open(self._index_path, 'r') as f:
+            return json.load(f).get('symbols', [])
+
+    def _save_index(self):
+        tmp_path = self._index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'symbols': self.symbols}, f)
+        os.replace(tmp_path, self._index_path)
+
+    def _symbol_id(self, symbol: str) -> int:
+        symbol_id = self.symbol_ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = len(self.symbols)
+            self.symbols.append(symbol)
+            self.symbol_ids[symbol] = symbol_id
+        return symbol_id
+
+    def day_path(self, day: str) -> str:
+        """某一天（YYYYMMDD，UTC）的数据文件路径"""
+        return os.path.join(self.root, f"{day}.bin")
+
+    def append(self, venue: str, rows: Iterable[TickRow], ts: Optional[int] = None) -> int:
+        """记录一个交易所的一批行情
+
+        与上次记录相比费率、预测费率和结算时间都没有变化，且未超过 heartbeat 的行会被跳过。
+
+        Returns:
+            int: 实际写入的记录数
+        """
+        ts = ts if ts is not None else int(time.time() * 1000)
+        venue_id = VENUES[venue]
+        with self._lock:
+            records = []
+            known_symbols = len(self.symbols)
+            for symbol, rate, predicted_rate, mark_price, next_funding_time in rows:
+                symbol_id = self._symbol_id(symbol)
+                key = (venue_id, symbol_id)
+                # NaN与自身不相等，比较前换成None
+                state = (rate, None if np.isnan(predicted_rate) else predicted_rate, next_funding_time)
+                last = self._last.get(key)
+                if last is not None and last[1:] == state and ts - last[0] < self.heartbeat * 1000:
+                    continue
+                self._last[key] = (ts,) + state
+                records.append((ts, next_funding_time, rate, predicted_rate, mark_price, symbol_id, venue_id))
+            # 新交易对的编号在本批全部分配后一次写入索引
+            if len(self.symbols) > known_symbols:
+                self._save_index()
+            if not records:
+                return 0
+
+            array = np.array(records, dtype=RECORD_DTYPE)
+            day = datetime.fromtimestamp(ts / 1000, timezone.utc).strftime('%Y%m%d')
+            with open(self.day_path(day), 'ab') as f:
+                f.write(array.tobytes())
+            return len(records)
+
+    def read_day(self, day: str) -> np.ndarray:
+        """内存映射读取某一天的全部记录，文件不存在时返回空数组"""
+        path = self.day_path(day)
+        if not os.path.exists(path):
+            return np.empty(0, dtype=RECORD_DTYPE)
+        # 只映射完整的记录，忽略正在写入的半条记录
+        count = os.path.getsize(path) // RECORD_DTYPE.itemsize
+        if count == 0:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return np.memmap(path, dtype=RECORD_DTYPE, mode='r', shape=(count,))
+
+    def read_range(self, start_ms: int, end_ms: int) -> List[np.ndarray]:
+        """读取时间范围内的记录，每天一个不复制数据的切片"""
+        slices = []
+        day = datetime.fromtimestamp(start_ms / 1000, timezone.utc).date()
+        last_day = datetime.fromtimestamp(end_ms / 1000, timezone.utc).date()
+        while day <= last_day:
+            records = self.read_day(day.strftime('%Y%m%d'))
+            if len(records):
+                lo = np.searchsorted(records['ts'], start_ms, side='left')
+                hi = np.searchsorted(records['ts'], end_ms, side='right')
+                if hi > lo:
+                    slices.append(records[lo:hi])
+            day += timedelta(days=1)
+        return slices
+
+    def history(self, symbol: str, start_ms: int, end_ms: int, venue: Optional[str] = None) -> np.ndarray:
+        """查询单个交易对在时间范围内的记录
+
+        Returns:
+            np.ndarray: RECORD_DTYPE 结构化数组，按时间排序
+        """
+        symbol_id = self.symbol_ids.get(symbol)
+        if symbol_id is None:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        parts = []
+        for records in self.read_range(start_ms, end_ms):
+            mask = records['symbol_id'] == symbol_id
+            if venue is not None:
+                mask &= records['venue'] == VENUES[venue]
+            parts.append(records[mask])
+        if not parts:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return np.concatenate(parts)
+
+
+# 已结算的历史资金费率，按交易所和交易对分文件，按结算时间顺序追加
+HISTORY_DTYPE = np.dtype([
+    ('time', '<i8'),          # 结算时间（毫秒）
+    ('rate', '<f8'),          # 资金费率（百分比）
+    ('mark_price', '<f8'),    # 结算时的标记价格，没有时为NaN
+])
+
+
+class FundingHistoryStore:
+    """已结算资金费率的历史存储
+
+    每个交易所一个目录，每个交易对（交易所的原生名称）一个文件。文件末尾一条记录
+    的时间即下载进度，补数据时从这里继续。
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def path(self, venue: str, symbol: str) -> str:
+        return os.path.join(self.root, venue, f"{symbol}.bin")
+
+    def symbols(self, venue: str) -> List[str]:
+        """已有历史数据的交易对"""
+        directory = os.path.join(self.root, venue)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-4] for name in os.listdir(directory) if name.endswith('.bin'))
+
+    def read(self, venue: str, symbol: str) -> np.ndarray:
+        """内存映射读取交易对的全部历史"""
+        path = self.path(venue, symbol)
+        if not os.path.exists(path):
+            return np.empty(0, dtype=HISTORY_DTYPE)
+        count = os.path.getsize(path) // HISTORY_DTYPE.itemsize
+        if count == 0:
+            return np.empty(0, dtype=HISTORY_DTYPE)
+        return np.memmap(path, dtype=HISTORY_DTYPE, mode='r', shape=(count,))
+
+    def last_time(self, venue: str, symbol: str) -> Optional[int]:
+        """最后一条记录的结算时间，没有数据时返回None"""
+        records = self.read(venue, symbol)
+        return int(records['time'][-1]) if len(records) else None
+
+    def append(self, venue: str, symbol: str, rows: Iterable[Tuple[int, float, float]]) -> int:
+        """追加 (结算时间, 费率, 标记价格) 记录，早于已有最后一条的记录会被丢弃
+
+        Returns:
+            int: 实际写入的记录数
+        """
+        array = np.array(sorted(rows), dtype=HISTORY_DTYPE)
+        with self._lock:
+            last = self.last_time(venue, symbol)
+            if last is not None:
+                array = array[array['time'] > last]
+            if not len(array):
+                return 0
+            path = self.path(venue, symbol)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'ab') as f:
+                f.write(array.tobytes())
+            return len(array)
@@ -1,43 +1,224 @@
 import aiohttp
 import asyncio
 import json
+import threading
+import time
+import requests
 from datetime import datetime, timedelta
 import pytz
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+from ws_stream import WebSocketStream
+from async_runtime import PooledSession
+from exchange_endpoints import HYPERLIQUID_INFO_URL
+from logging_setup import get_logger
+import metrics
+
+logger = get_logger(__name__)
+
+def next_hourly_funding_time(tz) -> datetime:
+    """Hyperliquid每小时结算一次，返回下一个整点时间"""
+    current_time = datetime.now(tz)
+    return current_time.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+
+class HyperliquidStream(WebSocketStream):
+    """通过WebSocket订阅Hyperliquid行情，维护每个币种的资金费率、标记价格和持仓量"""
+
+    WS_URL = "wss://api.hyperliquid.xyz/ws"
+    INFO_URL = HYPERLIQUID_INFO_URL
+
+    def __init__(self, url: str = WS_URL, info_url: str = INFO_URL):
+        super().__init__(url, name="Hyperliquid行情", stale_after=30.0)
+        self.info_url = info_url
+        self.beijing_tz = pytz.timezone('Asia/Shanghai')
+        self.coins: List[str] = []
+        self.asset_ctxs: Dict[str, Dict] = {}
+        self.mids: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def load_universe(self) -> List[str]:
+        """通过REST获取未下架的币种列表"""
+        with metrics.track('hyperliquid', 'meta') as call:
+            response = requests.post(self.info_url, json={"type": "meta"}, timeout=10)
+            call.status = response.status_code
+            response.raise_for_status()
+        data = response.json()
+        return [item['name'] for item in data.get('universe', []) if not item.get('isDelisted', False)]
+
+    def on_connected(self):
+        coins = self.load_universe()
+        if coins:
+            self.coins = coins
+            # 移除已下架的币种
+            with self._lock:
+                for coin in list(self.asset_ctxs):
+                    if coin not in coins:
+                        del self.asset_ctxs[coin]
+
+        self.send_json({"method": "subscribe", "subscription": {"type": "allMids"}})
+        for coin in self.coins:
+            self.send_json({"method": "subscribe", "subscription": {"type": "activeAssetCtx", "coin": coin}})
+        logger.info("%s 已订阅 %d 个币种", self.name, len(self.coins))
+
+    def on_message(self, message):
+        channel = message.get('channel')
+        data = message.get('data')
+        if channel == 'activeAssetCtx':
+            ctx = data.get('ctx', {})
+            coin = data.get('coin')
+            if not coin or 'funding' not in ctx:
+                return
+            with self._lock:
+                self.asset_ctxs[coin] = {
+                    'funding_rate': float(ctx['funding']),
+                    'mark_price': float(ctx.get('markPx') or 0),
+                    'oracle_price': float(ctx.get('oraclePx') or 0),
+                    'open_interest': float(ctx.get('openInterest') or 0),
+                    'updated_at': time.time()
+                }
+        elif channel == 'allMids':
+            mids = data.get('mids', {})
+            with self._lock:
+                for coin, mid in mids.items():
+                    self.mids[coin] = float(mid)
+
+    def is_ready(self) -> bool:
+        """推送数据新鲜且已覆盖大部分币种"""
+        return self.is_fresh() and bool(self.coins) and len(self.asset_ctxs) >= len(self.coins) * 0.9
+
+    def get_mids(self) -> Dict[str, float]:
+        """所有币种的最新中间价，推送过期时返回空字典"""
+        if not self.is_fresh():
+            return {}
+        with self._lock:
+            return dict(self.mids)
+
+    def get_mid(self, coin: str) -> Optional[float]:
+        """单个币种的最新中间价，推送过期或没有数据时返回None"""
+        if not self.is_fresh():
+            return None
+        return self.mids.get(coin)
+
+    def get_asset_ctx(self, coin: str) -> Optional[Dict]:
+        """获取单个币种的行情上下文"""
+        with self._lock:
+            ctx = self.asset_ctxs.get(coin)
+            return dict(ctx) if ctx else None
+
+    def get_funding_rates(self) -> Dict:
+        """以与REST接口相同的格式返回所有币种的资金费率"""
+        next_hour = next_hourly_funding_time(self.beijing_tz)
+        with self._lock:
+            return {
+                f"{coin}USDT": {
+                    "funding_rate": ctx['funding_rate'],
+                    "next_funding_time": next_hour,
+                    "mark_price": ctx['mark_price']
+                }
+                for coin, ctx in self.asset_ctxs.items()
+            }
 
 class HyperliquidAPI:
-    def __init__(self):
-        self.base_url = "https://api.hyperliquid.xyz/info"
+    # 推送可用时资金费率不再请求 predictedFundings，其他交易所的预测费率由后台按该间隔（秒）刷新
+    VENUE_POLL_INTERVAL = 60.0
+
+    def __init__(self, stream: Optional[HyperliquidStream] = None,
+                 pool_size: int = 10, dns_ttl: int = 300, timeout: float = 10.0, meta_ttl: float = 300):
+        """
+        Args:
+            stream: 可选的WebSocket行情订阅，数据新鲜时优先使用
+            pool_size: 连接池最大连接数
+            dns_ttl: DNS缓存时间（秒）
+            timeout: 单次请求超时时间（秒）
+            meta_ttl: 合约列表缓存时间（秒），缓存有效时获取资金费率只需一次请求
+        """
+        self.base_url = HYPERLIQUID_INFO_URL
         self.headers = {
             "Content-Type": "application/json",
             "Accept": "application/json"
         }
         self.beijing_tz = pytz.timezone('Asia/Shanghai')
+        self.stream = stream
+        self.meta_ttl = meta_ttl
+        self._contracts: List[str] = []
+        self._contracts_at = 0.0
+        # predictedFundings 中其他交易所（如 BinPerp）的预测费率，按原始币种名称索引
+        self.venue_rates: Dict[str, Dict[str, Dict]] = {}
+        self.venue_rates_at = 0.0
+        self._venue_poll_thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        # 会话和连接池由API对象持有，运行在常驻事件循环中，在请求之间复用
+        self._http = PooledSession("hyperliquid-http", pool_size=pool_size, dns_ttl=dns_ttl, timeout=timeout)
+
+    def close(self):
+        """停止后台轮询，关闭连接池和常驻事件循环"""
+        self.stop_venue_poll()
+        self._http.close()
+
+    def start_venue_poll(self, interval: float = VENUE_POLL_INTERVAL):
+        """启动后台线程，推送可用期间定期请求 predictedFundings 刷新其他交易所的预测费率
+
+        推送不可用时资金费率走REST接口，每次都会顺带刷新，后台不再重复请求。
+        """
+        if self._venue_poll_thread and self._venue_poll_thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._venue_poll_thread = threading.Thread(target=self._venue_poll_loop, args=(interval,),
+                                                   name="hyperliquid-venue-poll", daemon=True)
+        self._venue_poll_thread.start()
+
+    def stop_venue_poll(self):
+        """停止后台轮询"""
+        self._stop_event.set()
+
+    def _venue_poll_loop(self, interval: float):
+        while not self._stop_event.is_set():
+            if self.stream is not None and self.stream.is_ready() and time.time() - self.venue_rates_at >= interval:
+                try:
+                    self._http.runtime.run_sync(self._fetch_all_funding_rates(), timeout=self._http.timeout * 2)
+                except Exception as e:
+                    logger.warning("刷新其他交易所的预测资金费率失败: %s", e)
+            self._stop_event.wait(min(interval, 5.0))
+
+    async def _post_info(self, session: aiohttp.ClientSession, payload: Dict) -> Tuple[int, object]:
+        """请求info接口并记录耗时
+
+        Returns:
+            Tuple[int, object]: (HTTP状态码, 状态码为200时解析后的JSON，否则为None)
+        """
+        with metrics.track('hyperliquid', payload['type']) as call:
+            async with session.post(self.base_url, headers=self.headers, json=payload) as response:
+                call.status = response.status
+                if response.status != 200:
+                    return response.status, None
+                return response.status, await response.json()
 
     async def get_all_contracts(self, session: aiohttp.ClientSession) -> List[str]:
-        """获取所有可交易的合约列表"""
+        """获取所有可交易的合约列表，在 meta_ttl 内复用上次的结果"""
+        if self._contracts and time.time() - self._contracts_at < self.meta_ttl:
+            return self._contracts
         try:
             payload = {"type": "meta"}
-            print(f"请求合约列表，URL: {self.base_url}")
-            print(f"请求参数: {payload}")
+            logger.debug("请求合约列表，URL: %s，参数: %s", self.base_url, payload)
             
-            async with session.post(self.base_url, headers=self.headers, json=payload) as response:
-                if response.status != 200:
-                    print(f"获取合约列表失败，状态码: {response.status}")
-                    return []
-                    
-                data = await response.json()
-                print(f"获取到的合约列表原始数据: {data}")
+            status, data = await self._post_info(session, payload)
+            if status != 200:
+                logger.error("获取合约列表失败，状态码: %s", status)
+                return []
+
+            logger.debug("获取到的合约列表原始数据: %s", data)
+            
+            if not isinstance(data, dict) or "universe" not in data:
+                logger.error("合约列表数据格式错误")
+                return []
                 
-                if not isinstance(data, dict) or "universe" not in data:
-                    print("合约列表数据格式错误")
-                    return []
-                    
-                contracts = [f"{item['name']}USDT" for item in data["universe"] if not item.get("isDelisted", False)]
-                print(f"处理后的合约列表: {contracts}")
-                return contracts
+            contracts = [f"{item['name']}USDT" for item in data["universe"] if not item.get("isDelisted", False)]
+            logger.debug("处理后的合约列表: %s", contracts)
+            if contracts:
+                self._contracts = contracts
+                self._contracts_at = time.time()
+            return contracts
         except Exception as e:
-            print(f"获取合约列表时发生错误: {e}")
+            logger.error("获取合约列表时发生错误: %s", e)
             return []
 
     async def get_predicted_funding_rates(self, session: aiohttp.ClientSession) -> Optional[Dict]:
@@ -46,118 +227,162 @@ class HyperliquidAPI:
             # 首先获取所有合约
             contracts = await self.get_all_contracts(session)
             if not contracts:
-                print("无法获取合约列表")
+                logger.error("无法获取合约列表")
                 return None
                 
-            print(f"开始获取资金费率，合约数量: {len(contracts)}")
+            logger.debug("开始获取资金费率，合约数量: %d", len(contracts))
             
             payload = {"type": "predictedFundings"}
-            print(f"请求资金费率，URL: {self.base_url}")
-            print(f"请求参数: {payload}")
+            logger.debug("请求资金费率，URL: %s，参数: %s", self.base_url, payload)
             
-            async with session.post(self.base_url, headers=self.headers, json=payload) as response:
-                if response.status != 200:
-                    print(f"获取资金费率失败，状态码: {response.status}")
-                    return None
-                    
-                data = await response.json()
-                print(f"获取到的资金费率数据长度: {len(data)}")
-                
-                if not isinstance(data, list):
-                    print(f"资金费率数据格式错误，期望list但收到: {type(data)}")
-                    return None
-                    
-                predicted_rates = {}
-                valid_count = 0
-                error_count = 0
+            status, data = await self._post_info(session, payload)
+            if status != 200:
+                logger.error("获取资金费率失败，状态码: %s", status)
+                return None
+
+            logger.debug("获取到的资金费率数据长度: %d", len(data))
+            
+            if not isinstance(data, list):
+                logger.error("资金费率数据格式错误，期望list但收到: %s", type(data))
+                return None
                 
-                for item in data:
-                    try:
-                        if not isinstance(item, list) or len(item) < 2:
-                            print(f"跳过无效数据项: {item}")
-                            error_count += 1
-                            continue
-                            
-                        coin = f"{item[0]}USDT"
-                        if coin not in contracts:
-                            print(f"跳过未知合约: {coin}")
-                            error_count += 1
-                            continue
-                            
-                        venues = item[1]
-                        if not isinstance(venues, list):
-                            print(f"跳过无效venue数据: {venues}")
-                            error_count += 1
+            predicted_rates = {}
+            venue_rates: Dict[str, Dict[str, Dict]] = {}
+            valid_count = 0
+            error_count = 0
+            
+            for item in data:
+                try:
+                    if not isinstance(item, list) or len(item) < 2:
+                        logger.debug("跳过无效数据项: %s", item)
+                        error_count += 1
+                        continue
+                        
+                    coin = f"{item[0]}USDT"
+                    if coin not in contracts:
+                        logger.debug("跳过未知合约: %s", coin)
+                        error_count += 1
+                        continue
+                        
+                    venues = item[1]
+                    if not isinstance(venues, list):
+                        logger.debug("跳过无效venue数据: %s", venues)
+                        error_count += 1
+                        continue
+                        
+                    found_funding_rate = False
+                    for venue in venues:
+                        if not isinstance(venue, list) or len(venue) < 2:
                             continue
                             
-                        found_funding_rate = False
-                        for venue in venues:
-                            if not isinstance(venue, list) or len(venue) < 2:
-                                continue
-                                
-                            if venue[0] == "HlPerp":
-                                try:
-                                    venue_data = venue[1]
-                                    if not isinstance(venue_data, dict) or "fundingRate" not in venue_data:
-                                        print(f"合约 {coin} 的资金费率数据无效: {venue_data}")
-                                        continue
-                                        
-                                    funding_rate = float(venue_data["fundingRate"])
-                                    
-                                    # 获取当前时间
-                                    current_time = datetime.now(self.beijing_tz)
-                                    # 计算下一个整点时间
-                                    next_hour = current_time.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
-                                    
-                                    predicted_rates[coin] = {
-                                        "funding_rate": funding_rate,
-                                        "next_funding_time": next_hour
-                                    }
-                                    valid_count += 1
-                                    found_funding_rate = True
-                                    print(f"成功获取{coin}的资金费率: {funding_rate}")
-                                except (ValueError, TypeError, KeyError) as e:
-                                    print(f"处理{coin}的资金费率时出错: {str(e)}")
-                                    error_count += 1
+                        if venue[0] != "HlPerp":
+                            # 其他交易所的预测费率和下次结算时间（毫秒），一并保存
+                            venue_data = venue[1]
+                            try:
+                                venue_rates.setdefault(venue[0], {})[item[0]] = {
+                                    "funding_rate": float(venue_data["fundingRate"]),
+                                    "next_funding_time": int(venue_data["nextFundingTime"])
+                                }
+                            except (ValueError, TypeError, KeyError):
+                                pass
+                        elif venue[0] == "HlPerp":
+                            try:
+                                venue_data = venue[1]
+                                if not isinstance(venue_data, dict) or "fundingRate" not in venue_data:
+                                    logger.debug("合约 %s 的资金费率数据无效: %s", coin, venue_data)
                                     continue
                                     
-                        if not found_funding_rate:
-                            print(f"未找到{coin}的资金费率数据")
-                            error_count += 1
-                            
-                    except Exception as e:
-                        print(f"处理数据项时出错: {str(e)}")
+                                funding_rate = float(venue_data["fundingRate"])
+                                
+                                # 计算下一个整点时间
+                                next_hour = next_hourly_funding_time(self.beijing_tz)
+                                
+                                predicted_rates[coin] = {
+                                    "funding_rate": funding_rate,
+                                    "next_funding_time": next_hour
+                                }
+                                valid_count += 1
+                                found_funding_rate = True
+                                logger.debug("成功获取%s的资金费率: %s", coin, funding_rate)
+                            except (ValueError, TypeError, KeyError) as e:
+                                logger.debug("处理%s的资金费率时出错: %s", coin, e)
+                                error_count += 1
+                                continue
+                                
+                    if not found_funding_rate:
+                        logger.debug("未找到%s的资金费率数据", coin)
                         error_count += 1
-                        continue
-                    
-                print(f"资金费率处理统计:")
-                print(f"- 成功处理的合约数量: {valid_count}")
-                print(f"- 处理失败的合约数量: {error_count}")
-                print(f"- 总合约数量: {len(data)}")
+                        
+                except Exception as e:
+                    logger.debug("处理数据项时出错: %s", e)
+                    error_count += 1
+                    continue
                 
-                if valid_count == 0:
-                    print("警告：没有成功处理任何合约的资金费率")
-                    return None
-                    
-                return predicted_rates
+            logger.debug("资金费率处理统计: 成功 %d，失败 %d，总数 %d", valid_count, error_count, len(data))
+            
+            self.venue_rates = venue_rates
+            self.venue_rates_at = time.time()
+            
+            if valid_count == 0:
+                logger.warning("没有成功处理任何合约的资金费率")
+                return None
                 
+            return predicted_rates
+            
         except Exception as e:
-            print(f"获取预测资金费率时发生错误: {e}")
+            logger.error("获取预测资金费率时发生错误: %s", e)
             return None
 
     async def get_all_funding_rates(self) -> Dict:
-        """获取所有合约的资金费率"""
+        """获取所有合约的资金费率
+
+        WebSocket推送数据新鲜时直接读取内存，否则回退到REST接口
+        """
+        if self.stream is not None and self.stream.is_ready():
+            return self.stream.get_funding_rates()
+
+        return await self._http.run(self._fetch_all_funding_rates())
+
+    async def get_dual_venue_funding_rates(self, venue: str = "BinPerp") -> Tuple[Dict, Dict[str, Dict]]:
+        """一次请求同时获取Hyperliquid资金费率和另一个交易所的预测费率
+
+        不使用WebSocket数据，保证两边来自同一份 predictedFundings 结果。
+
+        Returns:
+            Tuple[Dict, Dict[str, Dict]]: (Hyperliquid资金费率, 按币种索引的另一个交易所预测费率)
+        """
+        rates = await self._http.run(self._fetch_all_funding_rates())
+        if "error" in rates:
+            return rates, {}
+        return rates, dict(self.venue_rates.get(venue, {}))
+
+    def get_cached_venue_rates(self, venue: str = "BinPerp", max_age: float = 10.0) -> Optional[Dict[str, Dict]]:
+        """获取最近一次 predictedFundings 请求（REST路径或后台轮询）中其他交易所的预测费率，超过 max_age 秒返回None"""
+        if not self.venue_rates_at or time.time() - self.venue_rates_at > max_age:
+            return None
+        return dict(self.venue_rates.get(venue, {}))
+
+    async def get_venue_funding_rates(self, venue: str = "BinPerp", max_age: float = 10.0) -> Dict[str, Dict]:
+        """获取其他交易所的预测费率，缓存过期时请求一次 predictedFundings"""
+        cached = self.get_cached_venue_rates(venue, max_age)
+        if cached is not None:
+            return cached
+        _, rates = await self.get_dual_venue_funding_rates(venue)
+        return rates
+
+    async def _fetch_all_funding_rates(self) -> Dict:
+        """通过REST接口获取所有合约的资金费率，在常驻事件循环中执行"""
         try:
-            async with aiohttp.ClientSession() as session:
-                predicted_rates = await self.get_predicted_funding_rates(session)
-                if predicted_rates is None:
-                    print("无法获取预测费率")
-                    return {"error": "无法获取合约列表"}
-
-                print(f"获取到 {len(predicted_rates)} 个合约的资金费率")
-                return predicted_rates
+            session = await self._http.get()
+            predicted_rates = await self.get_predicted_funding_rates(session)
+            if predicted_rates is None:
+                logger.error("无法获取预测费率")
+                return {"error": "无法获取合约列表"}
+
+            logger.debug("获取到 %d 个合约的资金费率", len(predicted_rates))
+            return predicted_rates
         except Exception as e:
-            print(f"获取资金费率时发生错误: {e}")
+            logger.error("获取资金费率时发生错误: %s", e)
             return {"error": str(e)}
 
     def format_funding_rates(self, rates: Dict) -> str:
@@ -176,10 +401,18 @@ class HyperliquidAPI:
 
         return "\n".join(output)
 
+_default_api: Optional[HyperliquidAPI] = None
+
+def get_default_api() -> HyperliquidAPI:
+    """获取模块级共享的API对象，复用其连接池"""
+    global _default_api
+    if _default_api is None:
+        _default_api = HyperliquidAPI()
+    return _default_api
+
 async def get_funding_rates() -> Dict:
     """获取所有合约资金费率的便捷函数"""
-    api = HyperliquidAPI()
-    return await api.get_all_funding_rates()
+    return await get_default_api().get_all_funding_rates()
 
 def print_funding_rates(rates: Dict) -> None:
     """打印资金费率信息的便捷函数"""
@@ -192,3 +425,4 @@ if __name__ == "__main__":
         print_funding_rates(rates)
 
     asyncio.run(main())
+    get_default_api().close()
@@ -0,0 +1,131 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+import metrics
+from ws_stream import WebSocketStream
+from exchange_endpoints import HYPERLIQUID_INFO_URL
+from logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+
+class HyperliquidAccountState:
+    """Hyperliquid永续合约账户的内存状态：保证金汇总和按币种索引的持仓
+
+    数据来自 clearinghouseState（REST全量查询或 webData2 推送中的同名字段），每次整体替换。
+    """
+
+    def __init__(self):
+        self.margin_summary: Dict[str, float] = {}
+        self.withdrawable = 0.0
+        self.positions: Dict[str, Dict] = {}
+        self.updated_at = 0.0
+        self._lock = threading.Lock()
+
+    def load(self, clearinghouse: Dict):
+        """用 clearinghouseState 的内容替换状态"""
+        summary = clearinghouse.get('marginSummary', {})
+        positions = {}
+        for item in clearinghouse.get('assetPositions', []):
+            position = item.get('position', {})
+            size = float(position.get('szi') or 0)
+            if not size:
+                continue
+            value = float(position.get('positionValue') or 0)
+            leverage = position.get('leverage') or {}
+            liquidation = position.get('liquidationPx')
+            positions[position['coin']] = {
+                'size': size,
+                'entry_price': float(position.get('entryPx') or 0),
+                # 推送中没有标记价格，用持仓价值反推
+                'mark_price': value / abs(size),
+                'position_value': value,
+                'unrealized_pnl': float(position.get('unrealizedPnl') or 0),
+                'margin_used': float(position.get('marginUsed') or 0),
+                'leverage': int(leverage.get('value') or 1),
+                'margin_mode': leverage.get('type', 'cross'),
+                'liquidation_price': float(liquidation) if liquidation else None
+            }
+        with self._lock:
+            self.margin_summary = {key: float(value) for key, value in summary.items()}
+            self.withdrawable = float(clearinghouse.get('withdrawable') or 0)
+            self.positions = positions
+            self.updated_at = time.time()
+
+    def balance(self) -> float:
+        """账户价值（USDC），与 fetch_balance 的 total 一致"""
+        return self.margin_summary.get('accountValue', 0.0)
+
+    def position(self, coin: str) -> Optional[Dict]:
+        position = self.positions.get(coin)
+        return dict(position, coin=coin) if position else None
+
+    def all_positions(self) -> List[Dict]:
+        return [dict(position, coin=coin) for coin, position in list(self.positions.items())]
+
+    def leverage(self) -> Dict[str, tuple]:
+        """币种 -> (杠杆, 保证金模式)"""
+        return {coin: (position['leverage'], position['margin_mode']) for coin, position in list(self.positions.items())}
+
+
+class HyperliquidAccountStream(WebSocketStream):
+    """订阅用户的 webData2 推送，维护账户保证金和持仓
+
+    webData2 每个区块推送一次完整的 clearinghouseState，推送中断超过 stale_after 时视为过期，
+    调用方应回退到REST接口。每次(重)连接后先通过REST同步一次，连接建立到第一条推送之间也有数据可读。
+    """
+
+    WS_URL = "wss://api.hyperliquid.xyz/ws"
+
+    def __init__(self, user: str, url: str = WS_URL, info_url: str = HYPERLIQUID_INFO_URL,
+                 state: Optional[HyperliquidAccountState] = None,
+                 on_leverage: Optional[Callable[[str, int, str], None]] = None):
+        """
+        Args:
+            user: 钱包地址
+            url: WebSocket地址
+            info_url: info接口地址，用于REST同步
+            state: 账户状态，不传则新建
+            on_leverage: 持仓杠杆的回调 (coin, leverage, margin_mode)，用于同步杠杆缓存
+        """
+        super().__init__(url, name="Hyperliquid账户", stale_after=30.0)
+        self.user = user
+        self.info_url = info_url
+        self.state = state or HyperliquidAccountState()
+        self.on_leverage = on_leverage
+        self.synced = False
+
+    def is_ready(self) -> bool:
+        """推送数据新鲜且已完成本次连接后的同步"""
+        return self.synced and self.is_fresh()
+
+    def resync(self):
+        """通过REST查询 clearinghouseState 同步"""
+        with metrics.track('hyperliquid', 'clearinghouseState') as call:
+            response = requests.post(self.info_url, json={"type": "clearinghouseState", "user": self.user}, timeout=10)
+            call.status = response.status_code
+            response.raise_for_status()
+        self._apply(response.json())
+        logger.info("%s 已同步: %d 个持仓", self.name, len(self.state.positions))
+
+    def _apply(self, clearinghouse: Dict):
+        self.state.load(clearinghouse)
+        if self.on_leverage:
+            for coin, (leverage, margin_mode) in self.state.leverage().items():
+                self.on_leverage(coin, leverage, margin_mode)
+
+    def on_connected(self):
+        self.synced = False
+        self.resync()
+        self.synced = True
+        self.send_json({"method": "subscribe", "subscription": {"type": "webData2", "user": self.user}})
+
+    def on_message(self, message):
+        if message.get('channel') != 'webData2':
+            return
+        clearinghouse = (message.get('data') or {}).get('clearinghouseState')
+        if clearinghouse:
+            self._apply(clearinghouse)
@@ -4,12 +4,66 @@ import ccxt
 import time
 import math
 from typing import Dict, Optional, List
+from instrument_cache import InstrumentCache
+from leverage_cache import LeverageCache, prewarm
+from hyperliquid_account import HyperliquidAccountStream
+from symbol_registry import SymbolRegistry, legacy_base
+from exchange_endpoints import apply_hyperliquid_urls
+from metrics import instrument_ccxt_exchange
+from logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+class HyperliquidMarketIndex(InstrumentCache):
+    """Hyperliquid永续合约市场信息索引
+
+    同时按ccxt交易对（如 'BTC/USDC:USDC'）和基础币种（如 'BTC'、'kPEPE'）索引，
+    精度、杠杆上限和资产编号都从内存读取。
+    """
+
+    def __init__(self, exchange, ttl: float = 300):
+        super().__init__(exchange, ttl=ttl)
+        self.by_base: Dict[str, Dict] = {}
+
+    def _load(self) -> Dict[str, Dict]:
+        # load_markets 同时刷新ccxt内部的市场缓存，下单时不会再次下载
+        markets = self.client.load_markets(reload=True)
+        by_symbol = {}
+        by_base = {}
+        for symbol, market in markets.items():
+            if not market.get('swap'):
+                continue
+            by_symbol[symbol] = market
+            by_base[market['base']] = market
+            if market.get('baseName'):
+                by_base[market['baseName']] = market
+        self.by_base = by_base
+        return by_symbol
+
+    def get(self, symbol: str) -> Optional[Dict]:
+        """按ccxt交易对或基础币种查找市场信息"""
+        self._ensure_loaded()
+        market = self.instruments.get(symbol) or self.by_base.get(symbol)
+        if market is None:
+            market = super().get(symbol) or self.by_base.get(symbol)
+        return market
+
+    def active_symbols(self) -> List[str]:
+        self._ensure_loaded()
+        return [symbol for symbol, market in self.instruments.items() if market.get('active', True)]
 
 class HyperliquidTrader:
-    def __init__(self):
+    # 设置杠杆时同时设置保证金模式，下单统一使用全仓
+    MARGIN_MODE = 'cross'
+
+    def __init__(self, symbols: Optional[SymbolRegistry] = None, price_stream=None):
         """
         初始化HyperliquidTrader类
         加载API密钥和其他配置
+
+        Args:
+            symbols: 可选，共享的交易对注册表，用于把币安写法（如 '1000PEPEUSDT'）映射为Hyperliquid币种
+            price_stream: 可选，HyperliquidStream 对象，推送新鲜时价格直接读取其中的中间价
         """
         self.load_config()
         self.exchange = ccxt.hyperliquid({
@@ -19,6 +73,16 @@ class HyperliquidTrader:
             'walletAddress': self.wallet_address,
             'privateKey': self.private_key,
         })
+        apply_hyperliquid_urls(self.exchange)
+        instrument_ccxt_exchange(self.exchange, 'hyperliquid')
+        self.markets = HyperliquidMarketIndex(self.exchange)
+        self.symbols = symbols or SymbolRegistry()
+        self.markets.add_listener(self.symbols.update_hyperliquid_markets)
+        # 各交易对当前生效的杠杆，下单时杠杆未变化则不再发送设置请求
+        self.leverage = LeverageCache()
+        # 账户推送维护的保证金和持仓，未启动或推送过期时查询走REST
+        self.account_stream: Optional[HyperliquidAccountStream] = None
+        self.price_stream = price_stream
 
     def load_config(self):
         """
@@ -42,8 +106,53 @@ class HyperliquidTrader:
         except Exception as e:
             raise Exception(f"加载配置失败: {str(e)}")
 
+    def resolve_market(self, symbol: str) -> Optional[Dict]:
+        """把任意写法的交易对（如 'BTC'、'BTCUSDT'、'kPEPE'、'BTC/USDC:USDC'）解析为市场信息"""
+        return self.markets.get(self.symbols.hl_coin(symbol))
+
+    def start_account_stream(self) -> HyperliquidAccountStream:
+        """启动账户推送，之后余额和持仓查询直接读取内存"""
+        if self.account_stream is None:
+            self.account_stream = HyperliquidAccountStream(self.wallet_address, on_leverage=self._on_stream_leverage)
+        self.account_stream.start()
+        return self.account_stream
+
+    def stop_account_stream(self):
+        if self.account_stream:
+            self.account_stream.stop()
+
+    def _on_stream_leverage(self, coin: str, leverage: int, margin_mode: str):
+        market = self.markets.get(coin)
+        if market:
+            self.leverage.set(market['symbol'], leverage, margin_mode)
+
+    def _to_ccxt_position(self, position: Dict) -> Dict:
+        """把账户推送中的持仓转换为与 fetch_positions 相同的字段"""
+        market = self.markets.get(position['coin'])
+        return {
+            'symbol': market['symbol'] if market else f"{position['coin']}/USDC:USDC",
+            'contracts': abs(position['size']),
+            'side': 'long' if position['size'] > 0 else 'short',
+            'entryPrice': position['entry_price'],
+            'markPrice': position['mark_price'],
+            'notional': position['position_value'],
+            'unrealizedPnl': position['unrealized_pnl'],
+            'leverage': position['leverage'],
+            'marginMode': position['margin_mode'],
+            'liquidationPrice': position['liquidation_price'],
+            'initialMargin': position['margin_used']
+        }
+
+    def fetch_positions(self) -> List[Dict]:
+        """获取所有持仓（ccxt格式），账户推送就绪时从内存读取，否则请求REST"""
+        if self.account_stream and self.account_stream.is_ready():
+            return [self._to_ccxt_position(p) for p in self.account_stream.state.all_positions()]
+        return self.exchange.fetch_positions()
+
     def get_account_balance(self) -> float:
         """获取账户USDC余额"""
+        if self.account_stream and self.account_stream.is_ready():
+            return self.account_stream.state.balance()
         try:
             balance = self.exchange.fetch_balance({
                 'user': self.wallet_address
@@ -52,245 +161,279 @@ class HyperliquidTrader:
                 return float(balance['total']['USDC'])
             return 0.0
         except Exception as e:
-            print(f"获取账户余额失败: {str(e)}")
+            logger.error("获取账户余额失败: %s", e)
             return 0.0
 
     def get_position(self, symbol: str) -> Dict:
         """获取指定交易对的持仓信息"""
         try:
-            print(f"\n=== 开始获取持仓信息 ===")
-            print(f"输入的交易对: {symbol}")
+            logger.debug("开始获取持仓信息")
+            logger.debug("输入的交易对: %s", symbol)
             
             # 获取所有持仓信息
-            all_positions = self.exchange.fetch_positions()
-            print(f"获取到所有持仓信息: {all_positions}")
+            all_positions = self.fetch_positions()
+            logger.debug("获取到所有持仓信息: %s", all_positions)
             
             # 处理交易对格式
-            base_symbol = symbol.split('/')[0] if '/' in symbol else symbol
-            base_symbol = base_symbol.split(':')[0] if ':' in base_symbol else base_symbol
-            base_symbol = base_symbol.replace('USDT', '')  # 移除USDT后缀
+            market = self.resolve_market(symbol)
+            if not market:
+                logger.warning("找不到交易对 %s 的市场信息", symbol)
+                return None
             
-            print(f"处理后的基础币种: {base_symbol}")
+            logger.debug("处理后的交易对: %s", market['symbol'])
             
             # 遍历所有持仓，查找匹配的持仓
             for position in all_positions:
-                position_symbol = position.get('symbol', '')
-                # 从position symbol中提取基础币种
-                position_base = position_symbol.split('/')[0] if '/' in position_symbol else position_symbol
-                position_base = position_base.split(':')[0] if ':' in position_base else position_base
-                
-                print(f"对比 - 持仓币种: {position_base}, 目标币种: {base_symbol}")
-                
-                if position_base == base_symbol:
-                    print(f"找到匹配的持仓: {position}")
+                if position.get('symbol') == market['symbol']:
+                    logger.debug("找到匹配的持仓: %s", position)
                     return position
             
-            print(f"未找到匹配的持仓")
+            logger.debug("未找到匹配的持仓")
             return None
             
         except Exception as e:
-            print(f"获取持仓信息失败: {str(e)}")
+            logger.error("获取持仓信息失败: %s", e)
             return None
 
-    def place_order(self, symbol, side, order_type='MARKET', quantity=None, price=None, usdt_amount=None, leverage=1, reduce_only=False):
+    def load_leverage(self) -> int:
+        """从当前持仓加载杠杆，初始化杠杆缓存（没有持仓的币种首次下单时再设置）
+
+        Returns:
+            int: 加载的交易对数量
         """
-        统一下单函数
+        positions = [p for p in self.exchange.fetch_positions() if p.get('symbol') and p.get('leverage')]
+        leverage = {p['symbol']: int(float(p['leverage'])) for p in positions}
+        # 持仓可能是逐仓，记录保证金模式，下单时模式不同仍会重新设置
+        self.leverage.seed(leverage, {p['symbol']: p.get('marginMode') for p in positions})
+        return len(leverage)
+
+    def ensure_leverage(self, symbol: str, leverage: int) -> bool:
+        """杠杆或保证金模式与缓存不一致时设置杠杆（同时设为全仓），symbol 为ccxt格式（如 'BTC/USDC:USDC'）
+
+        Returns:
+            bool: 是否实际发送了设置请求
         """
-        try:
-            print("\n=== 开始下单 ===")
-            
-            # 1. 参数验证和处理
-            if not symbol:
-                raise ValueError("交易对不能为空")
-                
-            # 处理交易对格式
-            base_symbol = symbol.split('/')[0] if '/' in symbol else symbol
-            base_symbol = base_symbol.split(':')[0] if ':' in base_symbol else base_symbol
-            formatted_symbol = f"{base_symbol}/USDC:USDC"
-            
-            print(f"处理后的交易对: {formatted_symbol}")
-            
-            # 2. 获取市场信息和价格
-            market = None
-            markets = self.exchange.fetch_markets()
-            for m in markets:
-                if m['symbol'] == formatted_symbol:
-                    market = m
-                    break
-            
-            if not market:
-                raise ValueError(f"找不到交易对 {formatted_symbol} 的市场信息")
-            
-            # 3. 获取价格和精度信息
-            current_price = self.get_symbol_price(formatted_symbol)
-            print(f"当前市场价格: {current_price}")
-            
-            # 处理价格精度
-            price_precision = int(market['precision'].get('price', 8))
-            amount_precision = int(market['precision'].get('amount', 8))
-            
-            # 如果是限价单，使用指定价格；否则使用当前市场价
-            use_price = float(format(float(price), f'.{price_precision}f')) if order_type.upper() == 'LIMIT' and price else current_price
-            print(f"使用价格: {use_price}")
-            
-            # 4. 计算合约数量和保证金
-            if quantity:
-                # 如果直接指定了数量，这个数量就是USDT金额
-                usdt_amount = float(quantity)
-            elif usdt_amount:
-                # 如果指定了USDT金额，直接使用
-                usdt_amount = float(usdt_amount)
-            else:
-                raise ValueError("必须指定数量或USDT金额")
+        return self.leverage.ensure(
+            symbol, leverage, lambda s, l: self.exchange.set_leverage(l, s, {'marginMode': self.MARGIN_MODE}),
+            margin_mode=self.MARGIN_MODE
+        )
 
-            # 计算合约数量
-            contract_amount = usdt_amount / use_price
-            print(f"计算合约数量: usdt_amount={usdt_amount}, use_price={use_price}, contract_amount={contract_amount}")
-            
-            # 直接使用计算出的合约数量，不进行精度调整
-            quantity = contract_amount
-            print(f"使用原始合约数量: quantity={quantity}")
-            
-            if not quantity or quantity <= 0:
-                print(f"无效的下单数量: quantity={quantity}")
-                raise ValueError("无效的下单数量")
+    def prewarm_leverage(self, symbols: List[str], leverage: int, max_workers: int = 8) -> Dict[str, int]:
+        """并发把一组交易对的杠杆设置为目标值（超过交易对最大杠杆时取最大杠杆）
 
-            # # 重新计算实际需要的保证金
-            # actual_margin = (quantity * use_price) / leverage
-            # print(f"实际需要的保证金: {actual_margin} USDC")
-            
-            # # 检查账户余额
-            # balance = self.get_account_balance()
-            # print(f"当前余额: {balance} USDC")
-            
-            # if balance < actual_margin and not reduce_only:  # 如果是平仓单，不检查保证金
-            #     return {
-            #         'status': 'error',
-            #         'message': f'保证金不足。需要 {actual_margin} USDC，当前余额 {balance} USDC'
-            #     }
+        Returns:
+            Dict[str, int]: 统计 {'changed', 'unchanged', 'failed'}
+        """
+        markets = {}
+        for symbol in symbols:
+            market = self.resolve_market(symbol)
+            if market:
+                markets[market['symbol']] = market['limits']['leverage']['max']
 
-            # print(f"最终下单数量: {quantity}")
-            # print(f"订单价值: {usdt_amount} USDC")
-            # print(f"所需保证金: {actual_margin} USDC")
+        def target(symbol: str) -> Optional[int]:
+            max_leverage = markets[symbol]
+            return min(leverage, int(max_leverage)) if max_leverage else leverage
 
-            # 7. 设置杠杆
-            try:
-                self.exchange.set_leverage(leverage, formatted_symbol)
-                print(f"设置杠杆倍数: {leverage}")
-            except Exception as e:
-                print(f"设置杠杆失败: {str(e)}")
-                if not reduce_only:  # 如果是平仓单，忽略设置杠杆失败的错误
-                    raise e
-            
-            # 8. 构建订单参数
-            order_params = {
-                'coin': base_symbol,  # 使用基础币种名称
-                'is_buy': side.upper() == 'BUY',
-                'sz': str(quantity),
-                'reduce_only': reduce_only  # 添加reduce_only参数
-            }
-            
-            # 检查最小订单价值（仅对开仓单有效）
-            min_order_value = 10  # 最小订单价值为10美元
-            order_value = quantity * use_price
-            
-            # 如果是平仓单且订单价值小于最小值，调整数量
-            if reduce_only and order_value < min_order_value:
-                print(f"平仓单价值 ({order_value} USDC) 小于最小要求 ({min_order_value} USDC)，将调整为最小值")
-                # 计算需要的最小数量
-                min_quantity = math.ceil((min_order_value / use_price) * 1.01)  # 增加1%以确保满足最小值要求
-                quantity = min_quantity
-                order_params['sz'] = str(quantity)
-                print(f"调整后的数量: {quantity}")
-            elif not reduce_only and order_value < min_order_value:
-                return {
-                    'status': 'error',
-                    'message': f'订单价值必须大于{min_order_value}美元。当前订单价值: {order_value}美元'
-                }
-            
-            # 如果是市价单，设置滑点价格
-            if order_type.upper() == 'MARKET':
-                slippage = 0.05  # 5% 滑点
-                if side.upper() == 'BUY':
-                    slippage_price = use_price * (1 + slippage)
-                else:
-                    slippage_price = use_price * (1 - slippage)
-                order_params['price'] = str(slippage_price)  # 使用price参数
-                print(f"市价单滑点价格: {slippage_price}")
-            else:
-                order_params['price'] = str(use_price)
-            
-            print(f"最终下单参数: {order_params}")
-            
-            # 9. 开始下单
-            print("\n开始下单...")
-            
-            if order_type.upper() == 'MARKET':
-                order = self.exchange.create_market_order(
-                    symbol=formatted_symbol,
-                    side=side.lower(),
-                    amount=quantity,
-                    price=order_params['price'],  # 添加price参数
-                    params=order_params
-                )
-            else:
-                order = self.exchange.create_limit_order(
-                    symbol=formatted_symbol,
-                    side=side.lower(),
-                    amount=quantity,
-                    price=use_price,
-                    params=order_params
-                )
+        return prewarm(list(markets), target, self.ensure_leverage, max_workers)
 
-            # if order_type.upper() == 'LIMIT':
-            #     order = self.exchange.create_limit_order(
-            #         symbol=formatted_symbol,
-            #         side=side.lower(),
-            #         amount=quantity,
-            #         price=use_price,
-            #         params=order_params
-            #     )
-            # else:
-            #     order = self.exchange.create_market_order(
-            #         symbol=formatted_symbol,
-            #         side=side.lower(),
-            #         amount=quantity,
-            #         price=order_params['price'],  # 添加price参数
-            #         params=order_params
-            #     )
-            
-            print(f"下单结果: {order}")
+    def place_order(self, symbol, side, order_type='MARKET', quantity=None, price=None, usdt_amount=None, leverage=1, reduce_only=False):
+        """
+        统一下单函数
+        """
+        try:
+            logger.info("开始下单")
+            prepared = self.prepare_order(symbol, side, order_type, quantity, price, usdt_amount, leverage, reduce_only)
+            order = self.submit_order(prepared)
+            logger.info("下单结果: %s", order)
             return {
                 'status': 'success',
                 'data': order
             }
             
         except Exception as e:
-            print(f"下单失败: {str(e)}")
+            logger.error("下单失败: %s", e)
             return {
                 'status': 'error',
                 'message': str(e)
             }
 
+    def prepare_order(self, symbol, side, order_type='MARKET', quantity=None, price=None, usdt_amount=None, leverage=1, reduce_only=False) -> Dict:
+        """完成下单前的准备：解析交易对、获取价格、计算数量并设置杠杆
+
+        参数与 place_order 相同，返回可直接传给 submit_order 的订单参数，
+        这样真正发送订单时只需要一次请求。
+        """
+        # 1. 参数验证和处理
+        if not symbol:
+            raise ValueError("交易对不能为空")
+            
+        # 处理交易对格式
+        market = self.resolve_market(symbol)
+        
+        if not market:
+            raise ValueError(f"找不到交易对 {symbol} 的市场信息")
+        
+        # 2. 获取市场信息和价格
+        formatted_symbol = market['symbol']
+        base_symbol = market.get('baseName') or market['base']
+        logger.info("处理后的交易对: %s", formatted_symbol)
+        
+        # 3. 获取价格和精度信息
+        current_price = self.get_symbol_price(formatted_symbol)
+        logger.debug("当前市场价格: %s", current_price)
+        
+        # 处理价格精度
+        price_precision = int(market['precision'].get('price', 8))
+        amount_precision = int(market['precision'].get('amount', 8))
+        
+        # 如果是限价单，使用指定价格；否则使用当前市场价
+        use_price = float(format(float(price), f'.{price_precision}f')) if order_type.upper() == 'LIMIT' and price else current_price
+        logger.debug("使用价格: %s", use_price)
+        
+        # 4. 计算合约数量和保证金
+        if quantity:
+            # 如果直接指定了数量，这个数量就是USDT金额
+            usdt_amount = float(quantity)
+        elif usdt_amount:
+            # 如果指定了USDT金额，直接使用
+            usdt_amount = float(usdt_amount)
+        else:
+            raise ValueError("必须指定数量或USDT金额")
+
+        # 计算合约数量
+        contract_amount = usdt_amount / use_price
+        logger.debug("计算合约数量: usdt_amount=%s, use_price=%s, contract_amount=%s", usdt_amount, use_price, contract_amount)
+        
+        # 直接使用计算出的合约数量，不进行精度调整
+        quantity = contract_amount
+        logger.debug("使用原始合约数量: quantity=%s", quantity)
+        
+        if not quantity or quantity <= 0:
+            logger.error("无效的下单数量: quantity=%s", quantity)
+            raise ValueError("无效的下单数量")
+
+        # # 重新计算实际需要的保证金
+        # actual_margin = (quantity * use_price) / leverage
+        # print(f"实际需要的保证金: {actual_margin} USDC")
+        
+        # # 检查账户余额
+        # balance = self.get_account_balance()
+        # print(f"当前余额: {balance} USDC")
+        
+        # if balance < actual_margin and not reduce_only:  # 如果是平仓单，不检查保证金
+        #     return {
+        #         'status': 'error',
+        #         'message': f'保证金不足。需要 {actual_margin} USDC，当前余额 {balance} USDC'
+        #     }
+
+        # print(f"最终下单数量: {quantity}")
+        # print(f"订单价值: {usdt_amount} USDC")
+        # print(f"所需保证金: {actual_margin} USDC")
+
+        # 7. 设置杠杆
+        try:
+            if self.ensure_leverage(formatted_symbol, leverage):
+                logger.debug("设置杠杆倍数: %s", leverage)
+        except Exception as e:
+            logger.error("设置杠杆失败: %s", e)
+            if not reduce_only:  # 如果是平仓单，忽略设置杠杆失败的错误
+                raise e
+        
+        # 8. 构建订单参数
+        order_params = {
+            'coin': base_symbol,  # 使用基础币种名称
+            'is_buy': side.upper() == 'BUY',
+            'sz': str(quantity),
+            'reduce_only': reduce_only  # 添加reduce_only参数
+        }
+        
+        # 检查最小订单价值（仅对开仓单有效）
+        min_order_value = 10  # 最小订单价值为10美元
+        order_value = quantity * use_price
+        
+        # 如果是平仓单且订单价值小于最小值，调整数量
+        if reduce_only and order_value < min_order_value:
+            logger.warning("平仓单价值 (%s USDC) 小于最小要求 (%s USDC)，将调整为最小值", order_value, min_order_value)
+            # 计算需要的最小数量
+            min_quantity = math.ceil((min_order_value / use_price) * 1.01)  # 增加1%以确保满足最小值要求
+            quantity = min_quantity
+            order_params['sz'] = str(quantity)
+            logger.info("调整后的数量: %s", quantity)
+        elif not reduce_only and order_value < min_order_value:
+            raise ValueError(f'订单价值必须大于{min_order_value}美元。当前订单价值: {order_value}美元')
+        
+        # 如果是市价单，设置滑点价格
+        if order_type.upper() == 'MARKET':
+            slippage = 0.05  # 5% 滑点
+            if side.upper() == 'BUY':
+                slippage_price = use_price * (1 + slippage)
+            else:
+                slippage_price = use_price * (1 - slippage)
+            order_params['price'] = str(slippage_price)  # 使用price参数
+            logger.debug("市价单滑点价格: %s", slippage_price)
+        else:
+            order_params['price'] = str(use_price)
+        
+        logger.info("最终下单参数: %s", order_params)
+        return {
+            'symbol': formatted_symbol,
+            'side': side.lower(),
+            'order_type': order_type.upper(),
+            'amount': quantity,
+            'price': order_params['price'] if order_type.upper() == 'MARKET' else use_price,
+            'params': order_params
+        }
+
+    def submit_order(self, prepared: Dict) -> Dict:
+        """发送 prepare_order 准备好的订单
+
+        Returns:
+            Dict: ccxt返回的订单信息
+        """
+        try:
+            return self._create_order(prepared)
+        except Exception:
+            # 杠杆可能已在别处被修改，下次下单时重新设置
+            self.leverage.invalidate(prepared['symbol'])
+            raise
+
+    def _create_order(self, prepared: Dict) -> Dict:
+        if prepared['order_type'] == 'MARKET':
+            return self.exchange.create_market_order(
+                symbol=prepared['symbol'],
+                side=prepared['side'],
+                amount=prepared['amount'],
+                price=prepared['price'],  # 添加price参数
+                params=prepared['params']
+            )
+        return self.exchange.create_limit_order(
+            symbol=prepared['symbol'],
+            side=prepared['side'],
+            amount=prepared['amount'],
+            price=prepared['price'],
+            params=prepared['params']
+        )
+
     def close_position(self, symbol: str) -> Dict:
         """平仓指定交易对的持仓"""
         try:
-            print(f"\n=== 开始平仓 {symbol} ===")
+            logger.info("开始平仓 %s", symbol)
             
             # 处理交易对格式
-            base_symbol = symbol.split('/')[0] if '/' in symbol else symbol
-            base_symbol = base_symbol.split(':')[0] if ':' in base_symbol else base_symbol
-            base_symbol = base_symbol.replace('USDT', '')  # 移除USDT后缀
-            formatted_symbol = f"{base_symbol}/USDC:USDC"
+            market = self.resolve_market(symbol)
+            if not market:
+                return {"status": "error", "message": f"找不到交易对 {symbol} 的市场信息"}
+            formatted_symbol = market['symbol']
+            base_symbol = market.get('baseName') or market['base']
             
-            print(f"处理后的交易对: {formatted_symbol}")
+            logger.debug("处理后的交易对: %s", formatted_symbol)
             
             # 获取持仓信息
             position = self.get_position(symbol)
-            print(f"获取到的持仓信息: {position}")
+            logger.debug("获取到的持仓信息: %s", position)
             
             if not position:
-                print("未找到持仓信息")
+                logger.warning("未找到持仓信息")
                 return {"status": "error", "message": "没有持仓"}
             
             # 从position中提取必要信息
@@ -298,21 +441,21 @@ class HyperliquidTrader:
             side = position.get('side')
             
             if not contracts or float(contracts) == 0:
-                print("持仓数量为0")
+                logger.warning("持仓数量为0")
                 return {"status": "error", "message": "持仓数量为0"}
             
             if not side:
-                print("无法确定持仓方向")
+                logger.warning("无法确定持仓方向")
                 return {"status": "error", "message": "无法确定持仓方向"}
             
             # 确定平仓方向和数量
             close_side = 'sell' if side == 'long' else 'buy'
             close_quantity = abs(float(contracts))
             
-            print(f"准备平仓 - 交易对: {base_symbol}, 合约数量: {close_quantity}, 方向: {close_side}")
+            logger.info("准备平仓 - 交易对: %s, 合约数量: %s, 方向: %s", base_symbol, close_quantity, close_side)
             
-            # 获取当前市场价格
-            current_price = self.get_symbol_price(formatted_symbol)
+            # 获取当前市场价格，账户推送中的持仓带有标记价格
+            current_price = position.get('markPrice') or self.get_symbol_price(formatted_symbol)
             slippage = 0.05  # 5% 滑点保护
             
             # 根据平仓方向设置滑点价格
@@ -336,7 +479,7 @@ class HyperliquidTrader:
                 }
             }
             
-            print(f"下单参数: {order_params}")
+            logger.debug("下单参数: %s", order_params)
             
             # 执行平仓
             try:
@@ -348,14 +491,14 @@ class HyperliquidTrader:
                     price=slippage_price,
                     params=order_params
                 )
-                print(f"平仓结果: {order}")
+                logger.info("平仓结果: %s", order)
                 return {
                     'status': 'success',
                     'data': order
                 }
             except Exception as e:
                 error_msg = str(e)
-                print(f"平仓操作失败: {error_msg}")
+                logger.error("平仓操作失败: %s", error_msg)
                 return {
                     'status': 'error',
                     'message': f"平仓失败: {error_msg}"
@@ -363,16 +506,70 @@ class HyperliquidTrader:
             
         except Exception as e:
             error_msg = str(e)
-            print(f"平仓失败: {error_msg}")
+            logger.error("平仓失败: %s", error_msg)
             return {
                 'status': 'error',
                 'message': f"平仓失败: {error_msg}"
             }
 
+    def close_all_positions(self) -> List[Dict]:
+        """按同一份持仓快照一次性平掉所有持仓
+
+        所有只减仓的IOC订单放在同一个下单请求中提交，价格在标记价格基础上留5%滑点。
+
+        Returns:
+            List[Dict]: 每个币种的结果 {'symbol', 'status', 'data' 或 'message'}
+        """
+        positions = [p for p in self.fetch_positions() if p.get('contracts') and float(p['contracts']) != 0]
+        if not positions:
+            return []
+        # REST返回的持仓没有标记价格时，用推送的中间价补上，推送不可用时查询一次 allMids
+        mids = {}
+        if any(not p.get('markPrice') for p in positions):
+            mids = (self.price_stream.get_mids() if self.price_stream else {}) or \
+                self.exchange.publicPostInfo({'type': 'allMids'})
+
+        coins, orders, results = [], [], []
+        for position in positions:
+            market = self.markets.get(position['symbol'])
+            coin = (market.get('baseName') or market['base']) if market else position['symbol'].split('/')[0]
+            price = position.get('markPrice') or float(mids.get(coin) or 0)
+            if not price:
+                results.append({'symbol': coin, 'status': 'error', 'message': "平仓失败: 无法获取价格"})
+                continue
+            coins.append(coin)
+            orders.append({
+                'symbol': position['symbol'],
+                'type': 'market',
+                'side': 'sell' if position['side'] == 'long' else 'buy',
+                'amount': abs(float(position['contracts'])),
+                'price': price,
+                'params': {'reduceOnly': True}
+            })
+        if not orders:
+            return results
+        logger.info("批量平仓 %d 个持仓", len(orders))
+
+        try:
+            responses = self.exchange.create_orders(orders)
+        except Exception as e:
+            logger.error("批量平仓失败: %s", e)
+            return results + [{'symbol': coin, 'status': 'error', 'message': f"平仓失败: {e}"} for coin in coins]
+        for coin, response in zip(coins, responses):
+            error = (response.get('info') or {}).get('error')
+            if error:
+                results.append({'symbol': coin, 'status': 'error', 'message': f"平仓失败: {error}"})
+            else:
+                results.append({'symbol': coin, 'status': 'success', 'data': response})
+        failed = [r['symbol'] for r in results if r['status'] != 'success']
+        if failed:
+            logger.error("批量平仓失败的币种: %s", failed)
+        return results
+
     def get_all_symbols(self) -> List[Dict]:
         """获取所有可交易的合约对"""
         try:
-            markets = self.exchange.fetch_markets()
+            markets = self.markets.all()
             return [{
                 'symbol': market['symbol'],
                 'baseAsset': market['base'],
@@ -416,12 +613,13 @@ class HyperliquidTrader:
             str: Hyperliquid格式的交易对，如 'BTC/USDC:USDC'
         """
         try:
-            # 移除USDT后缀
-            base_symbol = symbol.replace('USDT', '')
+            market = self.resolve_market(symbol)
+            if market:
+                return market['symbol']
             # 转换为Hyperliquid格式
-            return f"{base_symbol}/USDC:USDC"
+            return f"{legacy_base(symbol)}/USDC:USDC"
         except Exception as e:
-            print(f"转换交易对格式失败: {str(e)}")
+            logger.error("转换交易对格式失败: %s", e)
             return symbol
 
     def get_max_leverage(self, symbol: str) -> int:
@@ -434,23 +632,17 @@ class HyperliquidTrader:
             int: 最大杠杆倍数
         """
         try:
-            # 处理交易对格式
-            base_symbol = symbol.split('/')[0] if '/' in symbol else symbol
-            base_symbol = base_symbol.split(':')[0] if ':' in base_symbol else base_symbol
-            base_symbol = base_symbol.replace('USDT', '')  # 移除USDT后缀
-            formatted_symbol = f"{base_symbol}/USDC:USDC"
+            # 获取市场信息
+            market = self.resolve_market(symbol)
+            formatted_symbol = market['symbol'] if market else self.convert_symbol_format(symbol)
             
-            print(f"获取最大杠杆倍数 - 原始交易对: {symbol}, 处理后: {formatted_symbol}")
+            logger.debug("获取最大杠杆倍数 - 原始交易对: %s, 处理后: %s", symbol, formatted_symbol)
             
-            # 获取市场信息
-            markets = self.exchange.fetch_markets()
-            for market in markets:
-                if market['symbol'] == formatted_symbol:
-                    max_leverage = market['limits']['leverage']['max']
-                    if max_leverage is not None:
-                        print(f"从市场信息获取到最大杠杆: {max_leverage}")
-                        return int(max_leverage)
-                    break
+            if market:
+                max_leverage = market['limits']['leverage']['max']
+                if max_leverage is not None:
+                    logger.debug("从市场信息获取到最大杠杆: %s", max_leverage)
+                    return int(max_leverage)
             
             # 如果在市场信息中找不到，尝试从仓位信息中获取
             positions = self.exchange.fetch_positions([formatted_symbol])
@@ -458,41 +650,45 @@ class HyperliquidTrader:
                 if position['symbol'] == formatted_symbol:
                     max_leverage = position['info']['position']['maxLeverage']
                     if max_leverage is not None:
-                        print(f"从仓位信息获取到最大杠杆: {max_leverage}")
+                        logger.debug("从仓位信息获取到最大杠杆: %s", max_leverage)
                         return int(max_leverage)
             
             raise Exception(f"无法获取交易对 {formatted_symbol} 的最大杠杆倍数")
             
         except Exception as e:
-            print(f"获取最大杠杆倍数失败: {str(e)}")
+            logger.error("获取最大杠杆倍数失败: %s", e)
             return 1  # 如果获取失败，返回默认值1而不是抛出异常
 
     def get_symbol_price(self, symbol: str) -> float:
         """获取交易对的当前价格"""
         try:
-            print(f"开始获取{symbol}的价格...")
-            # 移除USDT后缀
-            base_symbol = symbol.split('/')[0] if '/' in symbol else symbol
-            base_symbol = base_symbol.split(':')[0] if ':' in base_symbol else base_symbol
-            base_symbol = base_symbol.replace('USDT', '')
+            logger.debug("开始获取%s的价格...", symbol)
+            formatted_symbol = self.convert_symbol_format(symbol)
+
+            # 行情推送新鲜时直接使用中间价
+            if self.price_stream:
+                market = self.markets.get(formatted_symbol)
+                mid = self.price_stream.get_mid(market.get('baseName') or market['base']) if market else None
+                if mid:
+                    return float(mid)
             
             # 尝试最多3次
             max_retries = 3
             for attempt in range(max_retries):
                 try:
-                    market_info = self.exchange.fetch_ticker(f"{base_symbol}/USDC:USDC")
+                    market_info = self.exchange.fetch_ticker(formatted_symbol)
                     if market_info and 'last' in market_info and market_info['last']:
-                        print(f"获取到的价格信息: {market_info}")
+                        logger.debug("获取到的价格信息: %s", market_info)
                         return float(market_info['last'])
                 except Exception as e:
-                    print(f"第{attempt + 1}次尝试获取价格失败: {str(e)}")
+                    logger.warning("第%s次尝试获取价格失败: %s", attempt + 1, e)
                     if attempt < max_retries - 1:
                         time.sleep(1)  # 等待1秒后重试
                     continue
             
             raise Exception("无法获取价格信息")
         except Exception as e:
-            print(f"获取价格失败: {str(e)}")
+            logger.error("获取价格失败: %s", e)
             raise Exception(f"获取价格失败: {str(e)}")
 
     def usd_to_contract_amount(self, symbol: str, usd_amount: float) -> float:
@@ -505,27 +701,30 @@ class HyperliquidTrader:
                 return 0.0
             return usd_amount / price
         except Exception as e:
-            print(f"转换金额失败: {str(e)}")
+            logger.error("转换金额失败: %s", e)
             return 0.0
 
     def set_leverage(self, symbol: str, leverage: int) -> None:
         """设置交易对的杠杆倍数"""
         try:
-            self.exchange.set_leverage(leverage, symbol)
+            self.exchange.set_leverage(leverage, symbol, {'marginMode': self.MARGIN_MODE})
+            self.leverage.set(symbol, leverage, self.MARGIN_MODE)
         except Exception as e:
+            self.leverage.invalidate(symbol)
             raise Exception(f"设置杠杆失败: {str(e)}")
 
     def get_all_positions(self):
         """获取所有持仓信息"""
         try:
-            positions = self.exchange.fetch_positions()
+            positions = self.fetch_positions()
             active_positions = []
             
             for position in positions:
                 contracts = position.get('contracts')
                 if contracts and float(contracts) != 0:
                     # 获取基础数据
-                    symbol = position.get('symbol', '').replace('/USDC:USDC', '')
+                    market = self.markets.get(position.get('symbol', ''))
+                    symbol = (market.get('baseName') or market['base']) if market else position.get('symbol', '').replace('/USDC:USDC', '')
                     entry_price = position.get('entryPrice')
                     mark_price = position.get('markPrice')
                     unrealized_pnl = position.get('unrealizedPnl')
@@ -540,10 +739,10 @@ class HyperliquidTrader:
                             mark_price_float = float(mark_price) if mark_price else 0.0
                             notional = contracts_float * mark_price_float
                         except (TypeError, ValueError) as e:
-                            print(f"计算notional时出错: {e}")
+                            logger.warning("计算notional时出错: %s", e)
                             notional = 0.0
                     
-                    print(f"处理持仓数据 - 交易对: {symbol}, 合约数量: {contracts}, 标记价格: {mark_price}, 持仓价值: {notional}")
+                    logger.debug("处理持仓数据 - 交易对: %s, 合约数量: %s, 标记价格: %s, 持仓价值: %s", symbol, contracts, mark_price, notional)
                     
                     # 构建标准化的持仓数据
                     position_data = {
@@ -557,12 +756,12 @@ class HyperliquidTrader:
                         'notional': float(notional) if notional else 0.0
                     }
                     
-                    print(f"添加持仓数据: {position_data}")
+                    logger.debug("添加持仓数据: %s", position_data)
                     active_positions.append(position_data)
             
             return active_positions
         except Exception as e:
-            print(f"获取持仓信息失败: {str(e)}")
+            logger.error("获取持仓信息失败: %s", e)
             return []
 
     def get_commission_rate(self) -> Dict:
@@ -579,5 +778,5 @@ class HyperliquidTrader:
                 'taker': 0.0005,   # taker收费0.05%
             }
         except Exception as e:
-            print(f"获取手续费率失败: {str(e)}")
+            logger.error("获取手续费率失败: %s", e)
             raise Exception(f"获取手续费率失败: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,158 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+
+def parse_exchange_info(exchange_info: Dict) -> Dict[str, Dict]:
+    """把 futures_exchange_info 的返回结果解析为按交易对索引的字典
+
+    Args:
+        exchange_info: futures_exchange_info 接口返回的原始数据
+
+    Returns:
+        Dict[str, Dict]: 交易对到精度、数量限制和状态的映射
+    """
+    instruments = {}
+    for symbol_info in exchange_info.get('symbols', []):
+        filters = {f['filterType']: f for f in symbol_info.get('filters', [])}
+        lot_size = filters.get('LOT_SIZE', {})
+        price_filter = filters.get('PRICE_FILTER', {})
+        min_notional = filters.get('MIN_NOTIONAL', {})
+        instruments[symbol_info['symbol']] = {
+            'symbol': symbol_info['symbol'],
+            'status': symbol_info.get('status'),
+            'baseAsset': symbol_info.get('baseAsset'),
+            'quoteAsset': symbol_info.get('quoteAsset'),
+            'contractType': symbol_info.get('contractType'),
+            'quantityPrecision': int(symbol_info.get('quantityPrecision', 0)),
+            'pricePrecision': int(symbol_info.get('pricePrecision', 0)),
+            'minQty': float(lot_size.get('minQty', 0)),
+            'maxQty': float(lot_size.get('maxQty', 0)),
+            'stepSize': float(lot_size.get('stepSize', 0)),
+            'tickSize': float(price_filter.get('tickSize', 0)),
+            'minNotional': float(min_notional.get('notional', 0))
+        }
+    return instruments
+
+
+class InstrumentCache:
+    """币安U本位合约交易对元数据缓存
+
+    futures_exchange_info 权重高、数据量大，这里统一缓存并定期在后台刷新，
+    查询时按交易对名称O(1)查找。
+    """
+
+    def __init__(self, client, ttl: float = 300, miss_refresh_interval: float = 30):
+        """
+        Args:
+            client: python-binance 的 Client 对象
+            ttl: 缓存有效期（秒），后台刷新间隔为其一半
+            miss_refresh_interval: 查询不到交易对时触发刷新的最小间隔（秒）
+        """
+        self.client = client
+        self.ttl = ttl
+        self.miss_refresh_interval = miss_refresh_interval
+        self.instruments: Dict[str, Dict] = {}
+        self.updated_at = 0.0
+        self._listeners: List[Callable[[Dict[str, Dict]], None]] = []
+        self._refresh_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self, max_age: float = 0) -> bool:
+        """重新下载交易对元数据
+
+        Args:
+            max_age: 缓存比该秒数新时跳过下载，避免并发调用重复下载
+
+        Returns:
+            bool: 是否刷新成功
+        """
+        with self._refresh_lock:
+            if self.instruments and time.time() - self.updated_at < max_age:
+                return True
+            try:
+                instruments = self._load()
+            except Exception as e:
+                logger.error("刷新交易对信息失败: %s", e)
+                return False
+            # 整体替换字典，读取方不需要加锁
+            self.instruments = instruments
+            self.updated_at = time.time()
+        self._notify(instruments)
+        return True
+
+    def set_instruments(self, instruments: Dict[str, Dict]):
+        """写入由外部（如异步客户端）下载并解析好的元数据"""
+        with self._refresh_lock:
+            self.instruments = instruments
+            self.updated_at = time.time()
+        self._notify(instruments)
+
+    def add_listener(self, callback: Callable[[Dict[str, Dict]], None]):
+        """注册元数据更新回调，已有数据时立即回调一次"""
+        self._listeners.append(callback)
+        if self.instruments:
+            callback(self.instruments)
+
+    def _notify(self, instruments: Dict[str, Dict]):
+        for callback in list(self._listeners):
+            try:
+                callback(instruments)
+            except Exception as e:
+                logger.error("交易对信息更新回调失败: %s", e)
+
+    def _load(self) -> Dict[str, Dict]:
+        """下载并解析元数据，子类可覆盖以支持其他交易所"""
+        return parse_exchange_info(self.client.futures_exchange_info())
+
+    def is_expired(self) -> bool:
+        return time.time() - self.updated_at > self.ttl
+
+    def _ensure_loaded(self):
+        # 仅在缓存为空或后台刷新未运行且已过期时同步下载
+        background = self._thread is not None and self._thread.is_alive()
+        if not self.instruments or (not background and self.is_expired()):
+            self.refresh(max_age=self.ttl)
+
+    def get(self, symbol: str) -> Optional[Dict]:
+        """获取单个交易对的元数据"""
+        self._ensure_loaded()
+        info = self.instruments.get(symbol)
+        if info is None and time.time() - self.updated_at > self.miss_refresh_interval:
+            # 可能是新上线的交易对
+            if self.refresh(max_age=self.miss_refresh_interval):
+                info = self.instruments.get(symbol)
+        return info
+
+    def active_symbols(self) -> List[str]:
+        """获取所有正在交易的交易对"""
+        self._ensure_loaded()
+        return [symbol for symbol, info in self.instruments.items() if info['status'] == 'TRADING']
+
+    def all(self) -> List[Dict]:
+        """获取所有交易对的元数据"""
+        self._ensure_loaded()
+        return list(self.instruments.values())
+
+    def start_background_refresh(self):
+        """启动后台定期刷新线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name="instrument-cache", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台刷新"""
+        self._stop_event.set()
+
+    def _refresh_loop(self):
+        interval = max(self.ttl / 2, 1)
+        while not self._stop_event.is_set():
+            if not self.instruments or time.time() - self.updated_at >= interval:
+                self.refresh()
+            self._stop_event.wait(interval)
@@ -0,0 +1,123 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional
+
+from logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+
+class LeverageCache:
+    """按交易对记录交易所上当前生效的杠杆倍数
+
+    下单前杠杆已经是目标值时可以跳过设置杠杆的签名请求。缓存从持仓/账户数据初始化，
+    每次设置成功后更新；超过 ttl 的记录视为未知，避免账户在别处被修改后长期使用旧值。
+    设置杠杆同时决定保证金模式的交易所（如Hyperliquid）可以一并记录保证金模式，两者都一致才跳过。
+    """
+
+    def __init__(self, ttl: Optional[float] = 3600):
+        """
+        Args:
+            ttl: 记录的有效期（秒），None表示不过期
+        """
+        self.ttl = ttl
+        # symbol -> (杠杆, 记录时间, 保证金模式)
+        self._leverage: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, symbol: str) -> Optional[tuple]:
+        entry = self._leverage.get(symbol)
+        if entry is None or (self.ttl is not None and time.time() - entry[1] > self.ttl):
+            return None
+        return entry
+
+    def get(self, symbol: str) -> Optional[int]:
+        """获取缓存的杠杆，未知或已过期返回None"""
+        entry = self._entry(symbol)
+        return entry[0] if entry else None
+
+    def margin_mode(self, symbol: str) -> Optional[str]:
+        """获取缓存的保证金模式，未记录或已过期返回None"""
+        entry = self._entry(symbol)
+        return entry[2] if entry else None
+
+    def set(self, symbol: str, leverage: int, margin_mode: Optional[str] = None):
+        with self._lock:
+            self._leverage[symbol] = (int(leverage), time.time(), margin_mode)
+
+    def seed(self, leverage: Dict[str, int], margin_modes: Optional[Dict[str, str]] = None):
+        """用交易所返回的杠杆数据批量初始化
+
+        Args:
+            leverage: 交易对 -> 杠杆
+            margin_modes: 交易对 -> 保证金模式（'cross'/'isolated'），可选
+        """
+        now = time.time()
+        margin_modes = margin_modes or {}
+        with self._lock:
+            for symbol, value in leverage.items():
+                self._leverage[symbol] = (int(value), now, margin_modes.get(symbol))
+        logger.info("已从账户数据加载 %d 个交易对的杠杆设置", len(leverage))
+
+    def invalidate(self, symbol: Optional[str] = None):
+        """清除一个交易对（不传则全部）的记录，下次下单时重新设置"""
+        with self._lock:
+            if symbol is None:
+                self._leverage.clear()
+            else:
+                self._leverage.pop(symbol, None)
+
+    def ensure(self, symbol: str, leverage: int, apply: Callable[[str, int], object],
+               margin_mode: Optional[str] = None) -> bool:
+        """杠杆与缓存不一致时调用 apply(symbol, leverage) 设置，成功后更新缓存
+
+        Args:
+            margin_mode: 设置杠杆时同时生效的保证金模式；指定时缓存的保证金模式也必须一致才跳过
+
+        Returns:
+            bool: 是否实际发送了设置请求
+        """
+        entry = self._entry(symbol)
+        if entry is not None and entry[0] == leverage and (margin_mode is None or entry[2] == margin_mode):
+            self.hits += 1
+            return False
+        self.misses += 1
+        apply(symbol, leverage)
+        self.set(symbol, leverage, margin_mode)
+        return True
+
+
+def prewarm(symbols: Iterable[str], target: Callable[[str], Optional[int]], ensure: Callable[[str, int], bool],
+            max_workers: int = 8) -> Dict[str, int]:
+    """并发把一组交易对的杠杆设置为目标值
+
+    Args:
+        symbols: 交易对列表
+        target: 返回交易对目标杠杆的函数，返回None时跳过
+        ensure: 设置杠杆的函数（如 BinanceTrader.ensure_leverage）
+        max_workers: 并发数
+
+    Returns:
+        Dict[str, int]: 统计 {'changed', 'unchanged', 'failed'}
+    """
+    stats = {'changed': 0, 'unchanged': 0, 'failed': 0}
+    lock = threading.Lock()
+
+    def apply(symbol: str):
+        leverage = target(symbol)
+        if leverage is None:
+            return
+        try:
+            key = 'changed' if ensure(symbol, leverage) else 'unchanged'
+        except Exception as e:
+            logger.debug("预设 %s 杠杆 %s 失败: %s", symbol, leverage, e)
+            key = 'failed'
+        with lock:
+            stats[key] += 1
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="leverage-prewarm") as pool:
+        list(pool.map(apply, symbols))
+    return stats
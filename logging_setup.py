@@ -0,0 +1,121 @@
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+# 通过环境变量配置：LOG_LEVEL=DEBUG/INFO/WARNING/ERROR，LOG_FORMAT=text/json
+# LOG_RATE_LIMIT=每个时间窗口内同一条日志最多输出的次数（0表示不限制），LOG_RATE_WINDOW=时间窗口（秒）
+DEFAULT_LEVEL = 'INFO'
+DEFAULT_FORMAT = 'text'
+TEXT_FORMAT = '%(asctime)s %(levelname)s [%(name)s] %(message)s'
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行JSON，附带通过 extra 传入的字段"""
+
+    RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in self.RESERVED and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """文本格式，被限流抑制过的日志在末尾注明抑制条数"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        return f"{text} (已抑制 {suppressed} 条相同日志)" if suppressed else text
+
+
+class RateLimitFilter(logging.Filter):
+    """按消息模板限流和采样
+
+    同一日志位置的同一条消息模板在 window 秒内最多输出 burst 次，窗口结束后的第一条
+    会附带被抑制的条数。判断只使用未格式化的模板，被丢弃的日志不会做字符串格式化。
+    调用时可通过 extra={'sample': 0.1} 只输出一部分日志。
+    """
+
+    def __init__(self, burst: int = 20, window: float = 10.0):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._counters: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        sample = getattr(record, 'sample', None)
+        if sample is not None and random.random() >= sample:
+            return False
+        if self.burst <= 0:
+            return True
+
+        key = (record.name, record.lineno, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None or now - counter[0] >= self.window:
+                suppressed = counter[2] if counter else 0
+                self._counters[key] = [now, 1, 0]
+                if len(self._counters) > 10000:
+                    self._counters.clear()
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if counter[1] < self.burst:
+                counter[1] += 1
+                return True
+            counter[2] += 1
+            return False
+
+
+def setup_logging(level: Optional[str] = None, fmt: Optional[str] = None):
+    """配置根日志，重复调用只生效一次
+
+    Args:
+        level: 日志级别，默认读取 LOG_LEVEL
+        fmt: 输出格式 text 或 json，默认读取 LOG_FORMAT
+    """
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        level = (level or os.getenv('LOG_LEVEL', DEFAULT_LEVEL)).upper()
+        fmt = (fmt or os.getenv('LOG_FORMAT', DEFAULT_FORMAT)).lower()
+
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter(TEXT_FORMAT))
+        handler.addFilter(RateLimitFilter(
+            burst=int(os.getenv('LOG_RATE_LIMIT', 20)),
+            window=float(os.getenv('LOG_RATE_WINDOW', 10))
+        ))
+
+        root = logging.getLogger()
+        root.addHandler(handler)
+        root.setLevel(level)
+        _configured = True
+
+
+def get_logger(name: str) -> logging.Logger:
+    """获取模块日志对象，首次调用时按环境变量完成配置"""
+    setup_logging()
+    return logging.getLogger(name)
@@ -0,0 +1,397 @@
+"""进程内指标，按Prometheus文本格式导出
+
+交易所接口调用和Flask路由的耗时直方图、错误计数、限流权重和各数据源的新鲜度，
+由 app.py 的 /metrics 接口输出。记录一次耗时只做一次二分查找和几次加法，
+不会在请求路径上分配对象或格式化字符串，文本在抓取时才生成。
+"""
+import math
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+# 交易所接口耗时分布在几毫秒到几秒之间
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if value != value:
+        return 'NaN'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """指标基类，每组标签值对应一个子序列"""
+
+    TYPE = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """(指标名后缀, 标签文本, 值) 列表"""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    TYPE = 'counter'
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [('_total', _format_labels(self.labelnames, k), v) for k, v in sorted(items)]
+
+
+class Gauge(Metric):
+    """数值型指标，也可以传入 callback 在抓取时计算当前值
+
+    callback 返回 {标签值元组: 值}，没有标签时返回单个数值。
+    """
+
+    TYPE = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 callback: Optional[Callable[[], object]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        if self.callback is not None:
+            try:
+                result = self.callback()
+            except Exception as e:
+                logger.warning("计算指标 %s 失败: %s", self.name, e)
+                result = {}
+            if isinstance(result, dict):
+                values.update(result)
+            elif result is not None:
+                values[()] = result
+        return [('', _format_labels(self.labelnames, k), v) for k, v in sorted(values.items())]
+
+
+class Histogram(Metric):
+    TYPE = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        # 只记录落在哪个区间，导出时再累加为 le 分桶
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(k, list(v[0]), v[1]) for k, v in self._values.items()]
+        samples = []
+        for labels, counts, total in sorted(items):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append(('_bucket', _format_labels(self.labelnames, labels, f'le="{_format_value(bound)}"'),
+                                cumulative))
+            samples.append(('_sum', _format_labels(self.labelnames, labels), total))
+            samples.append(('_count', _format_labels(self.labelnames, labels), cumulative))
+        return samples
+
+
+class Registry:
+    """按注册顺序输出所有指标"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+              callback: Optional[Callable[[], object]] = None) -> Gauge:
+        gauge = self.register(Gauge(name, documentation, labelnames))
+        if callback is not None:
+            gauge.callback = callback
+        return gauge
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+EXCHANGE_LATENCY = REGISTRY.histogram(
+    'exchange_request_duration_seconds', "交易所接口调用耗时", ('venue', 'endpoint'))
+EXCHANGE_ERRORS = REGISTRY.counter(
+    'exchange_request_errors', "交易所接口调用失败次数，kind为error或rate_limited", ('venue', 'endpoint', 'kind'))
+EXCHANGE_WEIGHT = REGISTRY.gauge(
+    'exchange_rate_limit_weight', "当前分钟已使用的请求权重（币安取响应头，Hyperliquid按文档权重估算）", ('venue',))
+HTTP_LATENCY = REGISTRY.histogram(
+    'http_request_duration_seconds', "Flask路由处理耗时", ('method', 'route'))
+HTTP_REQUESTS = REGISTRY.counter(
+    'http_requests', "Flask路由请求次数", ('method', 'route', 'status'))
+
+# Hyperliquid不返回已用权重，按官方文档的权重在本地估算：这几类info请求权重为2，其余info为20，
+# exchange请求为1（批量下单每40笔另加1）
+HL_LIGHT_INFO_TYPES = {'l2Book', 'allMids', 'clearinghouseState', 'orderStatus', 'spotClearinghouseState',
+                       'exchangeStatus'}
+
+
+class WeightWindow:
+    """按自然分钟累计的请求权重"""
+
+    def __init__(self):
+        self.minute = 0
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def add(self, weight: int) -> int:
+        minute = int(time.time() // 60)
+        with self._lock:
+            if minute != self.minute:
+                self.minute, self.used = minute, 0
+            self.used += weight
+            return self.used
+
+    def current(self) -> int:
+        with self._lock:
+            return self.used if self.minute == int(time.time() // 60) else 0
+
+
+HL_WEIGHT = WeightWindow()
+EXCHANGE_WEIGHT.callback = lambda: {('hyperliquid',): HL_WEIGHT.current()}
+
+
+def hyperliquid_weight(path: str, params: Dict) -> int:
+    """估算一次Hyperliquid请求的权重"""
+    if path == 'exchange':
+        orders = (params.get('action') or {}).get('orders') or ()
+        return 1 + len(orders) // 40
+    return 2 if params.get('type') in HL_LIGHT_INFO_TYPES else 20
+
+
+def record_call(venue: str, endpoint: str, seconds: float, error: Optional[str] = None):
+    """记录一次交易所接口调用
+
+    Args:
+        venue: 交易所（binance/hyperliquid）
+        endpoint: 接口名称
+        seconds: 耗时（秒）
+        error: None表示成功，否则为 'error' 或 'rate_limited'
+    """
+    EXCHANGE_LATENCY.observe(seconds, venue, endpoint)
+    if error:
+        EXCHANGE_ERRORS.inc(venue, endpoint, error)
+
+
+def classify_status(status: int) -> Optional[str]:
+    """按HTTP状态码判断失败类型，418/429为限流"""
+    if status in (418, 429):
+        return 'rate_limited'
+    if status >= 400:
+        return 'error'
+    return None
+
+
+class track:
+    """计时上下文管理器，用于直接发起HTTP请求的地方
+
+        with metrics.track('hyperliquid', 'meta') as call:
+            async with session.post(...) as response:
+                call.status = response.status
+
+    代码块抛出异常或设置了失败的 status 时计为错误，设置 used_weight 时更新该交易所的已用权重。
+    """
+
+    __slots__ = ('venue', 'endpoint', 'status', 'used_weight', '_started')
+
+    def __init__(self, venue: str, endpoint: str):
+        self.venue = venue
+        self.endpoint = endpoint
+        self.status = 200
+        self.used_weight = None
+
+    def __enter__(self) -> 'track':
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        error = classify_status(self.status) or ('error' if exc_type is not None else None)
+        record_call(self.venue, self.endpoint, time.perf_counter() - self._started, error)
+        if self.used_weight is not None:
+            EXCHANGE_WEIGHT.set(int(self.used_weight), self.venue)
+        elif self.venue == 'hyperliquid':
+            HL_WEIGHT.add(hyperliquid_weight('info', {'type': self.endpoint}))
+        return False
+
+
+@lru_cache(maxsize=512)
+def _binance_endpoint(uri: str) -> str:
+    # https://fapi.binance.com/fapi/v2/account -> fapi/v2/account
+    return urlsplit(uri).path.strip('/')
+
+
+def instrument_binance_client(client):
+    """包装 python-binance Client 的 _request，记录每次调用的耗时、错误和已用权重
+
+    重复调用不会重复包装；没有 _request 的对象（如基准测试的回放客户端）原样返回。
+    """
+    request = getattr(client, '_request', None)
+    if request is None or getattr(client, '_metrics_instrumented', False):
+        return client
+
+    def instrumented_request(method, uri, signed, force_params=False, **kwargs):
+        endpoint = _binance_endpoint(uri)
+        started = time.perf_counter()
+        error = None
+        try:
+            return request(method, uri, signed, force_params, **kwargs)
+        except Exception as e:
+            error = classify_status(getattr(e, 'status_code', 0) or 0) or 'error'
+            raise
+        finally:
+            record_call('binance', endpoint, time.perf_counter() - started, error)
+            response = getattr(client, 'response', None)
+            if response is not None:
+                used = response.headers.get('x-mbx-used-weight-1m')
+                if used is not None:
+                    EXCHANGE_WEIGHT.set(int(used), 'binance')
+
+    client._request = instrumented_request
+    client._metrics_instrumented = True
+    return client
+
+
+def instrument_ccxt_exchange(exchange, venue: str):
+    """包装ccxt交易所对象的 request，Hyperliquid按info类型或exchange动作区分接口"""
+    if getattr(exchange, '_metrics_instrumented', False):
+        return exchange
+    request = exchange.request
+
+    def instrumented_request(path, api='public', method='GET', params={}, headers=None, body=None, config={}):
+        endpoint = path
+        if venue == 'hyperliquid' and isinstance(params, dict):
+            endpoint = params.get('type') or (params.get('action') or {}).get('type') or path
+            HL_WEIGHT.add(hyperliquid_weight(path, params))
+        started = time.perf_counter()
+        error = None
+        try:
+            return request(path, api, method, params, headers, body, config)
+        except Exception as e:
+            error = 'rate_limited' if type(e).__name__ in ('RateLimitExceeded', 'DDoSProtection') else 'error'
+            raise
+        finally:
+            record_call(venue, endpoint, time.perf_counter() - started, error)
+
+    exchange.request = instrumented_request
+    exchange._metrics_instrumented = True
+    return exchange
+
+
+def instrument_flask(app):
+    """为Flask应用的所有路由记录处理耗时和状态码，按路由模板而不是实际URL分组"""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = g.pop('_metrics_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+            HTTP_LATENCY.observe(time.perf_counter() - started, request.method, route)
+            HTTP_REQUESTS.inc(request.method, route, str(response.status_code))
+        return response
+
+    return app
+
+
+def register_age_gauge(name: str, documentation: str, sources: Dict[str, Callable[[], float]]):
+    """注册数据新鲜度指标，抓取时按 sources 返回的时间戳计算距今秒数，时间戳为0表示尚无数据
+
+    Args:
+        name: 指标名称
+        documentation: 说明
+        sources: 数据源名称到返回最后更新时间戳（秒）的函数的映射
+    """
+    def ages():
+        now = time.time()
+        result = {}
+        for source, updated_at in sources.items():
+            timestamp = updated_at()
+            result[(source,)] = now - timestamp if timestamp else math.inf
+        return result
+
+    return REGISTRY.gauge(name, documentation, ('source',), callback=ages)
+
+
+def render() -> str:
+    """输出所有指标的文本格式"""
+    return REGISTRY.render()
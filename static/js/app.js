@@ -178,6 +178,91 @@ async function refreshFundingRates() {
     }
 }
 
+// 通过SSE推送维护的资金费率数据
+const fundingState = {
+    contracts: {},
+    opportunities: {},
+    contractCounts: { hyperliquid: 0, binance: 0 }
+};
+let fundingRenderTimer = null;
+
+// 把当前资金费率数据渲染到页面
+function renderFundingState() {
+    fundingRenderTimer = null;
+
+    const hlContractCount = document.getElementById('hlContractCount');
+    const binanceContractCount = document.getElementById('binanceContractCount');
+    if (hlContractCount) hlContractCount.textContent = fundingState.contractCounts.hyperliquid || 0;
+    if (binanceContractCount) binanceContractCount.textContent = fundingState.contractCounts.binance || 0;
+
+    updateHighRateTokensTable(fundingState.contracts);
+
+    // 按费率差的绝对值排序
+    const opportunities = Object.values(fundingState.opportunities)
+        .sort((a, b) => Math.abs(b.difference) - Math.abs(a.difference));
+    updateArbitrageTable(opportunities);
+
+    const lastUpdate = document.getElementById('lastUpdate');
+    if (lastUpdate) {
+        lastUpdate.textContent = new Date().toLocaleString('zh-CN');
+    }
+}
+
+// 合并短时间内的多次推送，最多每秒渲染一次
+function scheduleFundingRender() {
+    if (!fundingRenderTimer) {
+        fundingRenderTimer = setTimeout(renderFundingState, 1000);
+    }
+}
+
+// 应用全量数据
+function applyFundingFull(data) {
+    fundingState.contracts = data.all_contracts || {};
+    fundingState.opportunities = {};
+    (data.opportunities || []).forEach(opp => {
+        fundingState.opportunities[opp.symbol] = opp;
+    });
+    fundingState.contractCounts = data.contract_counts || { hyperliquid: 0, binance: 0 };
+    scheduleFundingRender();
+}
+
+// 应用增量数据
+function applyFundingDelta(delta) {
+    Object.assign(fundingState.contracts, delta.contracts || {});
+    (delta.removed_contracts || []).forEach(symbol => {
+        delete fundingState.contracts[symbol];
+    });
+    (delta.opportunities || []).forEach(opp => {
+        fundingState.opportunities[opp.symbol] = opp;
+    });
+    (delta.removed_opportunities || []).forEach(symbol => {
+        delete fundingState.opportunities[symbol];
+    });
+    if (delta.contract_counts) {
+        fundingState.contractCounts = delta.contract_counts;
+    }
+    scheduleFundingRender();
+}
+
+// 订阅资金费率推送，浏览器不支持时返回false
+function subscribeFundingRates() {
+    if (!window.EventSource) {
+        return false;
+    }
+    // 断线后EventSource会自动重连，并带上Last-Event-ID只补发变化部分
+    const source = new EventSource('/api/funding_rates/stream');
+    source.addEventListener('full', event => {
+        applyFundingFull(JSON.parse(event.data));
+    });
+    source.addEventListener('delta', event => {
+        applyFundingDelta(JSON.parse(event.data));
+    });
+    source.onerror = () => {
+        console.warn('资金费率推送连接中断，等待自动重连...');
+    };
+    return true;
+}
+
 // 计算结算次数
 function calculateSettlementCount(nextFundingTime) {
     if (!nextFundingTime || nextFundingTime === '-') {
@@ -418,7 +503,7 @@ async function updateAutoTradeConfig(opportunities) {
                 <td class="text-success">${(positionRatio * 100).toFixed(0)}%</td>
                 <td class="${expectedProfit > 0 ? 'text-success' : 'text-danger'}">${expectedProfit.toFixed(2)} USDT</td>
                 <td>
-                    <button class="btn btn-sm btn-primary" onclick="executeArbitrage('${opp.symbol}')">
+                    <button class="btn btn-sm btn-primary" onclick="executeArbitrage('${opp.symbol}', '${longExchange}', ${suggestedPosition.toFixed(2)}, ${maxLeverage}, this)">
                         执行套利
                     </button>
                 </td>
@@ -435,6 +520,8 @@ async function updateAutoTradeConfig(opportunities) {
 }
 
 // 更新套利机会表格
+let lastAutoTradeKey = '';
+let lastAutoTradeUpdate = 0;
 function updateArbitrageTable(opportunities) {
     try {
         const arbitrageTable = document.getElementById('arbitrageOpportunities');
@@ -483,8 +570,13 @@ function updateArbitrageTable(opportunities) {
 
         arbitrageTable.innerHTML = tableContent || '<tr><td colspan="8" class="text-center">暂无套利机会</td></tr>';
         
-        // 更新自动交易配置区
-        updateAutoTradeConfig(opportunities);
+        // 更新自动交易配置区（需要请求余额和杠杆，套利机会没有变化时最多30秒更新一次）
+        const symbolsKey = opportunities.map(opp => `${opp.symbol}:${opp.strategy}`).join(',');
+        if (symbolsKey !== lastAutoTradeKey || Date.now() - lastAutoTradeUpdate >= 30000) {
+            lastAutoTradeKey = symbolsKey;
+            lastAutoTradeUpdate = Date.now();
+            updateAutoTradeConfig(opportunities);
+        }
         
     } catch (error) {
         console.error('更新套利机会表格失败:', error);
@@ -830,6 +922,56 @@ async function submitOrder(event) {
     }
 }
 
+// 执行套利：后端同时在两个交易所下单（一边做多、一边做空）
+async function executeArbitrage(symbol, longExchange, amount, leverage, button) {
+    const longName = longExchange === 'hyperliquid' ? 'Hyperliquid' : 'Binance';
+    const shortName = longExchange === 'hyperliquid' ? 'Binance' : 'Hyperliquid';
+    const input = prompt(`${symbol}: ${longName}做多 / ${shortName}做空，杠杆${leverage}x\n请输入每边的开仓金额（USDT）：`, amount);
+    if (input === null) {
+        return;
+    }
+    const quantity = parseFloat(input);
+    if (!(quantity > 0)) {
+        alert('开仓金额无效');
+        return;
+    }
+
+    if (button) button.disabled = true;
+    try {
+        const response = await fetch('/api/arbitrage/open', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                symbol: symbol,
+                long_exchange: longExchange,
+                quantity: quantity,
+                leverage: leverage
+            })
+        });
+        const result = await response.json();
+        const data = result.data || result;
+
+        if (result.status === 'success') {
+            alert(`套利开仓成功！两边成交间隔 ${data.inter_leg_latency_ms.toFixed(1)} 毫秒`);
+        } else if (result.status === 'partial' || result.status === 'unknown') {
+            const failed = Object.entries(data.legs).filter(([, leg]) => leg.status !== 'success');
+            const warning = result.status === 'partial' ? '只有一边成交，请立即检查单边持仓！' : '下单超时，成交情况未知，请立即检查持仓！';
+            alert(`警告：${warning}\n` +
+                failed.map(([exchange, leg]) => `${exchange}: ${leg.message}`).join('\n'));
+        } else {
+            alert('套利开仓失败：' + result.message);
+        }
+        await Promise.all([refreshPositions(), refreshBalances()]);
+    } catch (error) {
+        console.error('套利开仓失败:', error);
+        alert('套利开仓失败：' + error.message);
+    } finally {
+        if (button) button.disabled = false;
+    }
+}
+
 // 平仓功能
 async function closePosition(exchange, symbol, positionSize) {
     try {
@@ -877,41 +1019,29 @@ async function closeAllPositions() {
     }
     
     try {
-        const promises = [];
-        
-        // 获取当前持仓
-        const [bnPositionsResponse, hlPositionsResponse] = await Promise.all([
-            fetch('/api/binance/position/all'),
-            fetch('/api/hyperliquid/position/all')
-        ]);
-        
-        const [bnPositions, hlPositions] = await Promise.all([
-            bnPositionsResponse.json(),
-            hlPositionsResponse.json()
-        ]);
-        
-        // 处理币安持仓
-        if (bnPositions.status === 'success' && bnPositions.data.length > 0) {
-            bnPositions.data.forEach(pos => {
-                if (parseFloat(pos.positionAmt) !== 0) {
-                    promises.push(closePosition('binance', pos.symbol, parseFloat(pos.positionAmt)));
-                }
-            });
-        }
-        
-        // 处理Hyperliquid持仓
-        if (hlPositions.status === 'success' && hlPositions.data.length > 0) {
-            hlPositions.data.forEach(pos => {
-                if (parseFloat(pos.positionAmt) !== 0) {
-                    promises.push(closePosition('hyperliquid', pos.symbol, parseFloat(pos.positionAmt)));
-                }
-            });
+        // 服务端按持仓快照批量下单，两个交易所同时平仓
+        const response = await fetch('/api/position/close_all', { method: 'POST' });
+        const result = await response.json();
+        if (result.status !== 'success') {
+            throw new Error(result.message);
         }
         
-        // 等待所有平仓操作完成
-        await Promise.all(promises);
+        const failures = [];
+        Object.entries(result.data).forEach(([exchange, venueResult]) => {
+            if (venueResult.status !== 'success') {
+                failures.push(`${exchange}: ${venueResult.message}`);
+                return;
+            }
+            venueResult.data
+                .filter(item => item.status !== 'success')
+                .forEach(item => failures.push(`${exchange} ${item.symbol}: ${item.message}`));
+        });
         
-        alert('所有持仓已平仓成功！');
+        if (failures.length > 0) {
+            alert('部分持仓平仓失败：\n' + failures.join('\n'));
+        } else {
+            alert('所有持仓已平仓成功！');
+        }
         await refreshPositions(); // 刷新持仓信息
     } catch (error) {
         console.error('一键平仓失败:', error);
@@ -942,8 +1072,10 @@ document.addEventListener('DOMContentLoaded', async function() {
             refreshFundingRates()
         ]);
         
-        // 设置定时刷新
-        setInterval(refreshFundingRates, 30000);  // 每30秒刷新一次资金费率
+        // 资金费率优先使用服务端推送，不支持时每30秒轮询一次
+        if (!subscribeFundingRates()) {
+            setInterval(refreshFundingRates, 30000);
+        }
         setInterval(async () => {
             await Promise.all([
                 refreshBalances(),
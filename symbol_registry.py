@@ -0,0 +1,165 @@
+import re
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# 币安用数字前缀表示合约乘数，如 1000PEPE、1000000MOG、1MBABYDOGE
+BINANCE_SCALE_PATTERN = re.compile(r'^(1000000|100000|10000|1000|100)([A-Z].*)$')
+BINANCE_MILLION_PATTERN = re.compile(r'^1M([A-Z].*)$')
+# Hyperliquid用小写k前缀表示1000倍，如 kPEPE、kSHIB
+HYPERLIQUID_SCALE_PATTERN = re.compile(r'^k([A-Z0-9]+)$')
+
+
+class Instrument(NamedTuple):
+    """跨交易所的统一交易对"""
+    canonical: str                        # 统一编号，如 'PEPE'
+    binance_symbol: Optional[str]         # 币安交易对，如 '1000PEPEUSDT'
+    binance_multiplier: int               # 币安一个合约单位对应的币数量
+    hl_coin: Optional[str]                # Hyperliquid币种，如 'kPEPE'
+    hl_multiplier: int                    # Hyperliquid一个合约单位对应的币数量
+    hl_market: Optional[str]              # ccxt交易对，如 'KPEPE/USDC:USDC'
+
+
+def split_binance_base(base_asset: str) -> Tuple[str, int]:
+    """拆分币安的基础资产为 (统一名称, 乘数)"""
+    match = BINANCE_SCALE_PATTERN.match(base_asset)
+    if match:
+        return match.group(2), int(match.group(1))
+    match = BINANCE_MILLION_PATTERN.match(base_asset)
+    if match:
+        return match.group(1), 1000000
+    return base_asset, 1
+
+
+def split_hyperliquid_coin(coin: str) -> Tuple[str, int]:
+    """拆分Hyperliquid的币种为 (统一名称, 乘数)"""
+    match = HYPERLIQUID_SCALE_PATTERN.match(coin)
+    if match:
+        return match.group(1), 1000
+    return coin.upper(), 1
+
+
+def legacy_base(symbol: str) -> str:
+    """注册表中找不到时按原有规则从各种格式中提取基础币种"""
+    base = symbol.split('/')[0] if '/' in symbol else symbol
+    base = base.split(':')[0] if ':' in base else base
+    return base[:-4] if base.endswith('USDT') else base
+
+
+class SymbolRegistry:
+    """币安和Hyperliquid的统一交易对注册表
+
+    每次交易对元数据刷新时重建一次，把各交易所的原生名称（以及页面、接口中使用的
+    各种写法）映射到统一编号，之后的查询都是一次字典查找。
+    """
+
+    def __init__(self):
+        self.instruments: Dict[str, Instrument] = {}
+        self.aliases: Dict[str, str] = {}
+        self._binance: Dict[str, str] = {}       # 币安交易对 -> 基础资产
+        self._hyperliquid: Dict[str, str] = {}   # Hyperliquid币种 -> ccxt交易对
+        self._lock = threading.Lock()
+
+    def update_binance(self, instruments: Dict[str, Dict]):
+        """用币安交易对元数据（InstrumentCache的内容）重建注册表"""
+        binance = {
+            symbol: info['baseAsset']
+            for symbol, info in instruments.items()
+            if info.get('quoteAsset') == 'USDT' and info.get('contractType') in (None, 'PERPETUAL')
+            and info.get('baseAsset')
+        }
+        with self._lock:
+            self._binance = binance
+            self._rebuild()
+
+    def update_hyperliquid(self, coins: Iterable[str]):
+        """用Hyperliquid币种列表重建注册表"""
+        with self._lock:
+            self._hyperliquid = {coin: self._hyperliquid.get(coin) for coin in coins}
+            self._rebuild()
+
+    def update_hyperliquid_markets(self, markets: Dict[str, Dict]):
+        """用ccxt市场信息（HyperliquidMarketIndex的内容）重建注册表"""
+        hyperliquid = {
+            market.get('baseName') or market['base']: symbol
+            for symbol, market in markets.items()
+        }
+        with self._lock:
+            self._hyperliquid = hyperliquid
+            self._rebuild()
+
+    def _rebuild(self):
+        entries: Dict[str, Dict] = {}
+        for symbol, base_asset in self._binance.items():
+            canonical, multiplier = split_binance_base(base_asset)
+            entry = entries.setdefault(canonical, {})
+            # 同一币种同时存在不带乘数的合约时优先使用
+            if 'binance_symbol' not in entry or multiplier == 1:
+                entry['binance_symbol'] = symbol
+                entry['binance_multiplier'] = multiplier
+        for coin, market in self._hyperliquid.items():
+            canonical, multiplier = split_hyperliquid_coin(coin)
+            entry = entries.setdefault(canonical, {})
+            if 'hl_coin' not in entry or multiplier == 1:
+                entry['hl_coin'] = coin
+                entry['hl_multiplier'] = multiplier
+                entry['hl_market'] = market
+
+        instruments = {}
+        aliases = {}
+        for canonical, entry in entries.items():
+            instrument = Instrument(
+                canonical=canonical,
+                binance_symbol=entry.get('binance_symbol'),
+                binance_multiplier=entry.get('binance_multiplier', 1),
+                hl_coin=entry.get('hl_coin'),
+                hl_multiplier=entry.get('hl_multiplier', 1),
+                hl_market=entry.get('hl_market')
+            )
+            instruments[canonical] = instrument
+            names = [canonical, f"{canonical}USDT"]
+            if instrument.binance_symbol:
+                names += [instrument.binance_symbol, instrument.binance_symbol[:-4]]
+            if instrument.hl_coin:
+                names += [instrument.hl_coin, f"{instrument.hl_coin}USDT", f"{instrument.hl_coin}/USDC:USDC"]
+            if instrument.hl_market:
+                names.append(instrument.hl_market)
+            for name in names:
+                aliases.setdefault(name, canonical)
+
+        # 整体替换，读取方不需要加锁
+        self.instruments = instruments
+        self.aliases = aliases
+
+    def is_ready(self) -> bool:
+        """两个交易所的元数据都已加载"""
+        return bool(self._binance) and bool(self._hyperliquid)
+
+    def get(self, symbol: str) -> Optional[Instrument]:
+        """按任意写法查找统一交易对"""
+        canonical = self.aliases.get(symbol)
+        if canonical is None:
+            canonical = self.aliases.get(legacy_base(symbol))
+        return self.instruments.get(canonical) if canonical else None
+
+    def canonical(self, symbol: str) -> str:
+        """获取统一编号，找不到时按原有规则提取基础币种"""
+        instrument = self.get(symbol)
+        return instrument.canonical if instrument else legacy_base(symbol)
+
+    def binance_symbol(self, symbol: str) -> str:
+        """获取币安交易对名称，如 'PEPE' -> '1000PEPEUSDT'"""
+        instrument = self.get(symbol)
+        if instrument and instrument.binance_symbol:
+            return instrument.binance_symbol
+        return f"{legacy_base(symbol)}USDT"
+
+    def hl_coin(self, symbol: str) -> str:
+        """获取Hyperliquid币种名称，如 '1000PEPEUSDT' -> 'kPEPE'"""
+        instrument = self.get(symbol)
+        if instrument and instrument.hl_coin:
+            return instrument.hl_coin
+        return legacy_base(symbol)
+
+    def shared(self) -> List[Instrument]:
+        """两个交易所都上线的交易对"""
+        return [i for i in self.instruments.values() if i.binance_symbol and i.hl_coin]
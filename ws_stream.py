@@ -0,0 +1,141 @@
+import json
+import threading
+import time
+from typing import Optional
+
+import websocket
+
+from logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+
+class WebSocketStream:
+    """带自动重连的WebSocket后台订阅基类
+
+    子类实现 on_message 处理推送数据，按需实现 on_connected 在每次(重)连接后
+    发送订阅请求或通过REST重新同步状态。
+    """
+
+    def __init__(self, url: str, name: str = "ws", stale_after: float = 10.0,
+                 ping_interval: float = 20.0, max_backoff: float = 30.0):
+        """
+        Args:
+            url: WebSocket地址
+            name: 日志中显示的名称
+            stale_after: 超过该秒数没有收到消息则认为数据已过期
+            ping_interval: 心跳间隔（秒）
+            max_backoff: 重连最大等待时间（秒）
+        """
+        self.url = url
+        self.name = name
+        self.stale_after = stale_after
+        self.ping_interval = ping_interval
+        self.max_backoff = max_backoff
+
+        self.last_message_time = 0.0
+        self.connected = False
+        self._ws: Optional[websocket.WebSocketApp] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        """在后台线程中启动订阅"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run_forever, name=f"{self.name}-stream", daemon=True)
+        self._thread.start()
+        threading.Thread(target=self._watchdog, name=f"{self.name}-watchdog", daemon=True).start()
+
+    def stop(self):
+        """停止订阅并关闭连接"""
+        self._stop_event.set()
+        if self._ws:
+            try:
+                self._ws.close()
+            except Exception:
+                pass
+
+    def is_fresh(self) -> bool:
+        """连接正常且最近收到过消息"""
+        return self.connected and (time.time() - self.last_message_time) < self.stale_after
+
+    def send_json(self, payload: dict):
+        """发送JSON消息"""
+        if self._ws:
+            self._ws.send(json.dumps(payload))
+
+    def connect_url(self) -> str:
+        """每次(重)连接前获取连接地址，子类可覆盖（如先申请listenKey）"""
+        return self.url
+
+    def on_connected(self):
+        """每次连接建立后调用，子类可覆盖"""
+
+    def on_message(self, message):
+        """处理解析后的消息，子类必须实现"""
+        raise NotImplementedError
+
+    def _run_forever(self):
+        backoff = 1.0
+        while not self._stop_event.is_set():
+            started = time.time()
+            try:
+                self._ws = websocket.WebSocketApp(
+                    self.connect_url(),
+                    on_open=self._handle_open,
+                    on_message=self._handle_message,
+                    on_error=self._handle_error,
+                    on_close=self._handle_close,
+                )
+                self._ws.run_forever(ping_interval=self.ping_interval, ping_timeout=self.ping_interval / 2)
+            except Exception as e:
+                logger.error("%s WebSocket运行出错: %s", self.name, e)
+            self.connected = False
+
+            if self._stop_event.is_set():
+                break
+
+            # 连接维持过一段时间则重置退避时间
+            if time.time() - started > 60:
+                backoff = 1.0
+            logger.warning("%s WebSocket连接断开，%.0f秒后重连...", self.name, backoff)
+            self._stop_event.wait(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def _watchdog(self):
+        """连接仍在但长时间没有消息时主动断开，触发重连和重新同步"""
+        while not self._stop_event.wait(self.stale_after):
+            if self.connected and not self.is_fresh():
+                logger.warning("%s 超过%.0f秒未收到消息，重新连接", self.name, self.stale_after)
+                try:
+                    self._ws.close()
+                except Exception:
+                    pass
+
+    def _handle_open(self, ws):
+        self.connected = True
+        self.last_message_time = time.time()
+        logger.info("%s WebSocket已连接: %s", self.name, self.url)
+        try:
+            self.on_connected()
+        except Exception as e:
+            logger.error("%s 连接后初始化失败: %s", self.name, e)
+
+    def _handle_message(self, ws, raw):
+        self.last_message_time = time.time()
+        try:
+            message = json.loads(raw)
+        except ValueError:
+            return
+        try:
+            self.on_message(message)
+        except Exception as e:
+            logger.error("%s 处理消息失败: %s", self.name, e)
+
+    def _handle_error(self, ws, error):
+        logger.error("%s WebSocket错误: %s", self.name, error)
+
+    def _handle_close(self, ws, status_code, reason):
+        self.connected = False